@@ -0,0 +1,466 @@
+"""
+Benchmark suite for the queue's hot paths.
+
+Run with:  python -m queuectl.bench [--scenarios enqueue claim e2e latency startup] [--json out.json]
+                                    [--baseline base.json --max-regression 10]
+
+Each scenario records named metrics. --json saves them with the machine and run
+parameters so a later run can be compared against it with --baseline.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from queuectl.core.storage import Storage
+from queuectl.core.sharding import ShardedStorage
+from queuectl.core.queue import Queue
+from queuectl.core.notify import notify_workers
+from queuectl.core.worker import Worker
+
+
+def bench_enqueue(storage: Storage, jobs: int) -> float:
+    q = Queue(storage)
+    start = time.perf_counter()
+    for i in range(jobs):
+        q.enqueue({"id": f"bench-{i}", "command": "true"})
+    return jobs / (time.perf_counter() - start)
+
+
+def bench_enqueue_bulk(storage: Storage, jobs: int, chunk_size: int = 1000) -> float:
+    q = Queue(storage)
+    start = time.perf_counter()
+    q.enqueue_many(({"id": f"bulk-{i}", "command": "true"} for i in range(jobs)), chunk_size=chunk_size)
+    return jobs / (time.perf_counter() - start)
+
+
+def bench_claim(storage: Storage, jobs: int) -> float:
+    claimed = 0
+    start = time.perf_counter()
+    while True:
+        job = storage.fetch_next_pending()
+        if not job:
+            break
+        job["state"] = "completed"
+        storage.update_job(job)
+        claimed += 1
+    return claimed / (time.perf_counter() - start)
+
+
+def seed_history(storage: Storage, rows: int, state: str = "completed", prefix: str = "hist") -> None:
+    """Insert `rows` jobs directly, standing in for a long-lived database."""
+    now = datetime.utcnow().isoformat()
+    with storage._write() as conn:
+        conn.executemany("""
+            INSERT INTO jobs (id, command, state, attempts, max_retries, created_at, updated_at, priority)
+            VALUES (?, 'true', ?, 0, 3, ?, ?, ?)
+        """, ((f"{prefix}-{i}", state, now, now, i % 20) for i in range(rows)))
+
+
+def bench_claim_latency(storage: Storage, claims: int = 200) -> Dict[str, float]:
+    """Milliseconds per claim (mean, p50, p99) for `claims` claims on top of existing rows.
+
+    Enqueues `claims` ready jobs first, so there is always work even without a backlog.
+    """
+    q = Queue(storage)
+    for i in range(claims):
+        q.enqueue({"id": f"ready-{i}", "command": "true"})
+    samples = []
+    for _ in range(claims):
+        start = time.perf_counter()
+        storage.fetch_next_pending()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"mean": statistics.fmean(samples), "p50": percentile(samples, 50),
+            "p99": percentile(samples, 99)}
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def _bench_worker(db_path, stop_event, wakeup_dir, poll_min, poll_max, worker_id=1):
+    Worker(Storage(db_path), worker_id, stop_event, base_backoff=2, max_backoff=10, max_retries=1,
+           wakeup_dir=wakeup_dir, idle_poll_min=poll_min, idle_poll_max=poll_max).run()
+
+
+def _wait_for(predicate, timeout: float, what: str, interval: float = 0.005) -> None:
+    """Poll predicate until it is true; TimeoutError after timeout seconds fails the scenario."""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{what} not done after {timeout:g}s")
+        time.sleep(interval)
+
+
+def _stop_workers(stop, wake_dir: Optional[str], procs) -> None:
+    stop.set()
+    notify_workers(wake_dir)
+    for p in procs:
+        p.join(timeout=10)
+        if p.is_alive():
+            p.kill()
+
+
+def _cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_wakeup(tmp: str, wakeup: bool, poll_min: float, poll_max: float,
+                 samples: int = 20, idle_seconds: float = 5.0, timeout: float = 60.0) -> Dict[str, float]:
+    """Enqueue-to-start latency (p50/p99/max ms) and idle worker CPU (%) for one worker process.
+
+    idle_seconds=0 skips the CPU measurement. A job that has not run after timeout
+    seconds raises TimeoutError.
+    """
+    db_path = os.path.join(tmp, f"wake-{wakeup}.db")
+    wake_dir = os.path.join(tmp, f"wake-{wakeup}") if wakeup else None
+    storage = Storage(db_path)
+    q = Queue(storage, wake_dir)
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    proc = ctx.Process(target=_bench_worker, args=(db_path, stop, wake_dir, poll_min, poll_max))
+    proc.start()
+    time.sleep(1.5)  # let the worker start and go idle
+
+    latencies = []
+    idle_cpu = 0.0
+    try:
+        for i in range(samples):
+            time.sleep(random.uniform(0.2, 0.6))
+            enqueued = time.time()
+            q.enqueue({"id": f"lat-{i}", "command": "date +%s.%N"})
+            _wait_for(lambda: storage.get_job_logs(f"lat-{i}"), timeout, f"latency job lat-{i}")
+            started = float(storage.get_job_logs(f"lat-{i}")[0]["stdout"])
+            latencies.append((started - enqueued) * 1000)
+
+        if idle_seconds:
+            cpu_before = _cpu_seconds(proc.pid)
+            time.sleep(idle_seconds)
+            idle_cpu = (_cpu_seconds(proc.pid) - cpu_before) / idle_seconds * 100
+    finally:
+        _stop_workers(stop, wake_dir, [proc])
+    return {"p50": percentile(latencies, 50), "p99": percentile(latencies, 99),
+            "max": max(latencies), "idle_cpu": idle_cpu}
+
+
+def bench_e2e(tmp: str, workers: int, jobs: int, command: str, timeout: float = 300.0) -> float:
+    """Jobs/s from bulk enqueue until `workers` idle worker processes finish them all.
+
+    A job finishes by completing or by going to the DLQ (a failing command must not
+    hang the run); unfinished jobs after timeout seconds raise TimeoutError.
+    """
+    db_path = os.path.join(tmp, "e2e.db")
+    wake_dir = os.path.join(tmp, "e2e.wakeup")
+    storage = Storage(db_path)
+    ctx = multiprocessing.get_context("spawn")
+    stop = ctx.Event()
+    procs = [ctx.Process(target=_bench_worker, args=(db_path, stop, wake_dir, 0.05, 0.5, i + 1))
+             for i in range(workers)]
+    for p in procs:
+        p.start()
+    time.sleep(1.5)  # let the workers start and go idle
+
+    def finished() -> bool:
+        counts = storage.count_by_state()
+        return counts.get("completed", 0) + counts.get("dead", 0) >= jobs
+
+    try:
+        start = time.perf_counter()
+        Queue(storage, wake_dir).enqueue_many({"command": command} for _ in range(jobs))
+        _wait_for(finished, timeout, f"e2e run of {jobs} x {command!r}")
+        elapsed = time.perf_counter() - start
+    finally:
+        _stop_workers(stop, wake_dir, procs)
+    dead = storage.count_by_state().get("dead", 0)
+    if dead:
+        print(f"e2e: {dead} of {jobs} {command!r} jobs went to the DLQ", file=sys.stderr)
+    return jobs / elapsed
+
+
+def _bench_shard_writer(db_path, shards, index, jobs, start_event):
+    # Long busy timeout: measure throughput under contention, not lock-wait failures.
+    storage = ShardedStorage(db_path, shards, home=index, busy_timeout=60000)
+    q = Queue(storage)
+    start_event.wait()
+    for i in range(jobs):
+        q.enqueue({"id": f"w{index}-{i}", "command": "true"})
+    while True:
+        job = storage.fetch_next_pending(f"bench-{index}")
+        if not job:
+            break
+        job["state"] = "completed"
+        storage.update_job(job)
+
+
+def bench_shards(tmp: str, shards: int, procs: int, jobs: int) -> float:
+    """Aggregate enqueue+claim+complete jobs/s from `procs` processes over `shards` files."""
+    db_path = os.path.join(tmp, "shards.db")
+    ShardedStorage(db_path, shards).close()  # create schemas before the clock starts
+    ctx = multiprocessing.get_context("spawn")
+    start_event = ctx.Event()
+    workers = [ctx.Process(target=_bench_shard_writer, args=(db_path, shards, i, jobs, start_event))
+               for i in range(procs)]
+    for p in workers:
+        p.start()
+    time.sleep(1.0)  # let every process import and connect
+    start = time.perf_counter()
+    start_event.set()
+    for p in workers:
+        p.join()
+    return procs * jobs / (time.perf_counter() - start)
+
+
+def bench_startup(tmp: str, argv: List[str], runs: int, client: bool = False) -> Dict[str, float]:
+    """Wall-clock ms (p50, max) of `runs` fresh `python -m queuectl.cli` invocations.
+
+    With client=True, a supervisor with no workers is started first and the commands
+    are forwarded to it.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, QUEUECTL_DB=os.path.join(tmp, "startup.db"),
+               PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    env["QUEUECTL_CLIENT"] = "true" if client else "false"
+    cli = [sys.executable, "-m", "queuectl.cli"]
+    Storage(env["QUEUECTL_DB"]).close()  # timing an existing database, not its creation
+    supervisor = None
+    if client:
+        supervisor = subprocess.Popen(cli + ["worker", "start", "--count", "0"], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        sock = env["QUEUECTL_DB"] + ".supervisor.sock"
+        deadline = time.time() + 10
+        while not os.path.exists(sock) and time.time() < deadline:
+            time.sleep(0.05)
+    timings = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(cli + argv, env=env, stdout=subprocess.DEVNULL, check=True)
+            timings.append((time.perf_counter() - start) * 1000)
+    finally:
+        if supervisor:
+            subprocess.run(cli + ["worker", "stop"], env=env, stdout=subprocess.DEVNULL)
+            supervisor.wait(timeout=10)
+    return {"p50": percentile(timings, 50), "max": max(timings)}
+
+
+class Results:
+    """Named metrics of one run, printed as they are recorded."""
+
+    def __init__(self):
+        self.metrics: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, name: str, value: float, unit: str, higher_is_better: bool = True) -> None:
+        self.metrics[name] = {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+        print(f"{name}: {value:,.3f} {unit}")
+
+
+def scenario_enqueue(args, results: Results) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        results.record("enqueue.single", bench_enqueue(Storage(os.path.join(tmp, "a.db")), args.jobs), "jobs/s")
+    with tempfile.TemporaryDirectory() as tmp:
+        results.record("enqueue.bulk", bench_enqueue_bulk(Storage(os.path.join(tmp, "b.db")), args.jobs * 10),
+                       "jobs/s")
+
+
+def scenario_claim(args, results: Results) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "bench.db"))
+        bench_enqueue(storage, args.jobs)
+        results.record("claim.complete", bench_claim(storage, args.jobs), "jobs/s")
+    tables = [("completed", rows) for rows in args.history] + [("pending", rows) for rows in args.pending if rows]
+    for state, rows in tables:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = Storage(os.path.join(tmp, "bench.db"))
+            seed_history(storage, rows, state)
+            latency = bench_claim_latency(storage)
+        for stat in ("p50", "p99"):
+            results.record(f"claim.latency.{state}_{rows}.{stat}", latency[stat], "ms", higher_is_better=False)
+
+
+def scenario_e2e(args, results: Results) -> None:
+    for command in args.commands:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as tmp:
+                rate = bench_e2e(tmp, workers, args.e2e_jobs, command, args.timeout)
+            results.record(f"e2e.{command.replace(' ', '_')}.workers_{workers}", rate, "jobs/s")
+
+
+def scenario_latency(args, results: Results) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        latency = bench_wakeup(tmp, True, 0.05, 2.0, samples=args.samples, idle_seconds=0,
+                               timeout=args.timeout)
+    for stat in ("p50", "p99"):
+        results.record(f"latency.enqueue_to_start.{stat}", latency[stat], "ms", higher_is_better=False)
+
+
+def scenario_wakeup(args, results: Results) -> None:
+    modes = [
+        ("fixed_200ms_poll", False, 0.2, 0.2),
+        ("adaptive_poll", False, 0.05, 2.0),
+        ("socket_wakeup", True, 0.05, 2.0),
+    ]
+    for label, wakeup, poll_min, poll_max in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            stats = bench_wakeup(tmp, wakeup, poll_min, poll_max, timeout=args.timeout)
+        results.record(f"wakeup.{label}.p50", stats["p50"], "ms", higher_is_better=False)
+        results.record(f"wakeup.{label}.max", stats["max"], "ms", higher_is_better=False)
+        results.record(f"wakeup.{label}.idle_cpu", stats["idle_cpu"], "%", higher_is_better=False)
+
+
+def scenario_shards(args, results: Results) -> None:
+    for shards in args.shards or [1, 2, 4]:
+        with tempfile.TemporaryDirectory() as tmp:
+            rate = bench_shards(tmp, shards, args.procs, args.jobs // args.procs)
+        results.record(f"shards.{shards}.procs_{args.procs}", rate, "jobs/s")
+
+
+def scenario_startup(args, results: Results) -> None:
+    commands = [("status", ["status"]), ("enqueue", ["enqueue", '{"command": "true"}']),
+                ("list", ["list", "--limit", "1", "--format", "ndjson"])]
+    for client in (False, True):
+        for name, argv in commands:
+            with tempfile.TemporaryDirectory() as tmp:
+                stats = bench_startup(tmp, argv, args.startup_runs, client=client)
+            label = f"startup.{'client' if client else 'local'}.{name}.p50"
+            results.record(label, stats["p50"], "ms", higher_is_better=False)
+
+
+SCENARIOS = {
+    "enqueue": scenario_enqueue,
+    "claim": scenario_claim,
+    "e2e": scenario_e2e,
+    "latency": scenario_latency,
+    "wakeup": scenario_wakeup,
+    "shards": scenario_shards,
+    "startup": scenario_startup,
+}
+DEFAULT_SCENARIOS = ["enqueue", "claim", "e2e", "latency"]
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_metadata(args) -> Dict[str, Any]:
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+    }
+
+
+def compare(metrics: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            max_regression: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Per-metric change against a baseline run's metrics, in percent.
+
+    change is signed so that positive is always an improvement, whichever direction the
+    metric prefers; `regressed` is set when it is worse than -max_regression percent.
+    """
+    rows = []
+    for name, metric in metrics.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            continue
+        change = (metric["value"] - base["value"]) / base["value"] * 100
+        if not metric["higher_is_better"]:
+            change = -change
+        rows.append({
+            "name": name, "baseline": base["value"], "value": metric["value"], "unit": metric["unit"],
+            "change": change,
+            "regressed": max_regression is not None and change < -max_regression,
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="queuectl.bench")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=None,
+                        help=f"Scenarios to run (default: {' '.join(DEFAULT_SCENARIOS)}).")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--wakeup", action="store_true",
+                        help="Also run the wakeup scenario (polling modes and idle worker CPU).")
+    parser.add_argument("--history", type=int, nargs="*", default=[0, 10000, 100000],
+                        help="Completed-job history sizes for the claim latency run.")
+    parser.add_argument("--pending", type=int, nargs="*", default=[100000],
+                        help="Pending backlog sizes for the claim latency run.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="Worker process counts for the e2e scenario.")
+    parser.add_argument("--e2e-jobs", type=int, default=500, help="Jobs per e2e run.")
+    parser.add_argument("--commands", nargs="+", default=["true", "sleep 0"],
+                        help="Job commands for the e2e scenario.")
+    parser.add_argument("--samples", type=int, default=50, help="Jobs timed by the latency scenario.")
+    parser.add_argument("--shards", type=int, nargs="*", default=[],
+                        help="Shard counts to compare for concurrent write throughput.")
+    parser.add_argument("--procs", type=int, default=8,
+                        help="Writer processes for the --shards run.")
+    parser.add_argument("--startup-runs", type=int, default=20,
+                        help="CLI invocations timed per command by the startup scenario.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for randomized enqueue spacing.")
+    parser.add_argument("--timeout", type=float, default=300.0,
+                        help="Seconds a scenario waits for its jobs before it fails.")
+    parser.add_argument("--json", metavar="PATH", help="Save results as JSON.")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved --json run.")
+    parser.add_argument("--max-regression", type=float, default=None, metavar="PCT",
+                        help="With --baseline, exit 1 if any metric is this many percent worse.")
+    args = parser.parse_args(argv)
+
+    scenarios = list(args.scenarios or DEFAULT_SCENARIOS)
+    if args.wakeup and "wakeup" not in scenarios:
+        scenarios.append("wakeup")
+    if args.shards and "shards" not in scenarios:
+        scenarios.append("shards")
+
+    random.seed(args.seed)
+    meta = run_metadata(args)
+    results = Results()
+    failed = []
+    for name in scenarios:
+        try:
+            SCENARIOS[name](args, results)
+        except TimeoutError as e:
+            print(f"{name}: FAILED: {e}", file=sys.stderr)
+            failed.append(name)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "metrics": results.metrics}, f, indent=2)
+    if not args.baseline:
+        return 1 if failed else 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)["metrics"]
+    rows = compare(results.metrics, baseline, args.max_regression)
+    print(f"\nvs {args.baseline}:")
+    for row in rows:
+        flag = "  REGRESSION" if row["regressed"] else ""
+        print(f"  {row['name']}: {row['baseline']:,.3f} -> {row['value']:,.3f} {row['unit']} "
+              f"({row['change']:+.1f}%){flag}")
+    return 1 if failed or any(row["regressed"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,46 @@
 import argparse
 import json
+import os
 import sys
 import time
-import multiprocessing
 from queuectl.config.settings import Settings
-from queuectl.core.storage import Storage
-from queuectl.core.queue import Queue
-from queuectl.dlq.store import DLQStore
-from queuectl.core.worker import Worker
+from queuectl.core.supervisor import SupervisorError, control_request, read_pidfile
 
-def worker_target(stop_event, worker_id):
+# Anything heavier is imported by the commands that use it: cron jobs and scripts run
+# one-shot commands thousands of times an hour and shouldn't load the worker,
+# multiprocessing or SQLite to talk to a supervisor.
+
+def open_storage(settings, home=0, readonly=False):
+    from queuectl.core.storage import Storage
+    from queuectl.core.sharding import ShardedStorage
+    pragmas = {
+        "synchronous": settings.get("SQLITE_SYNCHRONOUS"),
+        "busy_timeout": settings.get("SQLITE_BUSY_TIMEOUT"),
+        "cache_size": settings.get("SQLITE_CACHE_SIZE"),
+        "mmap_size": settings.get("SQLITE_MMAP_SIZE"),
+        "readonly": readonly,
+    }
+    if settings.get("SHARDS") > 1:
+        return ShardedStorage(settings.get("DB_PATH"), settings.get("SHARDS"), home=home, **pragmas)
+    return Storage(settings.get("DB_PATH"), **pragmas)
+
+def wakeup_dir(settings):
+    return settings.get("WAKEUP_DIR") or f"{settings.get('DB_PATH')}.wakeup"
+
+def metrics_dir(settings):
+    return settings.get("METRICS_DIR") or f"{settings.get('DB_PATH')}.metrics"
+
+def parse_queues(value):
+    return [name.strip() for name in (value or "").split(",") if name.strip()] or None
+
+def worker_target(stop_event, worker_id, batch_size, concurrency, queues=None, profile=None):
+    import signal
+    from queuectl.core.worker import Worker
+    # Ctrl+C reaches the whole process group; the supervisor turns it into a drain.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
     settings = Settings()
-    storage = Storage(settings.get("DB_PATH"))
+    # Spread workers' home shards so each mostly claims from its own file.
+    storage = open_storage(settings, home=worker_id - 1)
     w = Worker(
         storage=storage,
         worker_id=worker_id,
@@ -19,57 +48,515 @@ def worker_target(stop_event, worker_id):
         base_backoff=settings.get("BACKOFF_BASE"),
         max_backoff=settings.get("BACKOFF_MAX"),
         max_retries=settings.get("MAX_RETRIES"),
+        batch_size=batch_size,
+        wakeup_dir=wakeup_dir(settings),
+        idle_poll_max=settings.get("IDLE_POLL_MAX"),
+        concurrency=concurrency,
+        log_max_bytes=settings.get("LOG_MAX_BYTES"),
+        log_compress=settings.get("LOG_COMPRESS"),
+        log_dir=settings.get("LOG_DIR") or None,
+        lease_seconds=settings.get("LEASE_SECONDS"),
+        reap_interval=settings.get("REAP_INTERVAL"),
+        python_max_tasks=settings.get("PYTHON_MAX_TASKS"),
+        python_max_memory_mb=settings.get("PYTHON_MAX_MEMORY_MB"),
+        python_preload=[m.strip() for m in settings.get("PYTHON_PRELOAD").split(",") if m.strip()],
+        queues=queues,
+        result_cache_max_bytes=settings.get("RESULT_CACHE_MAX_BYTES"),
+        completion_window=settings.get("COMPLETION_WINDOW_MS") / 1000.0,
+        completion_batch=settings.get("COMPLETION_BATCH"),
+        metrics_dir=metrics_dir(settings) if settings.get("METRICS_INTERVAL") > 0 else None,
+        metrics_interval=settings.get("METRICS_INTERVAL"),
     )
-    w.run()
+    if profile:
+        run_profiled(w, worker_id, *profile)
+    else:
+        w.run()
+
+def run_profiled(worker, worker_id, mode, directory):
+    """Run one worker under cProfile (dispatcher thread only) or the stack sampler (all threads)."""
+    os.makedirs(directory, exist_ok=True)
+    if mode == "cprofile":
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.runcall(worker.run)
+        finally:
+            path = os.path.join(directory, f"worker-{worker_id}.prof")
+            profiler.dump_stats(path)
+            print(f"Worker {worker_id}: profile written to {path} (view with python -m pstats)")
+    else:
+        from queuectl.core.telemetry import StackSampler
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            worker.run()
+        finally:
+            sampler.stop()
+            path = os.path.join(directory, f"worker-{worker_id}.folded")
+            sampler.write(path)
+            print(f"Worker {worker_id}: sampled stacks written to {path} (collapsed format, for flame graphs)")
+
+def make_janitor(settings, storage, **overrides):
+    from queuectl.core.janitor import Janitor
+    options = {
+        "completed_days": settings.get("RETENTION_COMPLETED_DAYS"),
+        "keep_completed": settings.get("RETENTION_MAX_COMPLETED"),
+        "dlq_days": settings.get("RETENTION_DLQ_DAYS"),
+        "throughput_days": settings.get("RETENTION_THROUGHPUT_DAYS"),
+        "archive_dir": settings.get("ARCHIVE_DIR") or None,
+        "batch_size": settings.get("GC_BATCH_SIZE"),
+    }
+    options.update({k: v for k, v in overrides.items() if v is not None})
+    return Janitor(storage, **options)
+
+def supervisor_paths(settings):
+    db = settings.get("DB_PATH")
+    return (settings.get("SUPERVISOR_PIDFILE") or f"{db}.supervisor.pid",
+            settings.get("SUPERVISOR_SOCKET") or f"{db}.supervisor.sock")
+
+class ThreadCapture:
+    """Stand-in for sys.stdout/sys.stderr that lets one thread capture what it prints.
 
-def run_workers(count):
+    Output goes to the wrapped stream unless the printing thread is inside capture(),
+    so a client's command gets only its own output while the janitor, crash recovery
+    and other client threads keep printing to the supervisor's log.
+    """
+
+    def __init__(self, stream):
+        import threading
+        self.stream = stream
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "buffer", None) or self.stream
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def capture(self):
+        import contextlib
+        import io
+
+        @contextlib.contextmanager
+        def capturing():
+            self._local.buffer = io.StringIO()
+            try:
+                yield self._local.buffer
+            finally:
+                self._local.buffer = None
+        return capturing()
+
+def run_workers(count, batch_size, concurrency=1, queues=None, profile=None,
+                min_workers=None, max_workers=None):
+    import multiprocessing
+    import threading
+    from queuectl.core import telemetry
+    from queuectl.core.supervisor import Supervisor
     multiprocessing.set_start_method('spawn', force=True)
-    stop_events = [multiprocessing.Event() for _ in range(count)]
-    workers = []
-    ctx = multiprocessing.get_context("spawn")
-    for i in range(count):
-        p = ctx.Process(target=worker_target, args=(stop_events[i], i + 1))
-        p.start()
-        workers.append(p)
-        print(f"Worker {i+1} started (PID {p.pid})")
-    print("Workers started. Press Ctrl+C to stop.")
+    settings = Settings()
+    # Client commands capture their output per thread (see run_cli). Installed before
+    # any thread starts; a per-command redirect would be process-wide and take in
+    # what the janitor or crash recovery print meanwhile.
+    sys.stdout, sys.stderr = ThreadCapture(sys.stdout), ThreadCapture(sys.stderr)
+    # Snapshots left by an earlier run would be counted again.
+    telemetry.clear_snapshots(metrics_dir(settings))
+    if settings.get("METRICS_PORT"):
+        telemetry.serve(settings.get("METRICS_HOST"), settings.get("METRICS_PORT"), metrics_dir(settings),
+                        lambda: open_storage(settings))
+        print(f"Metrics on http://{settings.get('METRICS_HOST')}:{settings.get('METRICS_PORT')}/metrics")
+    textfile = settings.get("METRICS_TEXTFILE")
+    storage = open_storage(settings)
+    janitor_stop = threading.Event()
+    if settings.get("GC_INTERVAL"):
+        janitor = make_janitor(settings, open_storage(settings))
+        threading.Thread(target=janitor.run_forever, args=(janitor_stop, settings.get("GC_INTERVAL")),
+                         name="janitor", daemon=True).start()
+        print(f"Janitor running every {settings.get('GC_INTERVAL')}s")
+
+    next_textfile = [0.0]
+
+    def tick():
+        if textfile and time.monotonic() >= next_textfile[0]:
+            next_textfile[0] = time.monotonic() + settings.get("METRICS_INTERVAL")
+            telemetry.write_textfile(textfile, telemetry.render(metrics_dir(settings), storage))
+
+    def recover_jobs(slot, pid):
+        # Expire the dead worker's leases now rather than waiting out LEASE_SECONDS.
+        storage.renew_leases(f"worker-{slot}@{pid}", 0)
+        reclaimed = storage.reclaim_expired(settings.get("MAX_RETRIES"))
+        if reclaimed["requeued"] or reclaimed["dead"]:
+            print(f"Worker {slot}: {reclaimed['requeued']} of its jobs re-queued, "
+                  f"{reclaimed['dead']} moved to DLQ", flush=True)
+
+    def run_cli(request):
+        # Client mode (see forward_command): run the command here, on this process's
+        # open storage, and hand back what it printed.
+        code = 0
+        with sys.stdout.capture() as out, sys.stderr.capture() as err:
+            try:
+                main(list(request["argv"]), storage=storage)
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                code = e.code if isinstance(e.code, int) else int(e.code is not None)
+        return {"ok": True, "stdout": out.getvalue(), "stderr": err.getvalue(), "code": code}
+
+    pidfile, control_socket = supervisor_paths(settings)
+    supervisor = Supervisor(
+        worker_target,
+        # Profiling is for a single worker: the first.
+        lambda slot: (batch_size, concurrency, queues, profile if slot == 1 else None),
+        count, pidfile, control_socket, wakeup_dir=wakeup_dir(settings),
+        min_workers=min_workers, max_workers=max_workers, storage=storage,
+        metrics_dir=metrics_dir(settings) if settings.get("METRICS_INTERVAL") > 0 else None,
+        target_pending=settings.get("AUTOSCALE_TARGET_PENDING"),
+        max_wait=settings.get("AUTOSCALE_MAX_WAIT"),
+        autoscale_interval=settings.get("AUTOSCALE_INTERVAL"),
+        drain_timeout=settings.get("WORKER_DRAIN_TIMEOUT"),
+        tick=tick, on_crash=recover_jobs, commands={"cli": run_cli},
+        log=lambda msg: print(msg, flush=True),
+    )
+    scaling = f", autoscaling {supervisor.min_workers}-{supervisor.max_workers}" if supervisor.autoscaling else ""
+    print(f"Supervisor PID {os.getpid()}{scaling}" + (f", queues {','.join(queues)}" if queues else "")
+          + ". Press Ctrl+C or run `worker stop` to stop.", flush=True)
+    try:
+        supervisor.run()
+    except SupervisorError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    finally:
+        janitor_stop.set()
+        sys.stdout, sys.stderr = sys.stdout.stream, sys.stderr.stream
+
+def detach_supervisor(settings, argv):
+    """Re-run `worker start` without --detach in a new session, logging to SUPERVISOR_LOG."""
+    import subprocess
+    pidfile, _ = supervisor_paths(settings)
+    running = read_pidfile(pidfile)
+    if running:
+        print(f"ERROR: a supervisor is already running (PID {running})")
+        sys.exit(1)
+    log_path = settings.get("SUPERVISOR_LOG") or f"{settings.get('DB_PATH')}.supervisor.log"
+    args = [a for a in argv if a != "--detach"]
+    with open(log_path, "ab") as log:
+        proc = subprocess.Popen([sys.executable, "-m", "queuectl.cli"] + args, stdin=subprocess.DEVNULL,
+                                stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    deadline = time.time() + 10
+    while time.time() < deadline and read_pidfile(pidfile) != proc.pid:
+        if proc.poll() is not None:
+            print(f"ERROR: supervisor exited with code {proc.returncode}; see {log_path}")
+            sys.exit(1)
+        time.sleep(0.05)
+    print(f"Supervisor started in the background (PID {proc.pid}), logging to {log_path}")
+
+def print_supervisor_status(status):
+    scaling = (f", autoscaling {status['min']}-{status['max']}" if status["autoscaling"] else "")
+    print(f"Supervisor PID {status['pid']}, up {status['uptime']:.0f}s: "
+          f"{status['live']} of {status['target']} workers live{scaling}")
+    last = status.get("last_scale") or {}
+    if last:
+        wait = "n/a" if last.get("p95_wait") is None else f"{last['p95_wait']:.2f}s"
+        print(f"Last autoscale check: {last['pending']} ready jobs, p95 wait {wait}, wanted {last['desired']}")
+    for w in status["workers"]:
+        print(f"  worker {w['slot']}: {w['state']}, PID {w['pid']}, up {w['uptime']:.0f}s, "
+              f"{w['restarts']} restarts")
+
+def iter_jsonl_payloads(stream, errors):
+    """Yield valid payloads from a JSON Lines stream; bad lines are appended to errors."""
+    from queuectl.core.queue import Queue
+    for lineno, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            payload = json.loads(line)
+            Queue.validate_payload(payload)
+        except ValueError as e:
+            errors.append((lineno, str(e)))
+            print(f"line {lineno}: {e}", file=sys.stderr)
+            continue
+        yield payload
+
+def bulk_enqueue(q, path, chunk_size):
+    errors = []
+    start = time.perf_counter()
+    stream = open(path, encoding="utf-8") if path else sys.stdin
+    try:
+        result = q.enqueue_many(iter_jsonl_payloads(stream, errors), chunk_size=chunk_size)
+    finally:
+        if path:
+            stream.close()
+    elapsed = time.perf_counter() - start
+    for job_id, reason in result["errors"]:
+        errors.append((job_id, reason))
+        print(f"job {job_id}: {reason}", file=sys.stderr)
+    count = result["created"] + result["deduplicated"]
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"Enqueued {result['created']} jobs ({result['deduplicated']} deduplicated, "
+          f"{len(errors)} rejected) in {elapsed:.2f}s ({rate:,.0f} jobs/s)")
+    if errors:
+        sys.exit(1)
+
+def write_output(value, encoding, header=None):
+    """Stream a stored stdout/stderr value to the terminal without decoding it all at once."""
+    from queuectl.core.logcapture import iter_output
+    last = ""
+    for chunk in iter_output(value, encoding):
+        if not chunk:
+            continue  # an empty value still yields "", which must not print the header
+        if header:
+            print(header)
+            header = None
+        sys.stdout.write(chunk)
+        last = chunk
+    if last and not last.endswith("\n"):
+        sys.stdout.write("\n")
+
+JOB_TABLE_COLUMNS = [("id", 28), ("queue", 12), ("state", 10), ("attempts", 8), ("priority", 8),
+                     ("run_at", 26), ("command", 40)]
+DLQ_TABLE_COLUMNS = [("id", 28), ("queue", 12), ("attempts", 8), ("created_at", 26), ("error_class", 16), ("last_error", 24),
+                     ("command", 40)]
+
+def add_listing_args(parser):
+    parser.add_argument("--limit", type=int, help="Stop after this many rows.")
+    parser.add_argument("--after", help="Resume after this id (ids are listed in order).")
+    parser.add_argument("--since", help="Only rows created at or after this ISO timestamp.")
+    parser.add_argument("--prefix", help="Only ids starting with this prefix.")
+    parser.add_argument("--format", choices=["json", "ndjson", "table"], default="json")
+
+def listing_filters(args):
+    return {"limit": args.limit, "after": args.after, "since": args.since, "id_prefix": args.prefix}
+
+def add_dlq_filter_args(parser):
+    parser.add_argument("--error", help='Only entries whose last error matches this glob, e.g. "*refused*".')
+    parser.add_argument("--error-class", help="Only entries of this class (see `dlq stats`), e.g. exit_1 or timeout.")
+    parser.add_argument("--older-than-days", type=float, help="Only entries buried more than this many days ago.")
+    parser.add_argument("--command-prefix", help="Only entries whose command starts with this.")
+    parser.add_argument("--queue", help="Only entries from this queue.")
+
+def dlq_filters(args):
+    before = None
+    if args.older_than_days is not None:
+        from datetime import datetime, timedelta
+        before = (datetime.utcnow() - timedelta(days=args.older_than_days)).isoformat()
+    return {key: value for key, value in (
+        ("error", args.error), ("error_class", args.error_class), ("before", before),
+        ("command_prefix", args.command_prefix), ("queue", args.queue)) if value is not None}
+
+def emit_rows(rows, fmt, limit, columns):
+    """Write rows to stdout as they arrive from the database, never holding them all."""
+    out = sys.stdout
+    last_id = None
+    count = 0
+    try:
+        if fmt == "table":
+            out.write(" ".join(name.upper().ljust(width) for name, width in columns).rstrip() + "\n")
+        elif fmt == "json":
+            out.write("[")
+        for row in rows:
+            if fmt == "ndjson":
+                out.write(json.dumps(row) + "\n")
+            elif fmt == "table":
+                cells = []
+                for name, width in columns:
+                    value = "" if row.get(name) is None else str(row[name])
+                    cells.append(value[:width].ljust(width))
+                out.write(" ".join(cells).rstrip() + "\n")
+            else:
+                # Same layout json.dumps(rows, indent=2) would produce, one element at a time.
+                body = json.dumps(row, indent=2).replace("\n", "\n  ")
+                out.write(("," if count else "") + "\n  " + body)
+            last_id = row["id"]
+            count += 1
+        if fmt == "json":
+            out.write("\n]\n" if count else "]\n")
+        out.flush()
+    except BrokenPipeError:
+        # Reader (e.g. `| head`) went away; stop quietly and keep the exit-time flush silent.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    if limit and count == limit:
+        print(f"More rows may follow: rerun with --after {last_id}", file=sys.stderr)
+
+def worker_command(args, settings, argv):
+    pidfile, control_socket = supervisor_paths(settings)
+    if args.action == "start":
+        if __name__ != "__main__":
+            return  # prevent recursive spawn
+        if args.detach:
+            detach_supervisor(settings, argv)
+            return
+        min_workers = args.min_workers if args.min_workers is not None else settings.get("WORKER_MIN")
+        max_workers = args.max_workers if args.max_workers is not None else settings.get("WORKER_MAX")
+        count = args.count
+        if max_workers and max_workers > min_workers:
+            count = count if count is not None else min_workers
+        else:
+            count = count if count is not None else settings.get("WORKER_COUNT")
+            min_workers = max_workers = None
+        run_workers(count, args.batch_size or settings.get("BATCH_SIZE"),
+                    args.concurrency or settings.get("WORKER_CONCURRENCY"),
+                    parse_queues(args.queues or settings.get("WORKER_QUEUES")),
+                    (args.profile, args.profile_dir) if args.profile else None,
+                    min_workers, max_workers)
+        return
+    try:
+        if args.action == "stop":
+            reply = control_request(control_socket, {"cmd": "stop"})
+            print(f"Stopping supervisor PID {reply['pid']}; workers finish their current jobs first.")
+            if not args.no_wait:
+                while read_pidfile(pidfile) == reply["pid"]:
+                    time.sleep(0.2)
+                print("All workers stopped.")
+            return
+        if args.action == "scale":
+            if args.count is None and args.min_workers is None and args.max_workers is None:
+                print("ERROR: give a worker count, or --min/--max for autoscaling.")
+                sys.exit(1)
+            request = {"cmd": "scale"}
+            if args.count is not None:
+                request["count"] = args.count
+            if args.min_workers is not None:
+                request["min"] = args.min_workers
+            if args.max_workers is not None:
+                request["max"] = args.max_workers
+            reply = control_request(control_socket, request)
+        else:
+            reply = control_request(control_socket, {"cmd": "status"})
+    except SupervisorError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    if not reply.get("ok"):
+        print(f"ERROR: {reply.get('error')}")
+        sys.exit(1)
+    print_supervisor_status(reply)
+
+def is_read_only(args):
+    """Commands that only look, and so open the database read-only."""
+    if args.cmd in ("list", "status", "metrics", "stats", "dag", "logs"):
+        return True
+    return (args.cmd == "dlq" and args.dlq_cmd in ("list", "stats")) or (args.cmd == "queue" and args.queue_cmd == "list")
+
+def forwardable(args):
+    """Commands a supervisor can run for a client: no stdin, and no paths relative to the caller."""
+    if args.cmd == "enqueue":
+        return bool(args.payload) and args.payload != "-" and not args.file
+    if args.cmd == "metrics":
+        return not args.textfile
+    return args.cmd in ("list", "status", "stats", "dag", "logs", "dlq", "queue")
+
+def forward_command(settings, argv):
+    """Run argv in the supervisor's process and replay its output.
+
+    Returns the exit code, or None when no supervisor answers, in which case the caller
+    runs the command itself.
+    """
     try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("Shutdown requested. Stopping workers...")
-        for ev in stop_events:
-            ev.set()
-        for p in workers:
-            p.join(timeout=5)
-        print("All workers stopped.")
-
-def main():
+        reply = control_request(supervisor_paths(settings)[1], {"cmd": "cli", "argv": argv}, timeout=60)
+    except SupervisorError:
+        return None
+    if not reply.get("ok"):
+        return None
+    sys.stdout.write(reply["stdout"])
+    sys.stdout.flush()
+    sys.stderr.write(reply["stderr"])
+    return reply["code"]
+
+def build_parser():
     parser = argparse.ArgumentParser(
         prog="queuectl",
         description="CLI-based background job queue system."
     )
+    parser.add_argument("--client", action="store_true",
+                        help="Have a running supervisor execute the command (default: CLIENT_MODE setting).")
     sub = parser.add_subparsers(dest="cmd")
 
     enq = sub.add_parser("enqueue", help="Enqueue a new job.")
-    enq.add_argument("payload", type=str, help='JSON payload e.g. \'{"id":"job1","command":"sleep 2"}\'')
+    enq.add_argument("payload", type=str, nargs="?",
+                     help='JSON payload e.g. \'{"id":"job1","command":"sleep 2"}\', or - to read JSON Lines from stdin')
+    enq.add_argument("--file", help="Bulk enqueue from a JSON Lines file (one payload per line).")
+    enq.add_argument("--chunk-size", type=int, default=1000, help="Jobs written per transaction in bulk mode.")
 
     w = sub.add_parser("worker", help="Manage workers.")
     w_sub = w.add_subparsers(dest="action")
     w_start = w_sub.add_parser("start", help="Start workers.")
-    w_start.add_argument("--count", type=int, default=1)
-    w_stop = w_sub.add_parser("stop", help="Stop all workers gracefully.")
+    w_start.add_argument("--count", type=int, default=None,
+                         help="Workers to run (default: WORKER_COUNT setting, or WORKER_MIN when autoscaling).")
+    w_start.add_argument("--min", type=int, default=None, dest="min_workers",
+                         help="Autoscale down to this many workers (default: WORKER_MIN setting).")
+    w_start.add_argument("--max", type=int, default=None, dest="max_workers",
+                         help="Autoscale up to this many workers (default: WORKER_MAX setting).")
+    w_start.add_argument("--detach", action="store_true", help="Run the supervisor in the background.")
+    w_start.add_argument("--batch-size", type=int, default=None,
+                         help="Jobs claimed per database round-trip (default: BATCH_SIZE setting).")
+    w_start.add_argument("--concurrency", type=int, default=None,
+                         help="Jobs run at once by each worker process (default: WORKER_CONCURRENCY setting).")
+    w_start.add_argument("--queues", help="Comma-separated queues to serve (default: WORKER_QUEUES, or all).")
+    w_start.add_argument("--profile", choices=["cprofile", "sample"],
+                         help="Profile worker 1: cProfile (its dispatcher thread) or stack sampling (all threads).")
+    w_start.add_argument("--profile-dir", default=".", help="Where --profile writes its output.")
+    w_stop = w_sub.add_parser("stop", help="Drain and stop all workers, then the supervisor.")
+    w_stop.add_argument("--no-wait", action="store_true", help="Return without waiting for the drain.")
+    w_scale = w_sub.add_parser("scale", help="Change the number of workers of a running supervisor.")
+    w_scale.add_argument("count", type=int, nargs="?", help="Run exactly this many workers (turns autoscaling off).")
+    w_scale.add_argument("--min", type=int, dest="min_workers", help="New autoscaling lower bound.")
+    w_scale.add_argument("--max", type=int, dest="max_workers", help="New autoscaling upper bound.")
+    w_sub.add_parser("status", help="Show the supervisor and its workers.")
 
     st = sub.add_parser("status", help="Show status of jobs and workers.")
 
+    mtr = sub.add_parser("metrics", help="Print worker telemetry and queue depth in Prometheus format.")
+    mtr.add_argument("--textfile", help="Write to this file (atomically) instead of stdout.")
+
+    sts = sub.add_parser("stats", help="Show runtime percentiles and throughput.")
+    sts.add_argument("--job", help="Limit runtime statistics to one job id.")
+    sts.add_argument("--window", type=int, default=60, help="Throughput window in minutes.")
+    sts.add_argument("--per-minute", action="store_true", help="Print one line per minute in the window.")
+
     lst = sub.add_parser("list", help="List jobs by state.")
-    lst.add_argument("--state", choices=["pending", "processing", "completed", "failed", "dead"])
+    lst.add_argument("--state", choices=["pending", "blocked", "processing", "completed", "failed", "dead"])
+    lst.add_argument("--priority", type=int, help="Only jobs with this priority.")
+    lst.add_argument("--queue", help="Only jobs in this queue.")
+    add_listing_args(lst)
 
     dlq = sub.add_parser("dlq", help="DLQ operations.")
     dlq_sub = dlq.add_subparsers(dest="dlq_cmd")
-    dlq_sub.add_parser("list", help="List DLQ items.")
-    dlq_retry = dlq_sub.add_parser("retry", help="Retry a DLQ item by id.")
-    dlq_retry.add_argument("id")
+    dlq_list = dlq_sub.add_parser("list", help="List DLQ items.")
+    add_listing_args(dlq_list)
+    add_dlq_filter_args(dlq_list)
+    dlq_retry = dlq_sub.add_parser("retry", help="Re-queue a DLQ item by id, or every item matching filters.")
+    dlq_retry.add_argument("id", nargs="?")
+    dlq_purge = dlq_sub.add_parser("purge", help="Delete every DLQ item matching filters.")
+    for bulk in (dlq_retry, dlq_purge):
+        add_dlq_filter_args(bulk)
+        bulk.add_argument("--all", action="store_true", help="Match every DLQ item (when no filter is given).")
+        bulk.add_argument("--dry-run", action="store_true", help="Only count the matching items.")
+    dlq_sub.add_parser("stats", help="Count dead jobs by error class.")
+
+    qs = sub.add_parser("queue", help="Named queue limits and scheduling weights.")
+    qs_sub = qs.add_subparsers(dest="queue_cmd")
+    qs_sub.add_parser("list", help="Show queues with their limits and job counts.")
+    qs_set = qs_sub.add_parser("set", help="Configure a queue; 0 removes a limit.")
+    qs_set.add_argument("name")
+    qs_set.add_argument("--weight", type=float, help="Fair-share weight (default 1).")
+    qs_set.add_argument("--max-in-flight", type=int, help="Most jobs of this queue processing at once.")
+    qs_set.add_argument("--rate", type=float, help="Most jobs started per second.")
+    qs_set.add_argument("--burst", type=float, help="Jobs that may start at once under --rate (default max(1, rate)).")
+
+    gc = sub.add_parser("gc", help="Archive and delete old completed jobs, logs and metrics.")
+    gc.add_argument("--older-than-days", type=float, help="Completed-job age limit (default: RETENTION_COMPLETED_DAYS).")
+    gc.add_argument("--keep", type=int, help="Keep at most this many completed jobs (default: RETENTION_MAX_COMPLETED).")
+    gc.add_argument("--dlq-older-than-days", type=float,
+                    help="Delete DLQ entries buried longer ago than this (default: RETENTION_DLQ_DAYS).")
+    gc.add_argument("--archive-dir", help="Write removed rows to gzipped JSONL segments here (default: ARCHIVE_DIR).")
+    gc.add_argument("--batch-size", type=int, help="Rows deleted per transaction (default: GC_BATCH_SIZE).")
+    gc.add_argument("--vacuum", action="store_true", help="Finish with a full VACUUM (blocks other writers).")
 
     cfg = sub.add_parser("config", help="Configuration management.")
     cfg_sub = cfg.add_subparsers(dest="cfg_cmd")
@@ -77,54 +564,186 @@ def main():
     cfg_set.add_argument("key")
     cfg_set.add_argument("value")
     
+    dag = sub.add_parser("dag", help="Show the progress of the workflow a job belongs to.")
+    dag.add_argument("job_id", help="Any job in the workflow.")
+    dag.add_argument("--format", choices=["table", "json"], default="table")
+
     logs = sub.add_parser("logs", help="Show job execution logs.")
     logs.add_argument("job_id", type=str, help="Job ID to show logs and metrics.")
+    return parser
 
-    args = parser.parse_args()
+def main(argv=None, storage=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
 
     settings = Settings()
-    storage = Storage(settings.get("DB_PATH"))
-    q = Queue(storage)
+    if args.cmd == "worker":
+        worker_command(args, settings, argv)  # talks to the supervisor, not the database
+        return
+    if storage is None and (args.client or settings.get("CLIENT_MODE")) and forwardable(args):
+        code = forward_command(settings, argv)
+        if code is not None:
+            if code:
+                sys.exit(code)
+            return
+    if storage is None:
+        storage = open_storage(settings, readonly=is_read_only(args))
+    from queuectl.core.queue import Queue
+    q = Queue(storage, wakeup_dir(settings))
 
     if args.cmd == "enqueue":
+        if args.file or args.payload == "-":
+            bulk_enqueue(q, args.file, args.chunk_size)
+            return
+        if not args.payload:
+            print("ERROR: enqueue needs a JSON payload, --file PATH, or - for stdin.")
+            sys.exit(1)
         payload_str = args.payload.strip()
         if payload_str.startswith("'") and payload_str.endswith("'"):
             payload_str = payload_str[1:-1]
         try:
             payload = json.loads(payload_str)
+            job = q.enqueue(payload)
         except Exception as e:
             print(f"\nERROR: Invalid JSON payload for enqueue!\nPayload received: {repr(payload_str)}\nException: {e}\n")
             sys.exit(1)
-        job = q.enqueue(payload)
-        print(f"Enqueued: {job['id']}")
+        if job["status"] == "deduplicated":
+            print(f"Deduplicated: {job['id']} (existing job {job['existing_id']})")
+        elif job["state"] == "blocked":
+            print(f"Enqueued: {job['id']} (blocked on {job['unmet_deps']} of {len(job['depends_on'])} dependencies)")
+        else:
+            print(f"Enqueued: {job['id']}")
         return
 
     if args.cmd == "list":
-        state = args.state
-        items = q.list(state)
-        print(json.dumps(items, indent=2))
+        items = q.iter(state=args.state, priority=args.priority, queue=args.queue, **listing_filters(args))
+        emit_rows(items, args.format, args.limit, JOB_TABLE_COLUMNS)
         return
 
     if args.cmd == "status":
-        items = q.list()
-        counts = {"pending":0, "processing":0, "completed":0, "failed":0, "dead":0}
-        for it in items:
-            counts[it["state"]] = counts.get(it["state"], 0) + 1
+        counts = {"pending":0, "blocked":0, "processing":0, "completed":0, "failed":0, "dead":0}
+        counts.update(storage.count_by_state())
         print("Job counts:", counts)
-        print(f"Workers: {settings.get('WORKER_COUNT')}")
+        try:
+            sup = control_request(supervisor_paths(settings)[1], {"cmd": "status"})
+            print(f"Workers: {sup['live']} live (supervisor PID {sup['pid']})")
+        except SupervisorError:
+            print("Workers: 0 (no supervisor running)")
+        cache = storage.cache_stats()
+        lookups = cache["hits"] + cache["misses"]
+        hit_rate = f"{100 * cache['hits'] / lookups:.1f}%" if lookups else "n/a"
+        print(f"Result cache: {cache['entries']} entries, {cache['bytes']:,} bytes, "
+              f"{cache['hits']} hits, {cache['misses']} misses ({hit_rate} hit rate), "
+              f"{cache['evictions']} evictions")
+        return
+
+    if args.cmd == "metrics":
+        from queuectl.core import telemetry
+        text = telemetry.render(metrics_dir(settings), storage)
+        if args.textfile:
+            telemetry.write_textfile(args.textfile, text)
+        else:
+            sys.stdout.write(text)
+        return
+
+    if args.cmd == "stats":
+        summary = storage.runtime_summary(args.job)
+        scope = f"job {args.job}" if args.job else "all jobs"
+        print(f"Runtime ({scope}): {summary['count']} runs, avg {summary['avg']:.3f}s, "
+              f"p50 {summary['p50']:.3f}s, p95 {summary['p95']:.3f}s, p99 {summary['p99']:.3f}s, "
+              f"max {summary['max']:.3f}s")
+        windows = storage.throughput(args.window)
+        runs = sum(w["runs"] for w in windows)
+        completed = sum(w["completed"] for w in windows)
+        dead = sum(w["dead"] for w in windows)
+        print(f"Last {args.window} min: {runs} runs ({runs / (args.window * 60):.2f}/s), "
+              f"{completed} completed, {dead} moved to DLQ")
+        if args.per_minute:
+            for w in windows:
+                print(f"  {w['minute']}  runs={w['runs']} completed={w['completed']} dead={w['dead']}")
         return
 
     if args.cmd == "dlq":
+        from queuectl.dlq.store import DLQStore
         dlq_store = DLQStore(storage)
         if args.dlq_cmd == "list":
-            items = dlq_store.list_dlq()
-            print(json.dumps(items, indent=2))
+            items = dlq_store.iter_dlq(**listing_filters(args), **dlq_filters(args))
+            emit_rows(items, args.format, args.limit, DLQ_TABLE_COLUMNS)
+            return
+        if args.dlq_cmd == "stats":
+            rows = dlq_store.stats()
+            print(f"DLQ: {sum(row['count'] for row in rows)} dead jobs")
+            if rows:
+                print(f"{'ERROR CLASS':20} {'COUNT':>8}  {'OLDEST':26} NEWEST")
+            for row in rows:
+                print(f"{row['error_class']:20} {row['count']:>8}  {row['oldest']:26} {row['newest']}")
+            return
+        filters = dlq_filters(args)
+        if args.dlq_cmd == "retry" and args.id:
+            if filters or args.all:
+                print("ERROR: give a DLQ item id or filters, not both.")
+                sys.exit(1)
+            result = dlq_store.retry(args.id, settings.get("MAX_RETRIES"))
+            if result["retried"]:
+                q.notify()
+                print(f"Retried DLQ item: {args.id} -> requeued.")
+            elif result["skipped"]:
+                print(f"Skipped DLQ item {args.id}: its id belongs to a live job.")
+            else:
+                print("DLQ item not found.")
+            return
+        if args.dlq_cmd in ("retry", "purge"):
+            if not filters and not args.all:
+                print("ERROR: give filters (--error, --error-class, --older-than-days, --command-prefix, "
+                      "--queue) or --all.")
+                sys.exit(1)
+            if args.dry_run:
+                print(f"{dlq_store.count(**filters)} DLQ items match.")
+                return
+            if args.dlq_cmd == "purge":
+                print(f"Purged {dlq_store.purge_matching(**filters)} DLQ items.")
+                return
+            result = dlq_store.retry_matching(settings.get("MAX_RETRIES"), **filters)
+            if result["retried"]:
+                q.notify()
+            skipped = f" ({result['skipped']} skipped: their ids belong to live jobs)" if result["skipped"] else ""
+            print(f"Retried {result['retried']} DLQ items{skipped}.")
+            return
+
+    if args.cmd == "queue":
+        if args.queue_cmd == "set":
+            changes = {key: (value or None) for key, value in (
+                ("weight", args.weight), ("max_in_flight", args.max_in_flight),
+                ("rate", args.rate), ("burst", args.burst)) if value is not None}
+            try:
+                storage.configure_queue(args.name, **changes)
+            except ValueError as e:
+                print(f"ERROR: {e}")
+                sys.exit(1)
+            q.notify()  # a raised limit may free up waiting work
+            print(f"Queue {args.name} updated.")
             return
-        if args.dlq_cmd == "retry":
-            item = dlq_store.retry(args.id)
-            print(f"Retried DLQ item: {args.id} -> requeued." if item else "DLQ item not found.")
+        if args.queue_cmd == "list":
+            print(f"{'QUEUE':16} {'WEIGHT':>6} {'MAX':>5} {'RATE':>7} {'BURST':>6} {'PENDING':>8} {'RUNNING':>8}")
+            for row in storage.list_queues():
+                limits = [row["max_in_flight"], row["rate"], row["burst"]]
+                max_, rate, burst = ("-" if v is None else f"{v:g}" for v in limits)
+                print(f"{row['name']:16} {row['weight']:>6g} {max_:>5} {rate:>7} {burst:>6} "
+                      f"{row['pending']:>8} {row['processing']:>8}")
             return
 
+    if args.cmd == "gc":
+        from queuectl.core.janitor import format_stats
+        janitor = make_janitor(settings, storage, completed_days=args.older_than_days,
+                               keep_completed=args.keep, dlq_days=args.dlq_older_than_days,
+                               archive_dir=args.archive_dir, batch_size=args.batch_size)
+        stats = janitor.run_once(checkpoint="TRUNCATE")
+        print(f"GC: {format_stats(stats)}")
+        if args.vacuum:
+            storage.vacuum()
+            print("VACUUM complete.")
+        return
+
     if args.cmd == "config":
         if args.cfg_cmd == "set":
             key, value = args.key, args.value
@@ -138,27 +757,43 @@ def main():
             print(f"Config set {key} = {value_parsed}")
             return
 
-    if args.cmd == "worker":
-        if args.action == "start":
-            if __name__ != "__main__":
-                return  # prevent recursive spawn
-            run_workers(args.count)
-            return
-        if args.action == "stop":
-            print("Graceful stop not implemented; use Ctrl+C where workers started.")
+    if args.cmd == "dag":
+        nodes = storage.dag(args.job_id)
+        if args.format == "json":
+            print(json.dumps(nodes, indent=2))
             return
+        if len(nodes) == 1 and nodes[0]["state"] == "purged":
+            print(f"Job {args.job_id} not found.")
+            sys.exit(1)
+        states = {}
+        for node in nodes:
+            states[node["state"]] = states.get(node["state"], 0) + 1
+        done = states.get("completed", 0) + states.get("purged", 0)
+        print(f"Workflow of {args.job_id}: {done}/{len(nodes)} done; "
+              + ", ".join(f"{state} {n}" for state, n in sorted(states.items())))
+        for node in nodes:
+            line = f"  {node['id']:28} {node['state']:10}"
+            if node["depends_on"]:
+                line += f" <- {', '.join(node['depends_on'])}"
+            if node["state"] == "blocked":
+                line += f" ({node['unmet_deps']} unmet)"
+            print(line.rstrip())
+        return
 
     if args.cmd == "logs":
-        logs = storage.get_job_logs(args.job_id)
-        metrics = storage.get_job_metrics(args.job_id)
+        runtime = storage.runtime_summary(args.job_id)
+        job = q.get(args.job_id)
         print(f"Logs for job {args.job_id}:")
-        for log in logs:
-            print(f"[{log['timestamp']}] stdout:\n{log['stdout']}")
-            if log["stderr"]:
-                print(f"stderr:\n{log['stderr']}")
-        if metrics:
-            avg_runtime = sum(m["runtime_seconds"] for m in metrics) / len(metrics)
-            print(f"Average runtime: {avg_runtime:.2f}s over {len(metrics)} runs.")
+        if job:
+            print(f"State: {job['state']} (attempts {job['attempts']}/{job['max_retries']})")
+            if job["state"] == "pending" and job["run_at"]:
+                print(f"Next retry at: {job['run_at']} (last error: {job['last_error']})")
+        for log in storage.iter_job_logs(args.job_id):
+            print(f"[{log['timestamp']}] stdout:")
+            write_output(log["stdout"], log["encoding"])
+            write_output(log["stderr"], log["encoding"], header="stderr:")
+        if runtime["count"]:
+            print(f"Average runtime: {runtime['avg']:.2f}s over {runtime['count']} runs.")
         else:
             print("No runtime metrics found.")
         return
@@ -6,10 +6,81 @@ DEFAULTS = {
     "MAX_RETRIES": int(os.environ.get("QUEUECTL_MAX_RETRIES", "3")),
     "BACKOFF_BASE": int(os.environ.get("QUEUECTL_BACKOFF_BASE", "2")),
     "BACKOFF_MAX": int(os.environ.get("QUEUECTL_BACKOFF_MAX", "600")),
+    # Number of SQLite files jobs are spread over (by hash of job id), each with its own
+    # write lock. Shard 0 is DB_PATH; others are DB_PATH with .shardN before the suffix.
+    # Don't change it while jobs are stored: existing jobs would be looked up in the wrong file.
+    "SHARDS": int(os.environ.get("QUEUECTL_SHARDS", "1")),
     "WORKER_COUNT": int(os.environ.get("QUEUECTL_WORKER_COUNT", "1")),
+    # Supervisor (`worker start`): pidfile and control socket, empty meaning DB_PATH plus
+    # ".supervisor.pid" / ".supervisor.sock". WORKER_MIN < WORKER_MAX turns on autoscaling
+    # (0 = fixed at WORKER_COUNT): roughly one worker per AUTOSCALE_TARGET_PENDING ready jobs,
+    # plus one more while the p95 enqueue-to-start wait exceeds AUTOSCALE_MAX_WAIT seconds.
+    "SUPERVISOR_PIDFILE": os.environ.get("QUEUECTL_SUPERVISOR_PIDFILE", ""),
+    "SUPERVISOR_SOCKET": os.environ.get("QUEUECTL_SUPERVISOR_SOCKET", ""),
+    "SUPERVISOR_LOG": os.environ.get("QUEUECTL_SUPERVISOR_LOG", ""),  # --detach output; empty = DB_PATH.supervisor.log
+    # Client mode: one-shot commands (enqueue, status, list, ...) are sent to the running
+    # supervisor over its control socket and run there, falling back to running locally.
+    "CLIENT_MODE": os.environ.get("QUEUECTL_CLIENT", "false").lower() == "true",
+    "WORKER_DRAIN_TIMEOUT": float(os.environ.get("QUEUECTL_WORKER_DRAIN_TIMEOUT", "60")),  # seconds
+    "WORKER_MIN": int(os.environ.get("QUEUECTL_WORKER_MIN", "0")),
+    "WORKER_MAX": int(os.environ.get("QUEUECTL_WORKER_MAX", "0")),
+    "AUTOSCALE_TARGET_PENDING": int(os.environ.get("QUEUECTL_AUTOSCALE_TARGET_PENDING", "100")),
+    "AUTOSCALE_MAX_WAIT": float(os.environ.get("QUEUECTL_AUTOSCALE_MAX_WAIT", "5")),
+    "AUTOSCALE_INTERVAL": float(os.environ.get("QUEUECTL_AUTOSCALE_INTERVAL", "10")),
+    "WORKER_CONCURRENCY": int(os.environ.get("QUEUECTL_WORKER_CONCURRENCY", "1")),  # slots per process
+    "WORKER_QUEUES": os.environ.get("QUEUECTL_WORKER_QUEUES", ""),  # comma-separated; empty = all
+    "BATCH_SIZE": int(os.environ.get("QUEUECTL_BATCH_SIZE", "1")),  # jobs claimed per round-trip
+    # With WORKER_CONCURRENCY > 1, finished jobs from different slots are committed together:
+    # a commit waits up to COMPLETION_WINDOW_MS for more outcomes, taking at most COMPLETION_BATCH.
+    "COMPLETION_WINDOW_MS": float(os.environ.get("QUEUECTL_COMPLETION_WINDOW_MS", "5")),
+    "COMPLETION_BATCH": int(os.environ.get("QUEUECTL_COMPLETION_BATCH", "100")),
+    # Directory of worker wakeup sockets; empty means "<DB_PATH>.wakeup".
+    "WAKEUP_DIR": os.environ.get("QUEUECTL_WAKEUP_DIR", ""),
+    "IDLE_POLL_MAX": float(os.environ.get("QUEUECTL_IDLE_POLL_MAX", "2.0")),  # seconds
+    # Claim lease, renewed every LEASE_SECONDS/3 by a live worker; jobs whose lease lapses
+    # are re-queued (as a failed attempt) by any worker every REAP_INTERVAL seconds.
+    "LEASE_SECONDS": float(os.environ.get("QUEUECTL_LEASE_SECONDS", "60")),
+    "REAP_INTERVAL": float(os.environ.get("QUEUECTL_REAP_INTERVAL", "30")),
+    # Retention, applied by `queuectl gc` and (when GC_INTERVAL > 0) a janitor thread in
+    # `worker start`. 0 disables a limit; ARCHIVE_DIR empty means delete without archiving.
+    "RETENTION_COMPLETED_DAYS": float(os.environ.get("QUEUECTL_RETENTION_COMPLETED_DAYS", "30")),
+    "RETENTION_MAX_COMPLETED": int(os.environ.get("QUEUECTL_RETENTION_MAX_COMPLETED", "0")),
+    "RETENTION_DLQ_DAYS": float(os.environ.get("QUEUECTL_RETENTION_DLQ_DAYS", "0")),
+    # Per-minute throughput counters behind `stats`; only the last hour is shown.
+    "RETENTION_THROUGHPUT_DAYS": float(os.environ.get("QUEUECTL_RETENTION_THROUGHPUT_DAYS", "7")),
+    "ARCHIVE_DIR": os.environ.get("QUEUECTL_ARCHIVE_DIR", ""),
+    "GC_BATCH_SIZE": int(os.environ.get("QUEUECTL_GC_BATCH_SIZE", "500")),
+    "GC_INTERVAL": int(os.environ.get("QUEUECTL_GC_INTERVAL", "0")),  # seconds; 0 = no janitor
+    # Telemetry: each worker saves its phase timers and counters to METRICS_DIR (empty means
+    # "<DB_PATH>.metrics") every METRICS_INTERVAL seconds. `worker start` serves them merged, in
+    # Prometheus format, on METRICS_HOST:METRICS_PORT (0 = off) and/or rewrites METRICS_TEXTFILE.
+    "METRICS_DIR": os.environ.get("QUEUECTL_METRICS_DIR", ""),
+    "METRICS_INTERVAL": float(os.environ.get("QUEUECTL_METRICS_INTERVAL", "5")),
+    "METRICS_HOST": os.environ.get("QUEUECTL_METRICS_HOST", "127.0.0.1"),
+    "METRICS_PORT": int(os.environ.get("QUEUECTL_METRICS_PORT", "0")),
+    "METRICS_TEXTFILE": os.environ.get("QUEUECTL_METRICS_TEXTFILE", ""),
     "LOG_LEVEL": os.environ.get("QUEUECTL_LOG_LEVEL", "INFO"),
+    # Job output capture: per-stream cap (head and tail kept), zlib in job_logs, or
+    # whole output streamed to gzip files under LOG_DIR when it is set.
+    "LOG_MAX_BYTES": int(os.environ.get("QUEUECTL_LOG_MAX_BYTES", "1048576")),
+    "LOG_COMPRESS": os.environ.get("QUEUECTL_LOG_COMPRESS", "true").lower() == "true",
+    "LOG_DIR": os.environ.get("QUEUECTL_LOG_DIR", ""),
+    # Warm Python processes for callable jobs: each is replaced after PYTHON_MAX_TASKS jobs
+    # or once its peak RSS passes PYTHON_MAX_MEMORY_MB (0 disables either limit);
+    # PYTHON_PRELOAD lists modules (comma-separated) imported once, before forking.
+    "PYTHON_MAX_TASKS": int(os.environ.get("QUEUECTL_PYTHON_MAX_TASKS", "1000")),
+    "PYTHON_MAX_MEMORY_MB": int(os.environ.get("QUEUECTL_PYTHON_MAX_MEMORY_MB", "512")),
+    "PYTHON_PRELOAD": os.environ.get("QUEUECTL_PYTHON_PRELOAD", ""),
+    # Result cache for jobs enqueued with "cache": least recently used entries are evicted
+    # once stored output passes this many bytes (split evenly across shards).
+    "RESULT_CACHE_MAX_BYTES": int(os.environ.get("QUEUECTL_RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
     "JOB_TIMEOUT": int(os.environ.get("QUEUECTL_JOB_TIMEOUT", "30")),  # default 30 seconds
     "DEFAULT_PRIORITY": int(os.environ.get("QUEUECTL_DEFAULT_PRIORITY", "10")),
+    # SQLite connection pragmas, applied once per long-lived connection.
+    "SQLITE_SYNCHRONOUS": os.environ.get("QUEUECTL_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "SQLITE_BUSY_TIMEOUT": int(os.environ.get("QUEUECTL_SQLITE_BUSY_TIMEOUT", "5000")),  # milliseconds
+    "SQLITE_CACHE_SIZE": int(os.environ.get("QUEUECTL_SQLITE_CACHE_SIZE", "-16000")),  # negative = KiB
+    "SQLITE_MMAP_SIZE": int(os.environ.get("QUEUECTL_SQLITE_MMAP_SIZE", "268435456")),  # bytes
 }
 
 
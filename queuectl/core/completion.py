@@ -0,0 +1,99 @@
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+
+class _Pending:
+    __slots__ = ("outcome", "done", "error", "dropped")
+
+    def __init__(self, outcome: Dict[str, Any]):
+        self.outcome = outcome
+        self.done = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.dropped = False
+
+
+class CompletionWriter:
+    """Group-commits job outcomes from a worker's slots on one background thread.
+
+    submit() blocks until the outcome's transaction has committed, so a job is only
+    acknowledged once its log, metric and state change are durable; it returns False
+    if storage dropped the outcome because the job's claim was lost. Outcomes arriving
+    while a commit is running, or within `window` seconds of the first one, share the
+    next transaction, up to max_batch per commit. If a shared commit fails, each of its
+    outcomes is retried on its own so one bad row doesn't fail the others.
+    """
+
+    def __init__(self, storage, window: float = 0.005, max_batch: int = 100):
+        self.storage = storage
+        self.window = max(0.0, window)
+        self.max_batch = max(1, max_batch)
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="completion-writer")
+        self._thread.start()
+        self.commits = 0
+        self.outcomes = 0
+
+    def submit(self, outcome: Dict[str, Any]) -> bool:
+        pending = _Pending(outcome)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return not pending.dropped
+
+    def _collect(self, first: _Pending) -> List[_Pending]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # seen again by _run after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch: List[_Pending]) -> None:
+        try:
+            dropped = set(self.storage.record_outcomes([p.outcome for p in batch]))
+            self.commits += 1
+            for pending in batch:
+                pending.dropped = pending.outcome["job"]["id"] in dropped
+        except Exception:
+            if len(batch) == 1:
+                raise
+            for pending in batch:
+                try:
+                    pending.dropped = bool(self.storage.record_outcomes([pending.outcome]))
+                    self.commits += 1
+                except Exception as e:
+                    pending.error = e
+        self.outcomes += len(batch)
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                print("Completion writer: commit failed:", file=sys.stderr)
+                traceback.print_exc()
+                for pending in batch:
+                    pending.error = pending.error or e
+            for pending in batch:
+                pending.done.set()
+
+    def close(self) -> None:
+        """Commit everything already submitted, then stop the thread."""
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,42 @@
+import os
+import threading
+import time
+
+# Crockford base32, as used by ULIDs: sorts the same as the value it encodes.
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RANDOM_BITS = 80
+
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+
+def _reset_after_fork() -> None:
+    # A forked child must not continue its parent's sequence within the same millisecond.
+    global _last_ms
+    _last_ms = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def ulid() -> str:
+    """A 26-character ULID: 48-bit millisecond timestamp then 80 random bits.
+
+    Monotonic within a process: ids made in the same millisecond (or after the clock
+    steps back) increment the random part instead of drawing a new one, so they still
+    sort in creation order and can't collide with each other.
+    """
+    global _last_ms, _last_random
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            random = int.from_bytes(os.urandom(_RANDOM_BITS // 8), "big")
+        else:
+            ms, random = _last_ms, _last_random + 1
+            if random >> _RANDOM_BITS:
+                ms, random = ms + 1, 0
+        _last_ms, _last_random = ms, random
+    value = (ms << _RANDOM_BITS) | random
+    return "".join(_ALPHABET[(value >> shift) & 31] for shift in range(125, -1, -5))
@@ -0,0 +1,125 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from queuectl.core.storage import Storage
+
+
+class Janitor:
+    """Applies retention to completed jobs and the DLQ, archiving before deleting.
+
+    Work is done in batches of batch_size rows, each deleted in its own short write
+    transaction, so workers claiming jobs are never blocked for long.
+    """
+
+    def __init__(self, storage: Storage, completed_days: Optional[float] = None,
+                 keep_completed: Optional[int] = None, dlq_days: Optional[float] = None,
+                 archive_dir: Optional[str] = None, batch_size: int = 500,
+                 vacuum_pages: int = 1000, pause: float = 0.01,
+                 throughput_days: Optional[float] = None):
+        self.storage = storage
+        self.completed_days = completed_days
+        self.keep_completed = keep_completed
+        self.dlq_days = dlq_days
+        self.throughput_days = throughput_days
+        self.archive_dir = archive_dir
+        self.batch_size = max(1, batch_size)
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause  # between batches, to let queued writers in
+
+    def _completed_cutoff(self) -> Optional[str]:
+        cutoffs = []
+        if self.completed_days:
+            cutoffs.append((datetime.utcnow() - timedelta(days=self.completed_days)).isoformat())
+        if self.keep_completed:
+            newest_kept = self.storage.completed_cutoff_for_keep(self.keep_completed)
+            if newest_kept:
+                cutoffs.append(newest_kept)
+        return max(cutoffs) if cutoffs else None
+
+    def _open_segment(self, kind: str):
+        if not self.archive_dir:
+            return None
+        os.makedirs(self.archive_dir, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        return gzip.open(os.path.join(self.archive_dir, f"{kind}-{stamp}.jsonl.gz"), "wb")
+
+    @staticmethod
+    def _archive(segment, rows: List[Dict[str, Any]]) -> None:
+        if segment is None:
+            return
+        for row in rows:
+            segment.write((json.dumps(row) + "\n").encode("utf-8"))
+        # Archived rows must be on disk before the delete that follows commits.
+        segment.flush()
+        os.fsync(segment.fileobj.fileno())
+
+    def _drain(self, kind: str, fetch, purge, stats: Dict[str, Any]) -> None:
+        """Archive and delete fetch()'s rows batch by batch until it comes back empty."""
+        segment = None
+        try:
+            while True:
+                batch = fetch()
+                if not batch:
+                    break
+                if segment is None:
+                    segment = self._open_segment(kind)
+                self._archive(segment, batch)
+                for table, n in purge([row["id"] for row in batch]).items():
+                    stats[table] += n
+                stats["batches"] += 1
+                time.sleep(self.pause)
+        finally:
+            if segment is not None:
+                segment.close()
+
+    def run_once(self, checkpoint: str = "PASSIVE") -> Dict[str, Any]:
+        """One retention pass. Returns rows reclaimed per table, compaction and timing."""
+        started = time.perf_counter()
+        stats = {"jobs": 0, "job_logs": 0, "job_metrics": 0, "log_files": 0, "dlq": 0, "batches": 0,
+                 "throughput": 0}
+        stats["dedupe_keys"] = self.storage.purge_dedupe_keys()
+        stats["result_cache"] = self.storage.purge_result_cache()
+
+        cutoff = self._completed_cutoff()
+        dlq_cutoff = None
+        if self.dlq_days:
+            dlq_cutoff = (datetime.utcnow() - timedelta(days=self.dlq_days)).isoformat()
+        throughput_cutoff = None
+        if self.throughput_days:
+            throughput_cutoff = (datetime.utcnow() - timedelta(days=self.throughput_days)).isoformat()
+        # A ShardedStorage is drained one shard file at a time.
+        for shard in getattr(self.storage, "shards", [self.storage]):
+            if cutoff:
+                self._drain("jobs", lambda: shard.completed_before(cutoff, self.batch_size),
+                            shard.purge_completed, stats)
+            if dlq_cutoff:
+                self._drain("dlq", lambda: shard.dlq_before(dlq_cutoff, self.batch_size),
+                            shard.purge_dlq, stats)
+            if throughput_cutoff:
+                stats["throughput"] += shard.purge_throughput(throughput_cutoff)
+
+        stats.update(self.storage.compact(checkpoint, self.vacuum_pages))
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def run_forever(self, stop_event: threading.Event, interval: float) -> None:
+        while not stop_event.wait(interval):
+            try:
+                stats = self.run_once()
+            except Exception as e:
+                print(f"Janitor pass failed: {e}")
+                continue
+            if stats["jobs"] or stats["dlq"]:
+                print(f"Janitor: {format_stats(stats)}")
+
+
+def format_stats(stats: Dict[str, Any]) -> str:
+    return (f"removed {stats['jobs']} jobs, {stats['job_logs']} logs ({stats['log_files']} files), "
+            f"{stats['job_metrics']} metrics, {stats['dlq']} DLQ entries in {stats['batches']} batches, "
+            f"{stats['throughput']} throughput minutes; "
+            f"freed {stats['pages_freed']} pages, checkpointed {stats['wal_checkpointed']} WAL pages; "
+            f"{stats['seconds']}s")
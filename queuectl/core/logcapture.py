@@ -0,0 +1,137 @@
+import gzip
+import os
+import subprocess
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+from .telemetry import TELEMETRY
+
+CHUNK_SIZE = 64 * 1024
+
+# Values of job_logs.encoding; NULL rows predate compression and hold plain text.
+ENCODING_ZLIB = "zlib"
+ENCODING_GZIP_FILE = "gzip-file"  # stdout/stderr columns hold paths to .gz files
+
+# Outputs smaller than this are stored as text: compressing them saves nothing.
+COMPRESS_MIN_BYTES = 512
+
+
+class CappedBuffer:
+    """Keeps the first and last max_bytes/2 of a stream, dropping the middle."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max(0, max_bytes)
+        self._head = bytearray()
+        self._tail = bytearray()
+        self.total = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        head_room = self.max_bytes // 2 - len(self._head)
+        if head_room > 0:
+            self._head += chunk[:head_room]
+            chunk = chunk[head_room:]
+        if chunk:
+            self._tail += chunk
+            tail_max = self.max_bytes - self.max_bytes // 2
+            if len(self._tail) > tail_max:
+                del self._tail[:len(self._tail) - tail_max]
+
+    def close(self) -> None:
+        pass
+
+    def getvalue(self) -> bytes:
+        dropped = self.total - len(self._head) - len(self._tail)
+        if dropped <= 0:
+            return bytes(self._head + self._tail)
+        marker = f"\n... [{dropped} bytes truncated] ...\n".encode()
+        return bytes(self._head) + marker + bytes(self._tail)
+
+
+class GzipFileBuffer:
+    """Streams a whole output to a gzip file instead of keeping it in memory."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._file = gzip.open(path, "wb")
+        self.total = 0
+
+    def write(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        self._file.write(chunk)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _pump(stream, buf) -> None:
+    try:
+        while True:
+            chunk = stream.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            buf.write(chunk)
+    except (OSError, ValueError):
+        pass
+    finally:
+        stream.close()
+
+
+def run_process(args: List[str], timeout: Optional[float], stdout_buf, stderr_buf) -> Tuple[int, bool]:
+    """Run args, streaming stdout/stderr into the buffers. Returns (returncode, timed_out)."""
+    with TELEMETRY.timer("queuectl_spawn_seconds"):
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    readers = [
+        threading.Thread(target=_pump, args=(proc.stdout, stdout_buf), daemon=True),
+        threading.Thread(target=_pump, args=(proc.stderr, stderr_buf), daemon=True),
+    ]
+    for r in readers:
+        r.start()
+    timed_out = False
+    try:
+        code = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        code = proc.wait()
+        timed_out = True
+    for r in readers:
+        # A grandchild may still hold the pipe open; don't wait on it forever.
+        r.join(timeout=1.0)
+    return code, timed_out
+
+
+def pack_output(stdout: bytes, stderr: bytes, compress: bool) -> Tuple[object, object, Optional[str]]:
+    """Encode captured output for job_logs, returning (stdout, stderr, encoding)."""
+    if compress and len(stdout) + len(stderr) >= COMPRESS_MIN_BYTES:
+        return zlib.compress(stdout), zlib.compress(stderr), ENCODING_ZLIB
+    return stdout.decode("utf-8", "replace"), stderr.decode("utf-8", "replace"), None
+
+
+def iter_output(value, encoding: Optional[str], chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Decode a stored stdout/stderr value lazily, chunk by chunk."""
+    if value is None:
+        return
+    if encoding == ENCODING_ZLIB:
+        decoder = zlib.decompressobj()
+        view = memoryview(value)
+        for i in range(0, len(view), chunk_size):
+            data = decoder.decompress(view[i:i + chunk_size])
+            if data:
+                yield data.decode("utf-8", "replace")
+        tail = decoder.flush()
+        if tail:
+            yield tail.decode("utf-8", "replace")
+    elif encoding == ENCODING_GZIP_FILE:
+        try:
+            with gzip.open(value, "rt", encoding="utf-8", errors="replace") as f:
+                for chunk in iter(lambda: f.read(chunk_size), ""):
+                    yield chunk
+        except FileNotFoundError:
+            yield f"[log file {value} is missing]\n"
+    else:
+        yield value if isinstance(value, str) else bytes(value).decode("utf-8", "replace")
+
+
+def read_output(value, encoding: Optional[str]) -> str:
+    return "".join(iter_output(value, encoding))
@@ -0,0 +1,79 @@
+import os
+import select
+import socket
+from typing import Optional
+
+# Each idle worker binds a Unix datagram socket in a shared directory next to the
+# database; enqueue sends one byte to every socket there. Any process on the host
+# (including one-shot CLI invocations) can wake the fleet without a broker.
+SUPPORTED = hasattr(socket, "AF_UNIX")
+
+
+def notify_workers(directory: Optional[str]) -> int:
+    """Wake every worker listening in `directory`. Returns the number signalled."""
+    if not directory or not SUPPORTED or not os.path.isdir(directory):
+        return 0
+    sent = 0
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".sock"):
+                continue
+            try:
+                sock.sendto(b"1", entry.path)
+                sent += 1
+            except BlockingIOError:
+                sent += 1  # buffer full: a wakeup is already pending
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Listener died without cleaning up.
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            except OSError:
+                pass
+    finally:
+        sock.close()
+    return sent
+
+
+class WakeupListener:
+    def __init__(self, directory: str, name: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{name}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.setblocking(False)
+
+    @classmethod
+    def open(cls, directory: Optional[str], name: str) -> Optional["WakeupListener"]:
+        """Listener, or None when wakeups are unavailable and the caller should poll."""
+        if not directory or not SUPPORTED:
+            return None
+        try:
+            return cls(directory, name)
+        except OSError:
+            return None
+
+    def wait(self, timeout: float) -> bool:
+        """Block up to `timeout` seconds; True if woken by a notification."""
+        ready, _, _ = select.select([self._sock], [], [], max(0.0, timeout))
+        if not ready:
+            return False
+        # Coalesce every pending notification into this one wakeup.
+        try:
+            while self._sock.recv(16):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        self._sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,221 @@
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import tempfile
+import threading
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+
+# A callable job stores its spec as JSON in jobs.command, so the DLQ, retries, listing
+# and archives carry it unchanged:  {"callable": "pkg.module:func", "args": [], "kwargs": {}}
+CALLABLE_KEY = "callable"
+
+
+def callable_command(target: str, args: Optional[List[Any]] = None,
+                     kwargs: Optional[Dict[str, Any]] = None) -> str:
+    return json.dumps({CALLABLE_KEY: target, "args": list(args or []), "kwargs": dict(kwargs or {})})
+
+
+def parse_callable(command: Any) -> Optional[Dict[str, Any]]:
+    """The callable spec stored in a command, or None for a shell command."""
+    if not isinstance(command, str) or not command.startswith("{"):
+        return None
+    try:
+        spec = json.loads(command)
+    except ValueError:
+        return None
+    if isinstance(spec, dict) and isinstance(spec.get(CALLABLE_KEY), str):
+        return spec
+    return None
+
+
+def validate_callable(target: Any, args: Any, kwargs: Any) -> None:
+    """Raise ValueError unless target is "module:attr" with list args and dict kwargs."""
+    if not isinstance(target, str) or target.count(":") != 1 or not all(target.split(":")):
+        raise ValueError("'callable' must look like 'package.module:function'")
+    if args is not None and not isinstance(args, list):
+        raise ValueError("'args' must be a list")
+    if kwargs is not None and not isinstance(kwargs, dict):
+        raise ValueError("'kwargs' must be an object")
+
+
+def _resolve(target: str):
+    module_name, attr = target.split(":")
+    obj = importlib.import_module(module_name)
+    for part in attr.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _call(spec: Dict[str, Any]) -> int:
+    try:
+        _resolve(spec[CALLABLE_KEY])(*spec.get("args") or [], **spec.get("kwargs") or {})
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+
+
+def _child_main(conn, preload: List[str]) -> None:
+    """Pool process: import preload once, then run tasks sent over conn until told to stop."""
+    for name in preload:
+        importlib.import_module(name)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        spec, out_path, err_path = task
+        # Redirect the file descriptors, not just sys.stdout, so output written by
+        # C extensions and child processes is captured too.
+        saved = (os.dup(1), os.dup(2))
+        out_fd = os.open(out_path, os.O_WRONLY | os.O_APPEND)
+        err_fd = os.open(err_path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.dup2(out_fd, 1)
+            os.dup2(err_fd, 2)
+            code = _call(spec)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved + (out_fd, err_fd):
+                os.close(fd)
+        conn.send((code, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+class _PoolProcess:
+    def __init__(self, ctx, preload: List[str]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_child_main, args=(child_conn, preload), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class CallablePool:
+    """Warm Python processes that run callable jobs without paying interpreter startup.
+
+    Processes are started lazily, up to `size`, and reused across jobs. One is replaced
+    after max_tasks jobs, when its peak RSS passes max_memory_mb (0 disables either), when a job times out
+    (it is killed) or when it dies. With the forkserver start method the modules in
+    `preload` are imported once in the server and inherited by every pool process.
+    """
+
+    def __init__(self, size: int = 1, max_tasks: int = 1000, max_memory_mb: int = 512,
+                 preload: Optional[List[str]] = None):
+        self.size = max(1, size)
+        self.max_tasks = max_tasks
+        self.max_memory_kb = max_memory_mb * 1024
+        self.preload = list(preload or [])
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods and self.preload:
+            self._ctx.set_forkserver_preload(self.preload)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._closed = False
+
+    def _acquire(self) -> _PoolProcess:
+        while True:
+            with self._lock:
+                if self._idle.empty() and self._started < self.size:
+                    self._started += 1
+                    break
+            proc = self._idle.get()
+            if proc is not None:
+                return proc
+            # None: a process was retired, so there may be room to start one.
+        try:
+            return _PoolProcess(self._ctx, self.preload)
+        except BaseException:
+            with self._lock:
+                self._started -= 1
+            raise
+
+    def _release(self, proc: _PoolProcess, retire: bool, kill: bool = False) -> None:
+        if not retire and not self._closed:
+            self._idle.put(proc)
+            return
+        proc.stop(kill=kill)
+        with self._lock:
+            self._started -= 1
+        self._idle.put(None)  # wake a caller blocked in _acquire
+
+    def run(self, spec: Dict[str, Any], timeout: Optional[float],
+            stdout_buf, stderr_buf) -> Tuple[int, bool]:
+        """Run spec in a pool process, copying its output into the buffers.
+
+        Returns (exit code, timed_out), like logcapture.run_process.
+        """
+        fd_out, out_path = tempfile.mkstemp(prefix="queuectl-", suffix=".stdout")
+        fd_err, err_path = tempfile.mkstemp(prefix="queuectl-", suffix=".stderr")
+        os.close(fd_out)
+        os.close(fd_err)
+        proc = self._acquire()
+        timed_out = False
+        try:
+            proc.conn.send((spec, out_path, err_path))
+            if proc.conn.poll(timeout):
+                code, maxrss_kb = proc.conn.recv()
+                proc.tasks += 1
+                retire = ((self.max_tasks and proc.tasks >= self.max_tasks)
+                          or (self.max_memory_kb and maxrss_kb > self.max_memory_kb))
+                self._release(proc, retire)
+            else:
+                timed_out = True
+                code = -2
+                self._release(proc, retire=True, kill=True)
+        except (EOFError, OSError):
+            # The process died mid-job (crash, os._exit, OOM kill).
+            proc.process.join(timeout=5)
+            code = proc.process.exitcode if proc.process.exitcode is not None else 1
+            self._release(proc, retire=True, kill=True)
+        try:
+            for path, buf in ((out_path, stdout_buf), (err_path, stderr_buf)):
+                with open(path, "rb") as f:
+                    for chunk in iter(lambda: f.read(64 * 1024), b""):
+                        buf.write(chunk)
+        finally:
+            os.unlink(out_path)
+            os.unlink(err_path)
+        return code, timed_out
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                proc = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if proc is not None:
+                proc.stop()
@@ -1,23 +1,95 @@
-from datetime import datetime
-from typing import Dict, Any, Optional, List
-from .storage import Storage
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Iterable, Iterator
+from .ids import ulid
+from .storage import Storage, DEFAULT_LEASE_SECONDS, DEFAULT_QUEUE
+from .notify import notify_workers
 
 class JobState:
     PENDING = "pending"
+    BLOCKED = "blocked"  # waiting for depends_on jobs to complete
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
     DEAD = "dead"
 
+# How long a dedupe_key blocks repeats when the payload gives no dedupe_window.
+DEFAULT_DEDUPE_WINDOW = 3600
+# How long a cached result is reused when the payload's cache gives no ttl.
+DEFAULT_CACHE_TTL = 3600
+
 class Queue:
-    def __init__(self, storage: Storage):
+    def __init__(self, storage: Storage, wakeup_dir: Optional[str] = None):
         self.storage = storage
+        self.wakeup_dir = wakeup_dir
 
-    def enqueue(self, payload: Dict[str, Any], max_retries: int = 3) -> Dict[str, Any]:
-        now = datetime.utcnow().isoformat()
-        job = {
-            "id": payload.get("id") or f"job-{datetime.utcnow().timestamp()}",
-            "command": payload["command"],
+    def notify(self) -> int:
+        """Wake idle workers so they claim new work immediately."""
+        return notify_workers(self.wakeup_dir)
+
+    @staticmethod
+    def validate_payload(payload: Any) -> None:
+        """Raise ValueError if payload cannot be enqueued."""
+        if not isinstance(payload, dict):
+            raise ValueError("payload must be a JSON object")
+        if "callable" in payload:
+            # Imported here: pyexec pulls in multiprocessing, which a command-only
+            # `queuectl enqueue` never needs.
+            from .pyexec import validate_callable
+            validate_callable(payload["callable"], payload.get("args"), payload.get("kwargs"))
+        else:
+            command = payload.get("command")
+            if not command or not isinstance(command, str):
+                raise ValueError("payload needs a non-empty 'command' or a 'callable'")
+        if payload.get("queue") is not None and (not isinstance(payload["queue"], str) or not payload["queue"]):
+            raise ValueError("'queue' must be a non-empty string")
+        deps = payload.get("depends_on")
+        if deps is not None and (not isinstance(deps, list)
+                                 or not all(isinstance(d, str) and d for d in deps)):
+            raise ValueError("'depends_on' must be a list of job ids")
+        if payload.get("dedupe_key") is not None and (not isinstance(payload["dedupe_key"], str)
+                                                       or not payload["dedupe_key"]):
+            raise ValueError("'dedupe_key' must be a non-empty string")
+        window = payload.get("dedupe_window")
+        if window is not None and (isinstance(window, bool) or not isinstance(window, (int, float))
+                                   or window <= 0):
+            raise ValueError("'dedupe_window' must be a positive number of seconds")
+        cache = payload.get("cache")
+        if cache is not None:
+            if not isinstance(cache, dict):
+                raise ValueError("'cache' must be an object like {\"key\": ..., \"ttl\": seconds}")
+            if cache.get("key") is not None and (not isinstance(cache["key"], str) or not cache["key"]):
+                raise ValueError("'cache.key' must be a non-empty string")
+            ttl = cache.get("ttl")
+            if ttl is not None and (isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or ttl <= 0):
+                raise ValueError("'cache.ttl' must be a positive number of seconds")
+        for key in ("priority", "timeout_seconds"):
+            if payload.get(key) is not None and not isinstance(payload[key], int):
+                raise ValueError(f"'{key}' must be an integer")
+
+    @classmethod
+    def build_job(cls, payload: Any, max_retries: int = 3) -> Dict[str, Any]:
+        """Validate an enqueue payload and turn it into a new pending job row."""
+        cls.validate_payload(payload)
+        created = datetime.utcnow()
+        now = created.isoformat()
+        if "callable" in payload:
+            from .pyexec import callable_command
+            command = callable_command(payload["callable"], payload.get("args"), payload.get("kwargs"))
+        else:
+            command = payload["command"]
+        window = payload.get("dedupe_window") or DEFAULT_DEDUPE_WINDOW
+        cache = payload.get("cache")
+        if cache is not None:
+            import hashlib  # loads OpenSSL; only cached jobs need it
+            # Without an explicit key, identical commands share results.
+            cache_key = cache.get("key") or "command:" + hashlib.sha256(command.encode("utf-8")).hexdigest()
+            cache_ttl = cache.get("ttl") or DEFAULT_CACHE_TTL
+        else:
+            cache_key = cache_ttl = None
+        return {
+            # ULIDs are unique and sort by creation time, so generated ids list in order.
+            "id": payload.get("id") or f"job-{ulid()}",
+            "command": command,
             "state": JobState.PENDING,
             "attempts": 0,
             "max_retries": max_retries,
@@ -27,15 +99,87 @@ class Queue:
             "run_at": payload.get("run_at"),
             "priority": payload.get("priority", 10),
             "timeout_seconds": payload.get("timeout_seconds"),
+            "queue": payload.get("queue") or DEFAULT_QUEUE,
+            "depends_on": payload.get("depends_on") or [],
+            "cache_key": cache_key,
+            "cache_ttl": cache_ttl,
+            "dedupe_key": payload.get("dedupe_key"),
+            "dedupe_expires_at": (created + timedelta(seconds=window)).isoformat(),
         }
-        self.storage.upsert_job(job)
+
+    def enqueue(self, payload: Dict[str, Any], max_retries: int = 3) -> Dict[str, Any]:
+        """Enqueue one job and return it with "status": "created" or "deduplicated".
+
+        A payload is deduplicated when its id belongs to a job that hasn't finished yet
+        (that job is left alone) or its dedupe_key was used within dedupe_window seconds;
+        "existing_id" then names the job that was kept.
+        """
+        job = self.build_job(payload, max_retries)
+        result = self.storage.insert_jobs([job])
+        if result["errors"]:
+            raise ValueError(result["errors"][job["id"]])
+        if not result["created"]:
+            job["status"] = "deduplicated"
+            job["existing_id"] = result["existing"].get(job["id"], job["id"])
+            return job
+        job["status"] = "created"
+        if job["depends_on"]:
+            stored = self.storage.get_job(job["id"])
+            job["state"], job["unmet_deps"] = stored["state"], stored["unmet_deps"]
+        if job["state"] == JobState.PENDING:
+            self.notify()
         return job
 
-    def fetch_next(self) -> Optional[Dict[str, Any]]:
-        return self.storage.fetch_next_pending()
+    def enqueue_many(self, payloads: Iterable[Dict[str, Any]], max_retries: int = 3,
+                     chunk_size: int = 1000) -> Dict[str, int]:
+        """Stream payloads into the queue, one transaction per chunk of chunk_size jobs.
+
+        Payloads should be checked with validate_payload first; an invalid one raises
+        ValueError after the preceding chunks are committed. Returns the "created" and
+        "deduplicated" counts, as for enqueue, and "errors": (job id, reason) for each
+        job rejected over its depends_on, which doesn't stop the others.
+        """
+        total = {"created": 0, "deduplicated": 0, "errors": []}
+        chunk = []
+        for payload in payloads:
+            chunk.append(self.build_job(payload, max_retries))
+            if len(chunk) >= chunk_size:
+                self._insert_chunk(chunk, total)
+                chunk = []
+        if chunk:
+            self._insert_chunk(chunk, total)
+        return total
+
+    def _insert_chunk(self, chunk: List[Dict[str, Any]], total: Dict[str, int]) -> None:
+        result = self.storage.insert_jobs(chunk)
+        total["created"] += result["created"]
+        total["deduplicated"] += result["deduplicated"]
+        total["errors"].extend(result["errors"].items())
+        if result["created"]:
+            self.notify()
+
+    def fetch_next(self, worker_id: Optional[str] = None,
+                   lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                   queues: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        return self.storage.fetch_next_pending(worker_id, lease_seconds, queues)
+
+    def fetch_batch(self, limit: int, worker_id: Optional[str] = None,
+                    lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                    queues: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return self.storage.fetch_pending_batch(limit, worker_id, lease_seconds, queues)
+
+    def release(self, job_ids: List[str], worker_id: Optional[str] = None) -> int:
+        return self.storage.release_jobs(job_ids, worker_id)
 
     def update(self, job: Dict[str, Any]) -> None:
         self.storage.update_job(job)
 
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.storage.get_job(job_id)
+
     def list(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
         return self.storage.list_jobs(state)
+
+    def iter(self, **filters) -> Iterator[Dict[str, Any]]:
+        """Stream jobs page by page; see Storage.iter_jobs for the filters."""
+        return self.storage.iter_jobs(**filters)
@@ -0,0 +1,316 @@
+import heapq
+import itertools
+import os
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+from .storage import Storage, DEFAULT_LEASE_SECONDS, summarize_runtimes
+
+
+def shard_paths(db_path: str, count: int) -> List[str]:
+    """Shard 0 is db_path itself, so a single-shard setup is the plain database."""
+    root, ext = os.path.splitext(db_path)
+    return [db_path] + [f"{root}.shard{i}{ext or '.db'}" for i in range(1, count)]
+
+
+def shard_index(key: str, count: int) -> int:
+    # crc32 rather than hash(): it must agree across processes and restarts.
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+class ShardedStorage:
+    """Storage spread over several SQLite files, each with its own write lock.
+
+    A job lives in the shard picked by a hash of its id, and everything keyed by job id
+    (updates, logs, metrics, DLQ) goes to that shard. Claims go to the shard holding the
+    most urgent priority that is due, preferring the `home` shard on ties. Listings and counts fan out
+    and merge. The shard count must not change while the files hold jobs.
+    """
+
+    def __init__(self, db_path: str, shards: int, home: int = 0, **pragmas):
+        self.shards = [Storage(path, **pragmas) for path in shard_paths(db_path, max(1, shards))]
+        self.home = home % len(self.shards)
+
+    def shard_for(self, job_id: str) -> Storage:
+        return self.shards[shard_index(job_id, len(self.shards))]
+
+    def _claim_order(self) -> List[Storage]:
+        return self.shards[self.home:] + self.shards[:self.home]
+
+    def close(self) -> None:
+        for shard in self.shards:
+            shard.close()
+
+    # --- writes, routed by job id ---
+
+    def upsert_job(self, job: Dict[str, Any]) -> None:
+        self.upsert_jobs([job])
+
+    def upsert_jobs(self, jobs: List[Dict[str, Any]]) -> int:
+        # Dependency bookkeeping is per file (triggers), and a job and its dependencies
+        # would usually hash to different shards.
+        if any(job.get("depends_on") for job in jobs):
+            raise ValueError("depends_on is not supported with SHARDS > 1")
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for job in jobs:
+            by_shard.setdefault(shard_index(job["id"], len(self.shards)), []).append(job)
+        return sum(self.shards[i].upsert_jobs(chunk) for i, chunk in by_shard.items())
+
+    def insert_jobs(self, jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        errors = {job["id"]: "depends_on is not supported with SHARDS > 1"
+                  for job in jobs if job.get("depends_on")}
+        jobs = [job for job in jobs if job["id"] not in errors]
+        # Dedupe keys aren't job ids, so they all live in shard 0. A claim is dropped
+        # again if its job turns out to be a duplicate id in its own shard.
+        existing = {}
+        created = 0
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for job in jobs:
+            i = shard_index(job["id"], len(self.shards))
+            if not job.get("dedupe_key"):
+                by_shard.setdefault(i, []).append(job)
+                continue
+            owner = self.shards[0].claim_dedupe_key(job["dedupe_key"], job["id"],
+                                                    job["dedupe_expires_at"])
+            if owner is not None:
+                existing[job["id"]] = owner
+                continue
+            written = self.shards[i].insert_jobs([dict(job, dedupe_key=None)])["created"]
+            if not written:
+                self.shards[0].release_dedupe_key(job["dedupe_key"], job["id"])
+            created += written
+        created += sum(self.shards[i].insert_jobs(chunk)["created"] for i, chunk in by_shard.items())
+        return {"created": created, "deduplicated": len(jobs) - created, "existing": existing,
+                "errors": errors}
+
+    def purge_dedupe_keys(self) -> int:
+        return self.shards[0].purge_dedupe_keys()
+
+    # --- result cache, routed by cache key ---
+
+    def cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.shard_for(key).cache_get(key)
+
+    def cache_put(self, key: str, exit_code: int, stdout, stderr, encoding: Optional[str],
+                  runtime_seconds: float, ttl: float, max_bytes: int) -> int:
+        # Each shard holds an even part of the size budget.
+        return self.shard_for(key).cache_put(key, exit_code, stdout, stderr, encoding,
+                                             runtime_seconds, ttl, max_bytes // len(self.shards))
+
+    def purge_result_cache(self) -> int:
+        return sum(shard.purge_result_cache() for shard in self.shards)
+
+    def cache_stats(self) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for shard in self.shards:
+            for key, n in shard.cache_stats().items():
+                total[key] = total.get(key, 0) + n
+        return total
+
+    def update_job(self, job: Dict[str, Any], owner: Optional[str] = None) -> bool:
+        return self.shard_for(job["id"]).update_job(job, owner)
+
+    def record_outcome(self, job: Dict[str, Any], log=None, runtime_seconds: Optional[float] = None,
+                       dead_error: Optional[str] = None, owner: Optional[str] = None) -> bool:
+        return self.shard_for(job["id"]).record_outcome(job, log, runtime_seconds, dead_error, owner)
+
+    def record_outcomes(self, outcomes: List[Dict[str, Any]]) -> List[str]:
+        by_shard: Dict[int, List[Dict[str, Any]]] = {}
+        for outcome in outcomes:
+            by_shard.setdefault(shard_index(outcome["job"]["id"], len(self.shards)), []).append(outcome)
+        dropped: List[str] = []
+        for i, chunk in by_shard.items():
+            dropped.extend(self.shards[i].record_outcomes(chunk))
+        return dropped
+
+    def delete_job(self, job_id: str) -> None:
+        self.shard_for(job_id).delete_job(job_id)
+
+    def move_to_dlq(self, job: Dict[str, Any], last_error: str, owner: Optional[str] = None) -> bool:
+        return self.shard_for(job["id"]).move_to_dlq(job, last_error, owner)
+
+    def retry_dlq_item(self, dlq_job_id: str, default_max_retries: int = 3) -> Dict[str, int]:
+        return self.shard_for(dlq_job_id).retry_dlq_item(dlq_job_id, default_max_retries)
+
+    def retry_dlq(self, default_max_retries: int = 3, **match) -> Dict[str, int]:
+        # One transaction per shard: each file has its own write lock.
+        total = {"retried": 0, "skipped": 0}
+        for shard in self.shards:
+            for key, n in shard.retry_dlq(default_max_retries, **match).items():
+                total[key] += n
+        return total
+
+    def purge_dlq_matching(self, **match) -> int:
+        return sum(shard.purge_dlq_matching(**match) for shard in self.shards)
+
+    def insert_job_log(self, job_id: str, stdout, stderr, encoding: Optional[str] = None):
+        self.shard_for(job_id).insert_job_log(job_id, stdout, stderr, encoding)
+
+    def insert_job_metric(self, job_id: str, runtime_seconds: float):
+        self.shard_for(job_id).insert_job_metric(job_id, runtime_seconds)
+
+    # --- claims ---
+
+    def fetch_next_pending(self, worker_id: Optional[str] = None,
+                           lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                           queues: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        jobs = self.fetch_pending_batch(1, worker_id, lease_seconds, queues)
+        return jobs[0] if jobs else None
+
+    def fetch_pending_batch(self, limit: int, worker_id: Optional[str] = None,
+                            lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                            queues: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if len(self.shards) == 1:
+            return self.shards[0].fetch_pending_batch(limit, worker_id, lease_seconds, queues)
+        # Priority is global: read every shard's best due priority, then claim from the
+        # best shard. Ties go to the shard nearest home, so workers stay spread over the
+        # write locks; creation order within a priority is therefore per shard. Reads
+        # only, so an idle worker doesn't take every shard's write lock to find nothing.
+        ranked = []
+        for order, shard in enumerate(self._claim_order()):
+            best = shard.best_ready_priority(queues)
+            if best is not None:
+                ranked.append((best, order, shard))
+        for _, _, shard in sorted(ranked, key=lambda r: r[:2]):
+            jobs = shard.fetch_pending_batch(limit, worker_id, lease_seconds, queues)
+            if jobs:
+                return jobs
+        return []
+
+    def configure_queue(self, name: str, **settings) -> None:
+        # Queue limits and fair-share state are kept, and enforced, per shard file.
+        for shard in self.shards:
+            shard.configure_queue(name, **settings)
+
+    def list_queues(self) -> List[Dict[str, Any]]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for shard in self.shards:
+            for row in shard.list_queues():
+                if row["name"] in merged:
+                    merged[row["name"]]["pending"] += row["pending"]
+                    merged[row["name"]]["processing"] += row["processing"]
+                else:
+                    merged[row["name"]] = row
+        return [merged[name] for name in sorted(merged)]
+
+    def next_run_at(self) -> Optional[str]:
+        due = [t for t in (shard.next_run_at() for shard in self.shards) if t]
+        return min(due) if due else None
+
+    def release_jobs(self, job_ids: List[str], worker_id: Optional[str] = None) -> int:
+        by_shard: Dict[int, List[str]] = {}
+        for job_id in job_ids:
+            by_shard.setdefault(shard_index(job_id, len(self.shards)), []).append(job_id)
+        return sum(self.shards[i].release_jobs(ids, worker_id) for i, ids in by_shard.items())
+
+    def renew_leases(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        return sum(shard.renew_leases(worker_id, lease_seconds) for shard in self.shards)
+
+    def reclaim_expired(self, default_max_retries: int = 3, limit: int = 500) -> Dict[str, int]:
+        total = {"requeued": 0, "dead": 0}
+        for shard in self.shards:
+            for key, n in shard.reclaim_expired(default_max_retries, limit).items():
+                total[key] += n
+        return total
+
+    # --- reads ---
+
+    def dag(self, job_id: str, max_nodes: int = 10000) -> List[Dict[str, Any]]:
+        return self.shard_for(job_id).dag(job_id, max_nodes)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.shard_for(job_id).get_job(job_id)
+
+    def iter_jobs(self, state: Optional[str] = None, limit: Optional[int] = None,
+                  **filters) -> Iterator[Dict[str, Any]]:
+        """Every shard's iter_jobs merged in id order, so pagination by id still works."""
+        merged = heapq.merge(*(shard.iter_jobs(state, limit, **filters) for shard in self.shards),
+                             key=lambda job: job["id"])
+        return itertools.islice(merged, limit)
+
+    def list_jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        return list(self.iter_jobs(state=state))
+
+    def iter_dlq(self, limit: Optional[int] = None, **filters) -> Iterator[Dict[str, Any]]:
+        merged = heapq.merge(*(shard.iter_dlq(limit=limit, **filters) for shard in self.shards),
+                             key=lambda item: item["id"])
+        return itertools.islice(merged, limit)
+
+    def load_dlq(self) -> List[Dict[str, Any]]:
+        return list(self.iter_dlq())
+
+    def count_dlq(self, **match) -> int:
+        return sum(shard.count_dlq(**match) for shard in self.shards)
+
+    def dlq_stats(self) -> List[Dict[str, Any]]:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for shard in self.shards:
+            for row in shard.dlq_stats():
+                into = merged.setdefault(row["error_class"], dict(row, count=0))
+                into["count"] += row["count"]
+                into["oldest"] = min(into["oldest"], row["oldest"])
+                into["newest"] = max(into["newest"], row["newest"])
+        return sorted(merged.values(), key=lambda row: (-row["count"], row["error_class"]))
+
+    def iter_job_logs(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        return self.shard_for(job_id).iter_job_logs(job_id)
+
+    def get_job_logs(self, job_id: str) -> List[Dict[str, Any]]:
+        return self.shard_for(job_id).get_job_logs(job_id)
+
+    def get_job_metrics(self, job_id: str) -> List[Dict[str, Any]]:
+        return self.shard_for(job_id).get_job_metrics(job_id)
+
+    def count_ready(self) -> int:
+        return sum(shard.count_ready() for shard in self.shards)
+
+    def count_by_state(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for shard in self.shards:
+            for state, n in shard.count_by_state().items():
+                counts[state] = counts.get(state, 0) + n
+        return counts
+
+    def runtime_histogram(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        if job_id:
+            return self.shard_for(job_id).runtime_histogram(job_id)
+        total = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        buckets: Dict[float, int] = {}
+        for shard in self.shards:
+            hist = shard.runtime_histogram()
+            total["count"] += hist["count"]
+            total["total_seconds"] += hist["total_seconds"]
+            total["max_seconds"] = max(total["max_seconds"], hist["max_seconds"])
+            for upper, n in hist["buckets"]:
+                buckets[upper] = buckets.get(upper, 0) + n
+        total["buckets"] = sorted(buckets.items())
+        return total
+
+    def runtime_summary(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        return summarize_runtimes(self.runtime_histogram(job_id))
+
+    def throughput(self, minutes: int = 60) -> List[Dict[str, Any]]:
+        rows: Dict[str, Dict[str, Any]] = {}
+        for shard in self.shards:
+            for row in shard.throughput(minutes):
+                merged = rows.setdefault(row["minute"], dict(row, runs=0, completed=0, dead=0))
+                for key in ("runs", "completed", "dead"):
+                    merged[key] += row[key]
+        return [rows[minute] for minute in sorted(rows)]
+
+    # --- retention: the janitor drains each shard in turn (see Janitor.run_once) ---
+
+    def completed_cutoff_for_keep(self, keep: int) -> Optional[str]:
+        newest = heapq.merge(*(shard.completed_updated_desc(keep) for shard in self.shards),
+                             reverse=True)
+        return next(itertools.islice(newest, keep - 1, None), None)
+
+    def compact(self, checkpoint: str = "PASSIVE", vacuum_pages: int = 1000) -> Dict[str, int]:
+        total: Dict[str, int] = {}
+        for shard in self.shards:
+            for key, n in shard.compact(checkpoint, vacuum_pages).items():
+                total[key] = total.get(key, 0) + n
+        return total
+
+    def vacuum(self) -> None:
+        for shard in self.shards:
+            shard.vacuum()
@@ -1,7 +1,13 @@
+import math
+import os
 import sqlite3
 import threading
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from .logcapture import read_output, ENCODING_GZIP_FILE
+from .telemetry import TELEMETRY
 
 DB_SCHEMA = """
 CREATE TABLE IF NOT EXISTS jobs (
@@ -41,26 +47,447 @@ CREATE TABLE IF NOT EXISTS job_metrics (
 );
 """
 
+# error_class of a DLQ row, from the last_error texts written by Worker and reclaim_expired.
+ERROR_CLASS_SQL = """CASE
+    WHEN last_error IS NULL THEN 'unknown'
+    WHEN last_error LIKE 'Exit code %' THEN 'exit_' || CAST(substr(last_error, 11) AS INTEGER)
+    WHEN last_error = 'Process timed out' THEN 'timeout'
+    WHEN last_error LIKE 'Terminated by signal %' THEN 'signal_' || CAST(substr(last_error, 22) AS INTEGER)
+    WHEN last_error LIKE 'Lease expired%' THEN 'lease_expired'
+    WHEN last_error LIKE 'Dependency % failed' THEN 'dependency_failed'
+    ELSE 'other'
+END"""
+
+# Recompute job_deps.satisfied for the edges of the jobs selected by {jobs}. An edge is
+# unmet while its dependency is live and not completed, or in the DLQ; a dependency
+# that is gone was purged by gc, which only removes completed jobs.
+SATISFY_DEPS_SQL = """
+    UPDATE job_deps SET satisfied = NOT (
+        EXISTS (SELECT 1 FROM jobs j WHERE j.id = job_deps.depends_on AND j.state != 'completed')
+        OR EXISTS (SELECT 1 FROM dlq q WHERE q.id = job_deps.depends_on))
+    WHERE job_id IN ({jobs})
+"""
+
+# Schema changes on top of DB_SCHEMA, applied in order by _init_db. PRAGMA user_version
+# records the last version applied, so each migration runs once per database file.
+MIGRATIONS = [
+    (1, [
+        "ALTER TABLE jobs ADD COLUMN worker_id TEXT",
+    ]),
+    (2, [
+        # Ready queue: partial index over pending rows in claim order, covering run_at.
+        "CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(priority, created_at, run_at) WHERE state = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_job_logs_job ON job_logs(job_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_job_metrics_job ON job_metrics(job_id, runtime_seconds)",
+    ]),
+    (3, [
+        # Scheduled (future run_at) jobs, so idle workers can find the next due time cheaply.
+        "CREATE INDEX IF NOT EXISTS idx_jobs_scheduled ON jobs(run_at) WHERE state = 'pending' AND run_at IS NOT NULL",
+    ]),
+    (4, [
+        # How stdout/stderr are stored; see queuectl.core.logcapture. NULL = plain text.
+        "ALTER TABLE job_logs ADD COLUMN encoding TEXT",
+    ]),
+    (5, [
+        # Rollups maintained by triggers so status/stats read O(1) rows however large
+        # jobs and job_metrics grow. The dlq is counted under the 'dead' state.
+        "CREATE TABLE IF NOT EXISTS job_state_counts (state TEXT PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID",
+        "INSERT INTO job_state_counts (state, count) SELECT state, COUNT(*) FROM jobs GROUP BY state",
+        "INSERT INTO job_state_counts (state, count) SELECT 'dead', COUNT(*) FROM dlq",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_count_insert AFTER INSERT ON jobs BEGIN
+            INSERT INTO job_state_counts (state, count) VALUES (NEW.state, 1)
+                ON CONFLICT(state) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_count_delete AFTER DELETE ON jobs BEGIN
+            UPDATE job_state_counts SET count = count - 1 WHERE state = OLD.state;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_count_update AFTER UPDATE OF state ON jobs
+        WHEN NEW.state IS NOT OLD.state BEGIN
+            UPDATE job_state_counts SET count = count - 1 WHERE state = OLD.state;
+            INSERT INTO job_state_counts (state, count) VALUES (NEW.state, 1)
+                ON CONFLICT(state) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_dlq_count_insert AFTER INSERT ON dlq BEGIN
+            INSERT INTO job_state_counts (state, count) VALUES ('dead', 1)
+                ON CONFLICT(state) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_dlq_count_delete AFTER DELETE ON dlq BEGIN
+            UPDATE job_state_counts SET count = count - 1 WHERE state = 'dead';
+        END""",
+
+        # Runtime count/total/max per job_id, with job_id '' holding the global totals,
+        # plus a fixed log-scale histogram for percentiles.
+        """CREATE TABLE IF NOT EXISTS runtime_stats (
+            job_id TEXT PRIMARY KEY, count INTEGER NOT NULL,
+            total_seconds REAL NOT NULL, max_seconds REAL NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE TABLE IF NOT EXISTS runtime_buckets (bucket INTEGER PRIMARY KEY, upper_seconds REAL NOT NULL)",
+        """INSERT OR IGNORE INTO runtime_buckets (bucket, upper_seconds) VALUES
+            (0, 0.001), (1, 0.0025), (2, 0.005), (3, 0.01), (4, 0.025), (5, 0.05), (6, 0.1),
+            (7, 0.25), (8, 0.5), (9, 1), (10, 2.5), (11, 5), (12, 10), (13, 25), (14, 50),
+            (15, 100), (16, 250), (17, 500), (18, 1000), (19, 2500), (20, 9e999)""",
+        """CREATE TABLE IF NOT EXISTS runtime_histogram (
+            job_id TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL,
+            PRIMARY KEY (job_id, bucket)
+        ) WITHOUT ROWID""",
+        """INSERT INTO runtime_stats (job_id, count, total_seconds, max_seconds)
+            SELECT job_id, COUNT(*), SUM(runtime_seconds), MAX(runtime_seconds) FROM job_metrics GROUP BY job_id
+            UNION ALL
+            SELECT '', COUNT(*), COALESCE(SUM(runtime_seconds), 0), COALESCE(MAX(runtime_seconds), 0) FROM job_metrics""",
+        """INSERT INTO runtime_histogram (job_id, bucket, count)
+            SELECT scope, bucket, COUNT(*) FROM (
+                SELECT CASE g.global WHEN 1 THEN '' ELSE m.job_id END AS scope,
+                    (SELECT MIN(bucket) FROM runtime_buckets WHERE upper_seconds >= m.runtime_seconds) AS bucket
+                FROM job_metrics m CROSS JOIN (SELECT 0 AS global UNION ALL SELECT 1) g
+            ) GROUP BY scope, bucket""",
+        # Per-minute (UTC) counters of executions, completions and DLQ moves.
+        """CREATE TABLE IF NOT EXISTS throughput (
+            minute TEXT PRIMARY KEY, runs INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0, dead INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID""",
+        """CREATE TRIGGER IF NOT EXISTS trg_job_metrics_rollup AFTER INSERT ON job_metrics BEGIN
+            INSERT INTO runtime_stats (job_id, count, total_seconds, max_seconds)
+                VALUES (NEW.job_id, 1, NEW.runtime_seconds, NEW.runtime_seconds),
+                       ('', 1, NEW.runtime_seconds, NEW.runtime_seconds)
+                ON CONFLICT(job_id) DO UPDATE SET count = count + 1,
+                    total_seconds = total_seconds + excluded.total_seconds,
+                    max_seconds = MAX(max_seconds, excluded.max_seconds);
+            INSERT INTO runtime_histogram (job_id, bucket, count)
+                SELECT scope.job_id, b.bucket, 1
+                FROM (SELECT NEW.job_id AS job_id UNION ALL SELECT '') AS scope,
+                     (SELECT MIN(bucket) AS bucket FROM runtime_buckets
+                      WHERE upper_seconds >= NEW.runtime_seconds) AS b
+                WHERE true
+                ON CONFLICT(job_id, bucket) DO UPDATE SET count = count + 1;
+            INSERT INTO throughput (minute, runs) VALUES (strftime('%Y-%m-%dT%H:%M', 'now'), 1)
+                ON CONFLICT(minute) DO UPDATE SET runs = runs + 1;
+        END""",
+
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_throughput_completed AFTER UPDATE OF state ON jobs
+        WHEN NEW.state = 'completed' AND OLD.state IS NOT 'completed' BEGIN
+            INSERT INTO throughput (minute, completed) VALUES (strftime('%Y-%m-%dT%H:%M', 'now'), 1)
+                ON CONFLICT(minute) DO UPDATE SET completed = completed + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_dlq_throughput AFTER INSERT ON dlq BEGIN
+            INSERT INTO throughput (minute, dead) VALUES (strftime('%Y-%m-%dT%H:%M', 'now'), 1)
+                ON CONFLICT(minute) DO UPDATE SET dead = dead + 1;
+        END""",
+    ]),
+    (6, [
+        # Keyset pagination of `list --state`: walk one state's rows in id order.
+        "CREATE INDEX IF NOT EXISTS idx_jobs_state_id ON jobs(state, id)",
+    ]),
+    (7, [
+        # Retention: oldest completed jobs / DLQ entries first.
+        "CREATE INDEX IF NOT EXISTS idx_jobs_completed ON jobs(updated_at) WHERE state = 'completed'",
+        "CREATE INDEX IF NOT EXISTS idx_dlq_created ON dlq(created_at)",
+    ]),
+    (8, [
+        # Claim leases: a worker renews lease_expires_at while it holds a job; rows whose
+        # lease lapsed are found through the partial index and re-queued.
+        "ALTER TABLE jobs ADD COLUMN lease_expires_at TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(lease_expires_at) WHERE state = 'processing'",
+        # Claims made before leases existed have no heartbeat behind them: expire them now.
+        "UPDATE jobs SET lease_expires_at = updated_at WHERE state = 'processing' AND lease_expires_at IS NULL",
+    ]),
+    (9, [
+        # Named queues. Every queue that has held a job has a row in `queues` with its
+        # limits (NULL = unlimited) and fair-share state; see Storage._pick_queue.
+        "ALTER TABLE jobs ADD COLUMN queue TEXT NOT NULL DEFAULT 'default'",
+        "ALTER TABLE dlq ADD COLUMN queue TEXT NOT NULL DEFAULT 'default'",
+        # Claims now always look within one queue.
+        "DROP INDEX IF EXISTS idx_jobs_ready",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_queue_ready ON jobs(queue, priority, created_at, run_at) WHERE state = 'pending'",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_in_flight ON jobs(queue) WHERE state = 'processing'",
+        """CREATE TABLE IF NOT EXISTS queues (
+            name TEXT PRIMARY KEY,
+            weight REAL NOT NULL DEFAULT 1,
+            max_in_flight INTEGER,
+            rate REAL,            -- token bucket refill, jobs per second
+            burst REAL,           -- token bucket capacity; NULL = max(1, rate)
+            tokens REAL,          -- NULL = full
+            tokens_at REAL,       -- unix time tokens was last computed
+            pass REAL NOT NULL DEFAULT 0  -- stride scheduling: virtual time consumed
+        ) WITHOUT ROWID""",
+        "CREATE TABLE IF NOT EXISTS queue_clock (id INTEGER PRIMARY KEY CHECK (id = 0), vtime REAL NOT NULL)",
+        "INSERT OR IGNORE INTO queue_clock (id, vtime) VALUES (0, 0)",
+        "INSERT OR IGNORE INTO queues (name) SELECT DISTINCT queue FROM jobs",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_queue_insert AFTER INSERT ON jobs BEGIN
+            INSERT OR IGNORE INTO queues (name) VALUES (NEW.queue);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_queue_update AFTER UPDATE OF queue ON jobs
+        WHEN NEW.queue IS NOT OLD.queue BEGIN
+            INSERT OR IGNORE INTO queues (name) VALUES (NEW.queue);
+        END""",
+    ]),
+    (10, [
+        # Dependencies. A job with unmet dependencies waits in state 'blocked' and is
+        # invisible to claims; completing a job decrements its dependents' unmet_deps
+        # through the (depends_on, job_id) key and releases those that reach zero.
+        "ALTER TABLE jobs ADD COLUMN unmet_deps INTEGER NOT NULL DEFAULT 0",
+        """CREATE TABLE IF NOT EXISTS job_deps (
+            depends_on TEXT NOT NULL, job_id TEXT NOT NULL,
+            PRIMARY KEY (depends_on, job_id)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_job_deps_job ON job_deps(job_id)",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_deps_completed AFTER UPDATE OF state ON jobs
+        WHEN NEW.state = 'completed' AND OLD.state IS NOT 'completed' BEGIN
+            UPDATE jobs SET unmet_deps = unmet_deps - 1,
+                state = CASE WHEN unmet_deps = 1 AND state = 'blocked' THEN 'pending' ELSE state END
+            WHERE id IN (SELECT job_id FROM job_deps WHERE depends_on = NEW.id) AND unmet_deps > 0;
+        END""",
+    ]),
+    (11, [
+        # Idempotent enqueue: the first job to claim a dedupe key owns it until expires_at;
+        # the primary key turns a repeat within the window into a no-op insert.
+        """CREATE TABLE IF NOT EXISTS dedupe_keys (
+            key TEXT PRIMARY KEY, job_id TEXT NOT NULL, expires_at TEXT NOT NULL
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_dedupe_keys_expires ON dedupe_keys(expires_at)",
+    ]),
+    (12, [
+        # Result memoization. A job enqueued with a cache key completes from result_cache
+        # when an unexpired entry exists. Entries are evicted by expiry, then least
+        # recently used first while the total size is over the limit; the single
+        # result_cache_stats row keeps the running size and hit/miss counters.
+        "ALTER TABLE jobs ADD COLUMN cache_key TEXT",
+        "ALTER TABLE jobs ADD COLUMN cache_ttl REAL",
+        """CREATE TABLE IF NOT EXISTS result_cache (
+            key TEXT PRIMARY KEY, exit_code INTEGER NOT NULL, stdout BLOB, stderr BLOB,
+            encoding TEXT, runtime_seconds REAL NOT NULL, size INTEGER NOT NULL,
+            created_at TEXT NOT NULL, expires_at TEXT NOT NULL, used_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_result_cache_expires ON result_cache(expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_result_cache_used ON result_cache(used_at)",
+        """CREATE TABLE IF NOT EXISTS result_cache_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            entries INTEGER NOT NULL DEFAULT 0, bytes INTEGER NOT NULL DEFAULT 0,
+            hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0,
+            evictions INTEGER NOT NULL DEFAULT 0
+        )""",
+        "INSERT OR IGNORE INTO result_cache_stats (id) VALUES (0)",
+        """CREATE TRIGGER IF NOT EXISTS trg_result_cache_insert AFTER INSERT ON result_cache BEGIN
+            UPDATE result_cache_stats SET entries = entries + 1, bytes = bytes + NEW.size WHERE id = 0;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_result_cache_update AFTER UPDATE OF size ON result_cache BEGIN
+            UPDATE result_cache_stats SET bytes = bytes + NEW.size - OLD.size WHERE id = 0;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_result_cache_delete AFTER DELETE ON result_cache BEGIN
+            UPDATE result_cache_stats SET entries = entries - 1, bytes = bytes - OLD.size,
+                evictions = evictions + 1 WHERE id = 0;
+        END""",
+    ]),
+    (13, [
+        # Dead jobs keep the settings they were enqueued with, so a retry restores them.
+        "ALTER TABLE dlq ADD COLUMN max_retries INTEGER",
+        "ALTER TABLE dlq ADD COLUMN priority INTEGER",
+        "ALTER TABLE dlq ADD COLUMN timeout_seconds INTEGER",
+        # Failure kind derived from last_error (exit_<code>, timeout, signal_<n>, ...), for
+        # `dlq stats` and bulk retry/purge filters. Virtual, so existing rows get it too.
+        f"ALTER TABLE dlq ADD COLUMN error_class TEXT GENERATED ALWAYS AS ({ERROR_CLASS_SQL}) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_dlq_error_class ON dlq(error_class, created_at)",
+    ]),
+    (14, [
+        # When a job was buried; created_at is when it was first enqueued. DLQ retention
+        # ages entries by this. Rows buried earlier only have created_at to go on.
+        "ALTER TABLE dlq ADD COLUMN dead_at TEXT",
+        "UPDATE dlq SET dead_at = created_at WHERE dead_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_dlq_dead ON dlq(dead_at)",
+    ]),
+    (15, [
+        # `dlq stats` reports each class's oldest/newest burial from the index alone.
+        "DROP INDEX IF EXISTS idx_dlq_error_class",
+        "CREATE INDEX IF NOT EXISTS idx_dlq_error_class ON dlq(error_class, dead_at)",
+    ]),
+    (16, [
+        # Each edge counts against unmet_deps once: a dependency that is re-enqueued and
+        # completes again must not release its dependents a second time.
+        "ALTER TABLE job_deps ADD COLUMN satisfied INTEGER NOT NULL DEFAULT 0",
+        SATISFY_DEPS_SQL.format(jobs="SELECT job_id FROM job_deps"),
+        "DROP TRIGGER IF EXISTS trg_jobs_deps_completed",
+        """CREATE TRIGGER IF NOT EXISTS trg_jobs_deps_completed AFTER UPDATE OF state ON jobs
+        WHEN NEW.state = 'completed' AND OLD.state IS NOT 'completed' BEGIN
+            UPDATE jobs SET unmet_deps = unmet_deps - 1,
+                state = CASE WHEN unmet_deps = 1 AND state = 'blocked' THEN 'pending' ELSE state END
+            WHERE id IN (SELECT job_id FROM job_deps WHERE depends_on = NEW.id AND NOT satisfied)
+                AND unmet_deps > 0;
+            UPDATE job_deps SET satisfied = 1 WHERE depends_on = NEW.id AND NOT satisfied;
+        END""",
+    ]),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_QUEUE = "default"
+QUEUE_SETTINGS = ("weight", "max_in_flight", "rate", "burst")
+
+JOB_COLUMNS = (
+    "id", "command", "state", "attempts", "max_retries", "created_at", "updated_at",
+    "last_error", "run_at", "priority", "timeout_seconds", "worker_id", "lease_expires_at",
+    "queue", "unmet_deps", "cache_key", "cache_ttl",
+)
+JOB_SELECT = ", ".join(JOB_COLUMNS)
+DLQ_COLUMNS = ("id", "command", "attempts", "created_at", "last_error", "queue",
+               "max_retries", "priority", "timeout_seconds", "error_class", "dead_at")
+DLQ_SELECT = ", ".join(DLQ_COLUMNS)
+
+
+def _job_from_row(row) -> Dict[str, Any]:
+    return dict(zip(JOB_COLUMNS, row))
+
+
+def summarize_runtimes(hist: Dict[str, Any]) -> Dict[str, Any]:
+    """count/avg/max plus p50/p95/p99 from a runtime_histogram() result.
+
+    Percentiles are the upper bound of the histogram bucket holding that rank
+    (never above the observed max), so they are approximate by design.
+    """
+    count = hist["count"]
+    summary = {
+        "count": count,
+        "avg": hist["total_seconds"] / count if count else 0.0,
+        "max": hist["max_seconds"],
+    }
+    for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        rank = max(1, math.ceil(q * count))
+        seen = 0
+        value = 0.0
+        for upper, n in hist["buckets"]:
+            seen += n
+            if seen >= rank:
+                value = min(upper, hist["max_seconds"])
+                break
+        summary[name] = value if count else 0.0
+    return summary
+
+
+def _refill(rate: float, burst: Optional[float], tokens: Optional[float],
+            tokens_at: Optional[float], clock: float) -> float:
+    """Token bucket level at `clock` for a queue limited to `rate` jobs per second."""
+    capacity = burst if burst is not None else max(1.0, rate)
+    if tokens is None or tokens_at is None:
+        return capacity
+    return min(capacity, tokens + (clock - tokens_at) * rate)
+
+
 class Storage:
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, synchronous: str = "NORMAL", busy_timeout: int = 5000,
+                 cache_size: int = -16000, mmap_size: int = 268435456, readonly: bool = False):
         self._db_path = db_path
-        self._lock = threading.Lock()
+        # Read-only connections (mode=ro) for CLI commands that only look; any write raises.
+        self._readonly = readonly
+        self._pragmas = {
+            "synchronous": synchronous,
+            "busy_timeout": busy_timeout,
+            "cache_size": cache_size,
+            "mmap_size": mmap_size,
+        }
+        self._local = threading.local()
         self._init_db()
 
-    def _conn(self):
-        return sqlite3.connect(self._db_path, check_same_thread=False)
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are opened explicitly by _write().
+        if self._readonly:
+            path = os.path.abspath(self._db_path).replace("%", "%25").replace("?", "%3f").replace("#", "%23")
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True,
+                                   isolation_level=None, check_same_thread=False,
+                                   timeout=self._pragmas["busy_timeout"] / 1000.0)
+            for name in ("busy_timeout", "cache_size", "mmap_size"):
+                conn.execute(f"PRAGMA {name}={self._pragmas[name]}")
+            return conn
+        conn = sqlite3.connect(self._db_path, isolation_level=None,
+                               check_same_thread=False, cached_statements=256,
+                               timeout=self._pragmas["busy_timeout"] / 1000.0)
+        # WAL persists in the file, so only a new database needs these, and setting them
+        # on an existing one would wait behind any writer.
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            # Only takes effect on a brand-new file (or after `gc --vacuum`); lets the janitor
+            # return freed pages to the OS with incremental_vacuum instead of a full VACUUM.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+        for name, value in self._pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        return conn
 
-    def _init_db(self):
-        with self._conn() as conn:
-            conn.executescript(DB_SCHEMA)
+    def _conn(self) -> sqlite3.Connection:
+        # One long-lived connection per thread; a forked child must not reuse its parent's.
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            local.conn = self._connect()
+            local.pid = os.getpid()
+        return local.conn
+
+    @contextmanager
+    def _write(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers wait on
+        # busy_timeout instead of failing on a read-to-write lock upgrade.
+        conn = self._conn()
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        TELEMETRY.observe("queuectl_storage_lock_wait_seconds", time.perf_counter() - started)
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        with TELEMETRY.timer("queuectl_storage_commit_seconds"):
             conn.commit()
 
-    def upsert_job(self, job: Dict[str, Any]) -> None:
-        sql = """
+    @contextmanager
+    def _read(self):
+        yield self._conn()
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
+
+    def _schema_version(self) -> int:
+        try:
+            with self._read() as conn:
+                return conn.execute("PRAGMA user_version").fetchone()[0]
+        except sqlite3.OperationalError:
+            if not self._readonly:
+                raise
+            return 0  # no database file yet
+
+    def _init_db(self):
+        # An up-to-date file needs no DDL, so opening one never waits for the write lock.
+        if self._schema_version() >= SCHEMA_VERSION:
+            return
+        readonly, self._readonly = self._readonly, False
+        try:
+            with self._write() as conn:
+                for statement in DB_SCHEMA.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+                self._migrate(conn)
+        finally:
+            if readonly:
+                self.close()
+                self._readonly = True
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, statements in MIGRATIONS:
+            if version <= current:
+                continue
+            for statement in statements:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # Column already present (database created before migrations were tracked).
+                    if "duplicate column name" not in str(e):
+                        raise
+            conn.execute(f"PRAGMA user_version = {version}")
+
+    UPSERT_JOB_SQL = """
         INSERT INTO jobs
-        (id, command, state, attempts, max_retries, created_at, updated_at, last_error, run_at, priority, timeout_seconds)
+        (id, command, state, attempts, max_retries, created_at, updated_at, last_error, run_at, priority, timeout_seconds, queue, cache_key, cache_ttl)
         VALUES
-        (:id, :command, :state, :attempts, :max_retries, :created_at, :updated_at, :last_error, :run_at, :priority, :timeout_seconds)
+        (:id, :command, :state, :attempts, :max_retries, :created_at, :updated_at, :last_error, :run_at, :priority, :timeout_seconds, :queue, :cache_key, :cache_ttl)
         ON CONFLICT(id) DO UPDATE SET
             command=excluded.command,
             state=excluded.state,
@@ -71,191 +498,979 @@ class Storage:
             last_error=excluded.last_error,
             run_at=excluded.run_at,
             priority=excluded.priority,
-            timeout_seconds=excluded.timeout_seconds;
+            timeout_seconds=excluded.timeout_seconds,
+            queue=excluded.queue,
+            cache_key=excluded.cache_key,
+            cache_ttl=excluded.cache_ttl
+    """
+    # Enqueue: a job that already exists is only replaced once it has finished, so a
+    # repeated or colliding id never resets pending, blocked or running work.
+    INSERT_JOB_SQL = UPSERT_JOB_SQL + " WHERE jobs.state IN ('completed', 'failed')"
+
+    @staticmethod
+    def _job_params(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "id": job["id"],
+            "command": job["command"],
+            "state": job["state"],
+            "attempts": job.get("attempts", 0),
+            "max_retries": job.get("max_retries", 3),
+            "created_at": job.get("created_at"),
+            "updated_at": job.get("updated_at"),
+            "last_error": job.get("last_error"),
+            "run_at": job.get("run_at"),
+            "priority": job.get("priority", 10),
+            "timeout_seconds": job.get("timeout_seconds"),
+            "queue": job.get("queue") or DEFAULT_QUEUE,
+            "cache_key": job.get("cache_key"),
+            "cache_ttl": job.get("cache_ttl"),
+        }
+
+    def upsert_job(self, job: Dict[str, Any]) -> None:
+        self.upsert_jobs([job])
+
+    def upsert_jobs(self, jobs: List[Dict[str, Any]]) -> int:
+        """Write many jobs in a single transaction, overwriting any with the same id.
+
+        A job with depends_on is written blocked until those jobs complete; each must
+        already exist, or appear earlier in `jobs`. ValueError rolls the whole call back.
         """
-        with self._lock, self._conn() as conn:
-            conn.execute(sql, {
-                "id": job["id"],
-                "command": job["command"],
-                "state": job["state"],
-                "attempts": job.get("attempts", 0),
-                "max_retries": job.get("max_retries", 3),
-                "created_at": job.get("created_at"),
-                "updated_at": job.get("updated_at"),
-                "last_error": job.get("last_error"),
-                "run_at": job.get("run_at"),
-                "priority": job.get("priority", 10),
-                "timeout_seconds": job.get("timeout_seconds"),
-            })
-            conn.commit()
+        with self._write() as conn:
+            self._write_jobs(conn, jobs, self.UPSERT_JOB_SQL)
+        return len(jobs)
 
-    def fetch_next_pending(self) -> Optional[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT id, command, state, attempts, max_retries, created_at,
-                    updated_at, last_error, run_at, priority, timeout_seconds
-                FROM jobs
-                WHERE state = 'pending' AND (run_at IS NULL OR run_at <= ?)
-                ORDER BY priority ASC, created_at ASC
-                LIMIT 1
-            """, (datetime.utcnow().isoformat(),))
-            row = cur.fetchone()
-            if not row:
-                return None
-            (job_id, command, _, attempts, max_retries, created_at, _, last_error,
-             run_at, priority, timeout_seconds) = row
-            now = datetime.utcnow().isoformat()
-            cur.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
-                       ("processing", now, job_id))
-            conn.commit()
-            return {
-                "id": job_id,
-                "command": command,
-                "state": "processing",
-                "attempts": attempts,
-                "max_retries": max_retries,
-                "created_at": created_at,
-                "updated_at": now,
-                "last_error": last_error,
-                "run_at": run_at,
-                "priority": priority,
-                "timeout_seconds": timeout_seconds,
-            }
+    def insert_jobs(self, jobs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Enqueue jobs in one transaction, dropping duplicates.
 
-    def update_job(self, job: Dict[str, Any]) -> None:
-        with self._lock, self._conn() as conn:
+        A job is a duplicate when its id belongs to a job that hasn't finished, or its
+        dedupe_key is held by another job until dedupe_expires_at. Returns created and
+        deduplicated counts, "existing": the owning job id of each dedupe_key hit, and
+        "errors": job id -> reason for each job rejected over its depends_on (the rest
+        are still inserted). A dedupe_key is only kept by a job that was actually written.
+        """
+        now = datetime.utcnow().isoformat()
+        existing: Dict[str, str] = {}
+        errors: Dict[str, str] = {}
+        created = 0
+        with self._write() as conn:
+            fresh = []
+            for job in jobs:
+                if not job.get("dedupe_key"):
+                    fresh.append(job)
+                    continue
+                # Write what's batched first so this job sees the ids ahead of it.
+                created += self._write_jobs(conn, fresh, self.INSERT_JOB_SQL, errors)
+                fresh = []
+                owner = self._claim_dedupe_key(conn, job["dedupe_key"], job["id"],
+                                               job["dedupe_expires_at"], now)
+                if owner is not None:
+                    existing[job["id"]] = owner
+                    continue
+                written = self._write_jobs(conn, [job], self.INSERT_JOB_SQL, errors)
+                if not written:
+                    self._release_dedupe_key(conn, job["dedupe_key"], job["id"])
+                created += written
+            created += self._write_jobs(conn, fresh, self.INSERT_JOB_SQL, errors)
+        return {"created": created, "deduplicated": len(jobs) - created - len(errors),
+                "existing": existing, "errors": errors}
+
+    @staticmethod
+    def _claim_dedupe_key(conn: sqlite3.Connection, key: str, job_id: str,
+                          expires_at: str, now: str) -> Optional[str]:
+        """Take key for job_id, or return the job holding it if it hasn't expired."""
+        claimed = conn.execute("""
+            INSERT INTO dedupe_keys (key, job_id, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET job_id = excluded.job_id, expires_at = excluded.expires_at
+            WHERE dedupe_keys.expires_at <= ?
+        """, (key, job_id, expires_at, now)).rowcount
+        if claimed:
+            return None
+        return conn.execute("SELECT job_id FROM dedupe_keys WHERE key = ?", (key,)).fetchone()[0]
+
+    @staticmethod
+    def _release_dedupe_key(conn: sqlite3.Connection, key: str, job_id: str) -> None:
+        conn.execute("DELETE FROM dedupe_keys WHERE key = ? AND job_id = ?", (key, job_id))
+
+    def claim_dedupe_key(self, key: str, job_id: str, expires_at: str) -> Optional[str]:
+        with self._write() as conn:
+            return self._claim_dedupe_key(conn, key, job_id, expires_at, datetime.utcnow().isoformat())
+
+    def release_dedupe_key(self, key: str, job_id: str) -> None:
+        """Drop job_id's claim on key, for a job that didn't get written after all."""
+        with self._write() as conn:
+            self._release_dedupe_key(conn, key, job_id)
+
+    def purge_dedupe_keys(self) -> int:
+        with self._write() as conn:
+            return conn.execute("DELETE FROM dedupe_keys WHERE expires_at <= ?",
+                                (datetime.utcnow().isoformat(),)).rowcount
+
+    # --- result cache ---
+
+    def cache_get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The unexpired cached result for key, or None; counts a hit or a miss."""
+        now = datetime.utcnow().isoformat()
+        with self._write() as conn:
+            row = conn.execute("""
+                UPDATE result_cache SET used_at = ? WHERE key = ? AND expires_at > ?
+                RETURNING exit_code, stdout, stderr, encoding, runtime_seconds
+            """, (now, key, now)).fetchone()
+            counter = "hits" if row else "misses"
+            conn.execute(f"UPDATE result_cache_stats SET {counter} = {counter} + 1 WHERE id = 0")
+        if row is None:
+            return None
+        return dict(zip(("exit_code", "stdout", "stderr", "encoding", "runtime_seconds"), row))
+
+    def cache_put(self, key: str, exit_code: int, stdout, stderr, encoding: Optional[str],
+                  runtime_seconds: float, ttl: float, max_bytes: int) -> int:
+        """Store a result under key for ttl seconds, then evict down to max_bytes.
+
+        Expired entries go first, then the least recently used. Returns entries evicted.
+        """
+        created = datetime.utcnow()
+        now = created.isoformat()
+        size = len(stdout or b"") + len(stderr or b"")
+        with self._write() as conn:
             conn.execute("""
-                UPDATE jobs SET state = ?, attempts = ?, updated_at = ?,
-                last_error = ?, run_at = ?, priority = ?, timeout_seconds = ?
-                WHERE id = ?
-            """, (
-                job["state"],
-                job.get("attempts", 0),
-                job.get("updated_at", datetime.utcnow().isoformat()),
-                job.get("last_error"),
-                job.get("run_at"),
-                job.get("priority", 10),
-                job.get("timeout_seconds"),
-                job["id"],
-            ))
-            conn.commit()
+                INSERT INTO result_cache (key, exit_code, stdout, stderr, encoding, runtime_seconds,
+                                          size, created_at, expires_at, used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET exit_code = excluded.exit_code,
+                    stdout = excluded.stdout, stderr = excluded.stderr, encoding = excluded.encoding,
+                    runtime_seconds = excluded.runtime_seconds, size = excluded.size,
+                    created_at = excluded.created_at, expires_at = excluded.expires_at,
+                    used_at = excluded.used_at
+            """, (key, exit_code, stdout, stderr, encoding, runtime_seconds, size, now,
+                  (created + timedelta(seconds=ttl)).isoformat(), now))
+            evicted = conn.execute("DELETE FROM result_cache WHERE expires_at <= ?", (now,)).rowcount
+            while conn.execute("SELECT bytes FROM result_cache_stats WHERE id = 0").fetchone()[0] > max_bytes:
+                n = conn.execute("""
+                    DELETE FROM result_cache WHERE key IN (
+                        SELECT key FROM result_cache WHERE key != ? ORDER BY used_at LIMIT 1)
+                """, (key,)).rowcount
+                if not n:
+                    # Only the new entry is left and it alone is over the limit.
+                    evicted += conn.execute("DELETE FROM result_cache WHERE key = ?", (key,)).rowcount
+                    break
+                evicted += n
+        return evicted
+
+    def purge_result_cache(self) -> int:
+        with self._write() as conn:
+            return conn.execute("DELETE FROM result_cache WHERE expires_at <= ?",
+                                (datetime.utcnow().isoformat(),)).rowcount
+
+    def cache_stats(self) -> Dict[str, int]:
+        with self._read() as conn:
+            row = conn.execute(
+                "SELECT entries, bytes, hits, misses, evictions FROM result_cache_stats WHERE id = 0").fetchone()
+        return dict(zip(("entries", "bytes", "hits", "misses", "evictions"), row))
+
+    def _write_jobs(self, conn: sqlite3.Connection, jobs: List[Dict[str, Any]], sql: str,
+                    errors: Optional[Dict[str, str]] = None) -> int:
+        """Write jobs with sql (UPSERT_JOB_SQL or INSERT_JOB_SQL); returns rows written.
+
+        A job whose dependencies don't check out raises ValueError, or, when errors is
+        given, is skipped and recorded there by id.
+        """
+        written = 0
+        plain = []
+        for job in jobs:
+            if not job.get("depends_on"):
+                plain.append(self._job_params(job))
+                continue
+            written += conn.executemany(sql, plain).rowcount if plain else 0
+            plain = []
+            try:
+                written += self._insert_dependent(conn, job, sql)
+            except ValueError as e:
+                # Raised before anything is written for this job.
+                if errors is None:
+                    raise
+                errors[job["id"]] = str(e)
+        if plain:
+            written += conn.executemany(sql, plain).rowcount
+        return written
+
+    def _insert_dependent(self, conn: sqlite3.Connection, job: Dict[str, Any], sql: str) -> int:
+        deps = list(dict.fromkeys(job["depends_on"]))
+        if job["id"] in deps:
+            raise ValueError(f"job {job['id']} depends on itself")
+        states = dict(conn.execute(
+            f"SELECT id, state FROM jobs WHERE id IN ({', '.join('?' * len(deps))})", deps).fetchall())
+        for dep in deps:
+            if dep in states:
+                continue
+            if conn.execute("SELECT 1 FROM dlq WHERE id = ?", (dep,)).fetchone():
+                raise ValueError(f"dependency {dep} of {job['id']} is in the DLQ")
+            raise ValueError(f"dependency {dep} of {job['id']} does not exist")
+        unmet = sum(1 for dep in deps if states[dep] != "completed")
+        params = self._job_params(job)
+        if unmet:
+            params["state"] = "blocked"
+        if not conn.execute(sql, params).rowcount:
+            return 0
+        conn.execute("UPDATE jobs SET unmet_deps = ? WHERE id = ?", (unmet, job["id"]))
+        conn.execute("DELETE FROM job_deps WHERE job_id = ?", (job["id"],))
+        conn.executemany("INSERT INTO job_deps (depends_on, job_id, satisfied) VALUES (?, ?, ?)",
+                         [(dep, job["id"], states[dep] == "completed") for dep in deps])
+        return 1
+
+    def fetch_next_pending(self, worker_id: Optional[str] = None,
+                           lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                           queues: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        jobs = self.fetch_pending_batch(1, worker_id, lease_seconds, queues)
+        return jobs[0] if jobs else None
+
+    def fetch_pending_batch(self, limit: int, worker_id: Optional[str] = None,
+                            lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                            queues: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Claim up to limit ready jobs, from `queues` only when given.
+
+        Queues are served by weighted fair share, skipping any at its max_in_flight or
+        out of rate tokens; within a queue, jobs go in priority then creation order.
+        """
+        now = datetime.utcnow()
+        lease = (now + timedelta(seconds=lease_seconds)).isoformat()
+        now = now.isoformat()
+        clock = time.time()
+        jobs = []
+        # Pick and claim under one write lock, so no other process can claim the same
+        # rows or overshoot a queue's limits in between.
+        with self._write() as conn:
+            while len(jobs) < limit:
+                pick = self._pick_queue(conn, now, clock, queues)
+                if pick is None:
+                    break
+                name, room, contended = pick
+                # One job per pick while queues compete, so a batch is shared fairly too.
+                take = 1 if contended else min(room, limit - len(jobs))
+                rows = conn.execute(f"""
+                    UPDATE jobs SET state = 'processing', updated_at = :now, worker_id = :worker_id,
+                        lease_expires_at = :lease
+                    WHERE rowid IN (
+                        SELECT rowid FROM jobs
+                        WHERE state = 'pending' AND queue = :queue AND (run_at IS NULL OR run_at <= :now)
+                        ORDER BY priority ASC, created_at ASC
+                        LIMIT :limit
+                    )
+                    RETURNING {JOB_SELECT}
+                """, {"now": now, "worker_id": worker_id, "lease": lease, "queue": name,
+                      "limit": take}).fetchall()
+                if not rows:
+                    break
+                self._charge_queue(conn, name, len(rows), clock)
+                # RETURNING order is unspecified; restore the queue order.
+                jobs.extend(sorted(map(_job_from_row, rows), key=lambda j: (j["priority"], j["created_at"])))
+        return jobs
+
+    @staticmethod
+    def _queue_filter(queues: Optional[List[str]], column: str) -> Tuple[str, List[str]]:
+        if not queues:
+            return "", []
+        return f" AND {column} IN ({', '.join('?' * len(queues))})", list(queues)
+
+    def _pick_queue(self, conn: sqlite3.Connection, now: str, clock: float,
+                    queues: Optional[List[str]]) -> Optional[Tuple[str, float, bool]]:
+        """Next queue to serve: (name, jobs it may still take, whether others were eligible).
+
+        Stride scheduling: each claim advances a queue's pass by 1/weight and the queue
+        with the lowest pass goes next. A queue's pass is lifted to the shared clock when
+        it is picked, so one that sat idle can't bank credit and then starve the rest.
+        """
+        where, params = self._queue_filter(queues, "q.name")
+        rows = conn.execute(f"""
+            SELECT q.name, q.weight, q.pass, q.max_in_flight, q.rate, q.burst, q.tokens, q.tokens_at,
+                CASE WHEN q.max_in_flight IS NULL THEN 0 ELSE
+                    (SELECT COUNT(*) FROM jobs j WHERE j.state = 'processing' AND j.queue = q.name)
+                END
+            FROM queues q
+            WHERE EXISTS (
+                SELECT 1 FROM jobs j
+                WHERE j.state = 'pending' AND j.queue = q.name AND (j.run_at IS NULL OR j.run_at <= ?)
+            ){where}
+        """, [now] + params).fetchall()
+        vtime = conn.execute("SELECT vtime FROM queue_clock").fetchone()[0]
+        best = None
+        eligible = 0
+        for name, weight, pass_, max_in_flight, rate, burst, tokens, tokens_at, in_flight in rows:
+            room = float("inf")
+            if max_in_flight is not None:
+                room = max_in_flight - in_flight
+            if rate:
+                room = min(room, math.floor(_refill(rate, burst, tokens, tokens_at, clock)))
+            if room < 1:
+                continue
+            eligible += 1
+            key = (max(pass_, vtime), name)
+            if best is None or key < best[0]:
+                best = (key, room)
+        if best is None:
+            return None
+        (effective_pass, name), room = best
+        conn.execute("UPDATE queue_clock SET vtime = ?", (effective_pass,))
+        conn.execute("UPDATE queues SET pass = ? WHERE name = ?", (effective_pass, name))
+        return name, room, eligible > 1
+
+    @staticmethod
+    def _charge_queue(conn: sqlite3.Connection, name: str, claimed: int, clock: float) -> None:
+        weight, rate, burst, tokens, tokens_at = conn.execute(
+            "SELECT weight, rate, burst, tokens, tokens_at FROM queues WHERE name = ?", (name,)).fetchone()
+        if rate:
+            tokens = _refill(rate, burst, tokens, tokens_at, clock) - claimed
+        conn.execute("""
+            UPDATE queues SET pass = pass + ?, tokens = ?, tokens_at = ? WHERE name = ?
+        """, (claimed / weight, tokens if rate else None, clock if rate else None, name))
+
+    def configure_queue(self, name: str, **settings) -> None:
+        """Set a queue's weight, max_in_flight, rate or burst (None clears a limit)."""
+        unknown = set(settings) - set(QUEUE_SETTINGS)
+        if unknown:
+            raise ValueError(f"unknown queue settings: {', '.join(sorted(unknown))}")
+        if settings.get("weight") is not None and settings["weight"] <= 0:
+            raise ValueError("weight must be positive")
+        with self._write() as conn:
+            conn.execute("INSERT OR IGNORE INTO queues (name) VALUES (?)", (name,))
+            for key, value in settings.items():
+                if key == "weight" and value is None:
+                    value = 1
+                conn.execute(f"UPDATE queues SET {key} = ? WHERE name = ?", (value, name))
+            # Start the bucket full under the new limits.
+            conn.execute("UPDATE queues SET tokens = NULL, tokens_at = NULL WHERE name = ?", (name,))
+
+    def list_queues(self) -> List[Dict[str, Any]]:
+        """Each known queue's settings with its pending and processing counts."""
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT q.name, q.weight, q.max_in_flight, q.rate, q.burst,
+                    (SELECT COUNT(*) FROM jobs j WHERE j.state = 'pending' AND j.queue = q.name),
+                    (SELECT COUNT(*) FROM jobs j WHERE j.state = 'processing' AND j.queue = q.name)
+                FROM queues q ORDER BY q.name
+            """).fetchall()
+        return [dict(zip(("name",) + QUEUE_SETTINGS + ("pending", "processing"), r)) for r in rows]
+
+    def best_ready_priority(self, queues: Optional[List[str]] = None) -> Optional[int]:
+        """Lowest priority value among due pending jobs, or None; a read through
+        idx_jobs_queue_ready, one seek per queue."""
+        where, params = self._queue_filter(queues, "q.name")
+        with self._read() as conn:
+            return conn.execute(f"""
+                SELECT MIN((SELECT j.priority FROM jobs j
+                    WHERE j.state = 'pending' AND j.queue = q.name AND (j.run_at IS NULL OR j.run_at <= ?)
+                    ORDER BY j.priority, j.created_at LIMIT 1))
+                FROM queues q WHERE 1{where}
+            """, [datetime.utcnow().isoformat()] + params).fetchone()[0]
+
+    def next_run_at(self) -> Optional[str]:
+        """Earliest run_at among pending jobs that are not yet due."""
+        with self._read() as conn:
+            row = conn.execute("""
+                SELECT MIN(run_at) FROM jobs
+                WHERE state = 'pending' AND run_at IS NOT NULL AND run_at > ?
+            """, (datetime.utcnow().isoformat(),)).fetchone()
+            return row[0]
+
+    def release_jobs(self, job_ids: List[str], worker_id: Optional[str] = None) -> int:
+        """Return claimed-but-unstarted jobs to pending; only rows still owned by worker_id."""
+        if not job_ids:
+            return 0
+        now = datetime.utcnow().isoformat()
+        with self._write() as conn:
+            cur = conn.executemany("""
+                UPDATE jobs SET state = 'pending', updated_at = ?, worker_id = NULL, lease_expires_at = NULL
+                WHERE id = ? AND state = 'processing' AND worker_id IS ?
+            """, [(now, job_id, worker_id) for job_id in job_ids])
+            return cur.rowcount
+
+    def renew_leases(self, worker_id: str, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> int:
+        """Extend the lease on every job worker_id holds (running or batched). Returns the count."""
+        lease = (datetime.utcnow() + timedelta(seconds=lease_seconds)).isoformat()
+        with self._write() as conn:
+            cur = conn.execute("""
+                UPDATE jobs SET lease_expires_at = ?
+                WHERE state = 'processing' AND worker_id = ?
+            """, (lease, worker_id))
+            return cur.rowcount
+
+    def reclaim_expired(self, default_max_retries: int = 3, limit: int = 500) -> Dict[str, int]:
+        """Re-queue processing jobs whose lease has lapsed, counting the lost run as an attempt.
+
+        Jobs that have used up their retries go to the DLQ instead. Reads only expired
+        rows, through idx_jobs_lease.
+        """
+        now = datetime.utcnow().isoformat()
+        reclaimed = {"requeued": 0, "dead": 0}
+        with self._write() as conn:
+            rows = conn.execute(f"""
+                SELECT {JOB_SELECT} FROM jobs
+                WHERE state = 'processing' AND lease_expires_at < ?
+                ORDER BY lease_expires_at LIMIT ?
+            """, (now, limit)).fetchall()
+            for job in map(_job_from_row, rows):
+                job["attempts"] = int(job["attempts"] or 0) + 1
+                error = f"Lease expired (held by {job['worker_id']})"
+                if job["attempts"] >= int(job["max_retries"] or default_max_retries):
+                    self._bury(conn, job, error)
+                    reclaimed["dead"] += 1
+                else:
+                    conn.execute("""
+                        UPDATE jobs SET state = 'pending', attempts = ?, updated_at = ?, last_error = ?,
+                            run_at = NULL, worker_id = NULL, lease_expires_at = NULL
+                        WHERE id = ?
+                    """, (job["attempts"], now, error, job["id"]))
+                    reclaimed["requeued"] += 1
+        return reclaimed
+
+    def update_job(self, job: Dict[str, Any], owner: Optional[str] = None) -> bool:
+        """Write job's state. With owner, only while that worker still holds the claim."""
+        with self._write() as conn:
+            return self._update_job(conn, job, owner)
+
+    # Appended to a finished job's write when the claim token is known: once the lease has
+    # been reclaimed (and maybe claimed again), the late outcome must not touch the row.
+    OWNED_SQL = " AND worker_id = :owner AND state = 'processing'"
+
+    @classmethod
+    def _update_job(cls, conn: sqlite3.Connection, job: Dict[str, Any], owner: Optional[str] = None) -> bool:
+        cur = conn.execute("""
+            UPDATE jobs SET state = :state, attempts = :attempts, updated_at = :updated_at,
+            last_error = :last_error, run_at = :run_at, priority = :priority, timeout_seconds = :timeout_seconds,
+            lease_expires_at = CASE WHEN :state = 'processing' THEN lease_expires_at END
+            WHERE id = :id""" + (cls.OWNED_SQL if owner else ""), {
+            "state": job["state"],
+            "attempts": job.get("attempts", 0),
+            "updated_at": job.get("updated_at", datetime.utcnow().isoformat()),
+            "last_error": job.get("last_error"),
+            "run_at": job.get("run_at"),
+            "priority": job.get("priority", 10),
+            "timeout_seconds": job.get("timeout_seconds"),
+            "id": job["id"],
+            "owner": owner,
+        })
+        return cur.rowcount > 0
+
+    def record_outcome(self, job: Dict[str, Any], log: Optional[Tuple[Any, Any, Optional[str]]] = None,
+                       runtime_seconds: Optional[float] = None, dead_error: Optional[str] = None,
+                       owner: Optional[str] = None) -> bool:
+        return not self.record_outcomes([{"job": job, "log": log, "runtime_seconds": runtime_seconds,
+                                          "dead_error": dead_error, "owner": owner}])
+
+    def record_outcomes(self, outcomes: List[Dict[str, Any]]) -> List[str]:
+        """Record finished runs in one transaction: one commit however many jobs.
+
+        Each outcome has "job" (written with update_job, or moved to the DLQ when
+        "dead_error" is set) and optionally "log" as (stdout, stderr, encoding),
+        "runtime_seconds" for job_metrics and "owner", the claim token it ran under.
+        An owned outcome whose claim was lost (lease reclaimed) is dropped, log and
+        metric included; returns the ids of dropped outcomes.
+        """
+        now = datetime.utcnow().isoformat()
+        dropped = []
+        with self._write() as conn:
+            for outcome in outcomes:
+                job = outcome["job"]
+                owner = outcome.get("owner")
+                if outcome.get("dead_error") is not None:
+                    written = self._bury(conn, job, outcome["dead_error"], owner)
+                else:
+                    written = self._update_job(conn, job, owner)
+                if not written and owner:
+                    dropped.append(job["id"])
+                    continue
+                if outcome.get("log") is not None:
+                    conn.execute("""
+                        INSERT INTO job_logs (job_id, timestamp, stdout, stderr, encoding)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (job["id"], now) + tuple(outcome["log"]))
+                if outcome.get("runtime_seconds") is not None:
+                    conn.execute("INSERT INTO job_metrics (job_id, runtime_seconds) VALUES (?, ?)",
+                                 (job["id"], outcome["runtime_seconds"]))
+        return dropped
+
+    def dag(self, job_id: str, max_nodes: int = 10000) -> List[Dict[str, Any]]:
+        """The workflow job_id belongs to: every job linked to it by dependencies.
+
+        Nodes come back in dependency order, each with id, state ('dead' in the DLQ,
+        'purged' when removed by gc), depends_on and unmet_deps.
+        """
+        with self._read() as conn:
+            parents: Dict[str, List[str]] = {}
+            children: Dict[str, List[str]] = {}
+            seen, frontier = {job_id}, [job_id]
+            while frontier and len(seen) < max_nodes:
+                node = frontier.pop()
+                ups = [r[0] for r in conn.execute("SELECT depends_on FROM job_deps WHERE job_id = ?", (node,))]
+                downs = [r[0] for r in conn.execute("SELECT job_id FROM job_deps WHERE depends_on = ?", (node,))]
+                parents[node] = ups
+                children[node] = downs
+                for other in ups + downs:
+                    if other not in seen:
+                        seen.add(other)
+                        frontier.append(other)
+            nodes = {}
+            for node in seen:
+                row = conn.execute("SELECT state, unmet_deps FROM jobs WHERE id = ?", (node,)).fetchone()
+                if row is None:
+                    in_dlq = conn.execute("SELECT 1 FROM dlq WHERE id = ?", (node,)).fetchone()
+                    row = ("dead" if in_dlq else "purged", 0)
+                nodes[node] = {"id": node, "state": row[0], "unmet_deps": row[1],
+                               "depends_on": sorted(parents.get(node, []))}
+        # Kahn's algorithm over the collected subgraph; ties broken by id.
+        remaining = {n: sum(1 for p in nodes[n]["depends_on"] if p in nodes) for n in nodes}
+        ready = sorted(n for n, count in remaining.items() if count == 0)
+        ordered = []
+        while ready:
+            node = ready.pop(0)
+            ordered.append(nodes[node])
+            for child in sorted(children.get(node, [])):
+                if child in remaining:
+                    remaining[child] -= 1
+                    if remaining[child] == 0:
+                        ready.append(child)
+        placed = {n["id"] for n in ordered}
+        return ordered + [nodes[n] for n in sorted(nodes) if n not in placed]
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._read() as conn:
+            row = conn.execute(f"SELECT {JOB_SELECT} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return _job_from_row(row) if row else None
+
+    def _paginate(self, table: str, columns: str, filters: List[str], params: Dict[str, Any],
+                  limit: Optional[int], after: Optional[str], page_size: int) -> Iterator[tuple]:
+        """Yield rows in id order, one short read per page, resuming after the last id seen."""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            where = list(filters)
+            if after is not None:
+                where.append("id > :after")
+            sql = f"SELECT {columns} FROM {table}"
+            if where:
+                sql += " WHERE " + " AND ".join(where)
+            sql += " ORDER BY id LIMIT :page_size"
+            with self._read() as conn:
+                rows = conn.execute(sql, dict(params, after=after, page_size=size)).fetchall()
+            yield from rows
+            if len(rows) < size:
+                return
+            after = rows[-1][0]
+            if remaining is not None:
+                remaining -= len(rows)
+
+    @staticmethod
+    def _id_filters(id_prefix: Optional[str], since: Optional[str],
+                    filters: List[str], params: Dict[str, Any]) -> None:
+        if id_prefix:
+            # Range instead of LIKE so the primary key index is used.
+            filters.append("id >= :prefix_lo AND id < :prefix_hi")
+            params["prefix_lo"] = id_prefix
+            params["prefix_hi"] = id_prefix[:-1] + chr(ord(id_prefix[-1]) + 1)
+        if since:
+            filters.append("created_at >= :since")
+            params["since"] = since
+
+    def iter_jobs(self, state: Optional[str] = None, limit: Optional[int] = None,
+                  after: Optional[str] = None, since: Optional[str] = None,
+                  priority: Optional[int] = None, id_prefix: Optional[str] = None,
+                  queue: Optional[str] = None, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Stream jobs in id order with keyset pagination; memory use is one page."""
+        filters, params = [], {}
+        if state:
+            filters.append("state = :state")
+            params["state"] = state
+        if queue:
+            filters.append("queue = :queue")
+            params["queue"] = queue
+        if priority is not None:
+            filters.append("priority = :priority")
+            params["priority"] = priority
+        self._id_filters(id_prefix, since, filters, params)
+        for row in self._paginate("jobs", JOB_SELECT, filters, params, limit, after, page_size):
+            yield _job_from_row(row)
 
     def list_jobs(self, state: Optional[str] = None) -> List[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
-            cur = conn.cursor()
-            if state:
-                cur.execute("""
-                    SELECT id, command, state, attempts, max_retries, created_at,
-                        updated_at, last_error, run_at, priority, timeout_seconds
-                    FROM jobs WHERE state = ?
-                """, (state,))
-            else:
-                cur.execute("""
-                    SELECT id, command, state, attempts, max_retries, created_at,
-                        updated_at, last_error, run_at, priority, timeout_seconds
-                    FROM jobs
-                """)
-            rows = cur.fetchall()
-            return [
-                {
-                    "id": r[0],
-                    "command": r[1],
-                    "state": r[2],
-                    "attempts": r[3],
-                    "max_retries": r[4],
-                    "created_at": r[5],
-                    "updated_at": r[6],
-                    "last_error": r[7],
-                    "run_at": r[8],
-                    "priority": r[9],
-                    "timeout_seconds": r[10],
-                }
-                for r in rows
-            ]
+        return list(self.iter_jobs(state=state))
 
     def delete_job(self, job_id: str) -> None:
-        with self._lock, self._conn() as conn:
+        with self._write() as conn:
             conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
-            conn.commit()
 
-    def move_to_dlq(self, job: Dict[str, Any], last_error: str) -> None:
-        with self._lock, self._conn() as conn:
-            conn.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
-            conn.execute("""
-                INSERT OR REPLACE INTO dlq (id, command, attempts, created_at, last_error)
-                VALUES (:id, :command, :attempts, :created_at, :last_error)
-            """, {
-                "id": job["id"],
-                "command": job["command"],
-                "attempts": job.get("attempts", 0),
-                "created_at": job.get("created_at") or job.get("updated_at"),
-                "last_error": last_error,
-            })
-            conn.commit()
+    def move_to_dlq(self, job: Dict[str, Any], last_error: str, owner: Optional[str] = None) -> bool:
+        """Bury job. With owner, only while that worker still holds the claim."""
+        with self._write() as conn:
+            return self._bury(conn, job, last_error, owner)
+
+    def _bury(self, conn: sqlite3.Connection, job: Dict[str, Any], last_error: str,
+              owner: Optional[str] = None) -> bool:
+        """Move job to the DLQ, then every job blocked on it, transitively."""
+        cur = conn.execute("DELETE FROM jobs WHERE id = :id" + (self.OWNED_SQL if owner else ""),
+                           {"id": job["id"], "owner": owner})
+        if owner and not cur.rowcount:
+            return False
+        self._insert_dlq(conn, job, last_error)
+        failed = [job["id"]]
+        while failed:
+            parent = failed.pop()
+            rows = conn.execute(f"""
+                SELECT {JOB_SELECT} FROM jobs
+                WHERE id IN (SELECT job_id FROM job_deps WHERE depends_on = ?) AND state = 'blocked'
+            """, (parent,)).fetchall()
+            for child in map(_job_from_row, rows):
+                conn.execute("DELETE FROM jobs WHERE id = ?", (child["id"],))
+                self._insert_dlq(conn, child, f"Dependency {parent} failed")
+                failed.append(child["id"])
+        return True
+
+    @staticmethod
+    def _insert_dlq(conn: sqlite3.Connection, job: Dict[str, Any], last_error: str) -> None:
+        # Delete + insert rather than INSERT OR REPLACE: REPLACE skips delete triggers.
+        conn.execute("DELETE FROM dlq WHERE id = ?", (job["id"],))
+        conn.execute("""
+            INSERT INTO dlq (id, command, attempts, created_at, last_error, queue, max_retries, priority,
+                timeout_seconds, dead_at)
+            VALUES (:id, :command, :attempts, :created_at, :last_error, :queue, :max_retries, :priority,
+                :timeout_seconds, :dead_at)
+        """, {
+            "id": job["id"],
+            "command": job["command"],
+            "attempts": job.get("attempts", 0),
+            "created_at": job.get("created_at") or job.get("updated_at"),
+            "last_error": last_error,
+            "queue": job.get("queue") or DEFAULT_QUEUE,
+            "max_retries": job.get("max_retries"),
+            "priority": job.get("priority"),
+            "timeout_seconds": job.get("timeout_seconds"),
+            "dead_at": datetime.utcnow().isoformat(),
+        })
+
+    @staticmethod
+    def _dlq_filters(job_id: Optional[str] = None, id_prefix: Optional[str] = None,
+                     since: Optional[str] = None, before: Optional[str] = None, error: Optional[str] = None,
+                     error_class: Optional[str] = None, command_prefix: Optional[str] = None,
+                     queue: Optional[str] = None) -> Tuple[List[str], Dict[str, Any]]:
+        """WHERE clauses selecting DLQ rows. error is a GLOB pattern (e.g. "*refused*") on last_error.
+
+        since matches on created_at like other listings; before is on dead_at, the burial time.
+        """
+        filters: List[str] = []
+        params: Dict[str, Any] = {}
+        if job_id is not None:
+            filters.append("id = :job_id")
+            params["job_id"] = job_id
+        Storage._id_filters(id_prefix, since, filters, params)
+        if before:
+            filters.append("dead_at < :before")
+            params["before"] = before
+        if error:
+            filters.append("last_error GLOB :error")
+            params["error"] = error
+        if error_class:
+            filters.append("error_class = :error_class")
+            params["error_class"] = error_class
+        if command_prefix:
+            filters.append("substr(command, 1, :command_len) = :command_prefix")
+            params.update(command_prefix=command_prefix, command_len=len(command_prefix))
+        if queue:
+            filters.append("queue = :queue")
+            params["queue"] = queue
+        return filters, params
+
+    def iter_dlq(self, limit: Optional[int] = None, after: Optional[str] = None,
+                 page_size: int = 500, **match) -> Iterator[Dict[str, Any]]:
+        """Stream DLQ rows in id order; match takes the _dlq_filters keywords."""
+        filters, params = self._dlq_filters(**match)
+        rows = self._paginate("dlq", DLQ_SELECT, filters, params, limit, after, page_size)
+        for r in rows:
+            yield dict(zip(DLQ_COLUMNS, r))
 
     def load_dlq(self) -> List[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, command, attempts, created_at, last_error FROM dlq")
-            rows = cur.fetchall()
-            return [
-                {"id": r[0], "command": r[1], "attempts": r[2], "created_at": r[3], "last_error": r[4]}
-                for r in rows
-            ]
+        return list(self.iter_dlq())
 
-    def retry_dlq_item(self, dlq_job_id: str) -> Optional[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id, command, attempts, created_at, last_error FROM dlq WHERE id = ?", (dlq_job_id,))
-            row = cur.fetchone()
-            if not row:
-                return None
-            job = {
-                "id": row[0],
-                "command": row[1],
-                "attempts": row[2],
-                "created_at": row[3],
-                "last_error": row[4],
-            }
-            now = datetime.utcnow().isoformat()
-            cur.execute("DELETE FROM dlq WHERE id = ?", (dlq_job_id,))
-            cur.execute("""
-                INSERT INTO jobs (id, command, state, attempts, max_retries, created_at, updated_at, last_error, run_at, priority, timeout_seconds)
-                VALUES (?, ?, 'pending', ?, (SELECT COALESCE(MAX(max_retries), 3) FROM jobs), ?, ?, ?, NULL, ?, NULL)
-            """, (
-                job["id"], job["command"], job["attempts"], now, now, job["last_error"],
-                10  # default priority after retry
-            ))
-            conn.commit()
-            return job
+    def count_dlq(self, **match) -> int:
+        filters, params = self._dlq_filters(**match)
+        with self._read() as conn:
+            return conn.execute("SELECT COUNT(*) FROM dlq WHERE " + (" AND ".join(filters) or "1"),
+                                params).fetchone()[0]
+
+    def dlq_stats(self) -> List[Dict[str, Any]]:
+        """Dead jobs per error_class, largest first; read from idx_dlq_error_class alone."""
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT error_class, COUNT(*), MIN(dead_at), MAX(dead_at) FROM dlq
+                GROUP BY error_class ORDER BY COUNT(*) DESC, error_class
+            """).fetchall()
+        return [{"error_class": r[0], "count": r[1], "oldest": r[2], "newest": r[3]} for r in rows]
+
+    # Jobs blocked again on retry: edges left unsatisfied once SATISFY_DEPS_SQL has run.
+    UNMET_DEPS_SQL = "SELECT COUNT(*) FROM job_deps d WHERE d.job_id = {job} AND NOT d.satisfied"
+
+    def retry_dlq_item(self, dlq_job_id: str, default_max_retries: int = 3) -> Dict[str, int]:
+        """Re-queue one DLQ row by id, as retry_dlq does: {"retried": 0, "skipped": 0} if absent."""
+        return self.retry_dlq(default_max_retries, job_id=dlq_job_id)
+
+    def retry_dlq(self, default_max_retries: int = 3, **match) -> Dict[str, int]:
+        """Re-queue every DLQ row matching the _dlq_filters keywords, in one transaction.
 
-    def insert_job_log(self, job_id: str, stdout: str, stderr: str):
-        with self._lock, self._conn() as conn:
+        Rows keep their attempts, priority, timeout and max_retries; rows buried before
+        those were stored get default_max_retries and priority 10. A row whose id is in
+        use by a live job again stays in the DLQ and is counted as skipped.
+        """
+        filters, params = self._dlq_filters(**match)
+        now = datetime.utcnow().isoformat()
+        with self._write() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS dlq_batch (id TEXT PRIMARY KEY)")
+            matched = conn.execute("INSERT INTO temp.dlq_batch SELECT id FROM dlq WHERE "
+                                   + (" AND ".join(filters) or "1"), params).rowcount
+            conn.execute("DELETE FROM temp.dlq_batch WHERE id IN (SELECT id FROM jobs)")
+            retried = conn.execute("""
+                INSERT INTO jobs (id, command, state, attempts, max_retries, created_at, updated_at, last_error, run_at, priority, timeout_seconds, queue, unmet_deps)
+                SELECT id, command, 'pending', attempts, COALESCE(max_retries, :max_retries), :now, :now,
+                       last_error, NULL, COALESCE(priority, 10), timeout_seconds, queue, 0
+                FROM dlq WHERE id IN (SELECT id FROM temp.dlq_batch)
+            """, {"max_retries": default_max_retries, "now": now}).rowcount
+            conn.execute("DELETE FROM dlq WHERE id IN (SELECT id FROM temp.dlq_batch)")
+            # Only now, with the whole batch out of the DLQ, can dependencies be counted.
+            with_deps = "SELECT job_id FROM job_deps WHERE job_id IN (SELECT id FROM temp.dlq_batch)"
+            conn.execute(SATISFY_DEPS_SQL.format(jobs="SELECT id FROM temp.dlq_batch"))
+            conn.execute(f"UPDATE jobs SET unmet_deps = ({self.UNMET_DEPS_SQL.format(job='jobs.id')}) "
+                         f"WHERE id IN ({with_deps})")
+            conn.execute(f"UPDATE jobs SET state = 'blocked' WHERE id IN ({with_deps}) AND unmet_deps > 0")
+            conn.execute("DELETE FROM temp.dlq_batch")
+        return {"retried": retried, "skipped": matched - retried}
+
+    def purge_dlq_matching(self, **match) -> int:
+        """Delete every DLQ row matching the _dlq_filters keywords, in one transaction."""
+        filters, params = self._dlq_filters(**match)
+        with self._write() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS purge_ids (id TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM purge_ids")
+            conn.execute("INSERT INTO purge_ids SELECT id FROM dlq WHERE " + (" AND ".join(filters) or "1"),
+                         params)
+            counts, files = self._purge_dlq_ids(conn)
+        self._unlink(files)
+        return counts["dlq"]
+
+    def insert_job_log(self, job_id: str, stdout, stderr, encoding: Optional[str] = None):
+        with self._write() as conn:
             conn.execute("""
-                INSERT INTO job_logs (job_id, timestamp, stdout, stderr)
-                VALUES (?, ?, ?, ?)
-            """, (job_id, datetime.utcnow().isoformat(), stdout, stderr))
-            conn.commit()
+                INSERT INTO job_logs (job_id, timestamp, stdout, stderr, encoding)
+                VALUES (?, ?, ?, ?, ?)
+            """, (job_id, datetime.utcnow().isoformat(), stdout, stderr, encoding))
+
+    def iter_job_logs(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """Yield stored log rows one at a time, still encoded (see logcapture.iter_output)."""
+        with self._read() as conn:
+            cur = conn.execute("""
+                SELECT timestamp, stdout, stderr, encoding FROM job_logs
+                WHERE job_id = ? ORDER BY timestamp
+            """, (job_id,))
+            for r in cur:
+                yield {"timestamp": r[0], "stdout": r[1], "stderr": r[2], "encoding": r[3]}
 
     def get_job_logs(self, job_id: str) -> List[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT timestamp, stdout, stderr FROM job_logs WHERE job_id = ? ORDER BY timestamp", (job_id,))
-            rows = cur.fetchall()
-            return [{"timestamp": r[0], "stdout": r[1], "stderr": r[2]} for r in rows]
+        return [
+            {
+                "timestamp": log["timestamp"],
+                "stdout": read_output(log["stdout"], log["encoding"]),
+                "stderr": read_output(log["stderr"], log["encoding"]),
+            }
+            for log in self.iter_job_logs(job_id)
+        ]
 
     def insert_job_metric(self, job_id: str, runtime_seconds: float):
-        with self._lock, self._conn() as conn:
+        with self._write() as conn:
             conn.execute("""
                 INSERT INTO job_metrics (job_id, runtime_seconds)
                 VALUES (?, ?)
             """, (job_id, runtime_seconds))
-            conn.commit()
 
     def get_job_metrics(self, job_id: str) -> List[Dict[str, Any]]:
-        with self._lock, self._conn() as conn:
+        with self._read() as conn:
             cur = conn.cursor()
             cur.execute("SELECT runtime_seconds FROM job_metrics WHERE job_id = ?", (job_id,))
             rows = cur.fetchall()
             return [{"runtime_seconds": r[0]} for r in rows]
+
+    def count_ready(self) -> int:
+        """Pending jobs that are due now (scheduled ones excluded)."""
+        with self._read() as conn:
+            return conn.execute("""
+                SELECT COUNT(*) FROM jobs
+                WHERE state = 'pending' AND (run_at IS NULL OR run_at <= ?)
+            """, (datetime.utcnow().isoformat(),)).fetchone()[0]
+
+    def count_by_state(self) -> Dict[str, int]:
+        """Job counts per state (DLQ entries as 'dead'), read from the trigger-kept rollup."""
+        with self._read() as conn:
+            return {state: count for state, count in
+                    conn.execute("SELECT state, count FROM job_state_counts WHERE count != 0")}
+
+    def runtime_histogram(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        """Raw runtime rollup for one job, or for all jobs when job_id is None."""
+        scope = job_id or ""
+        with self._read() as conn:
+            row = conn.execute("""
+                SELECT count, total_seconds, max_seconds FROM runtime_stats WHERE job_id = ?
+            """, (scope,)).fetchone()
+            buckets = conn.execute("""
+                SELECT b.upper_seconds, h.count FROM runtime_histogram h
+                JOIN runtime_buckets b ON b.bucket = h.bucket
+                WHERE h.job_id = ? ORDER BY h.bucket
+            """, (scope,)).fetchall()
+        count, total, max_seconds = row or (0, 0.0, 0.0)
+        return {"count": count, "total_seconds": total, "max_seconds": max_seconds, "buckets": buckets}
+
+    def runtime_summary(self, job_id: Optional[str] = None) -> Dict[str, Any]:
+        return summarize_runtimes(self.runtime_histogram(job_id))
+
+    def throughput(self, minutes: int = 60) -> List[Dict[str, Any]]:
+        """Per-minute runs/completions/DLQ moves over the last `minutes` minutes (UTC)."""
+        since = (datetime.utcnow() - timedelta(minutes=minutes - 1)).strftime("%Y-%m-%dT%H:%M")
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT minute, runs, completed, dead FROM throughput WHERE minute >= ? ORDER BY minute
+            """, (since,)).fetchall()
+        return [{"minute": r[0], "runs": r[1], "completed": r[2], "dead": r[3]} for r in rows]
+
+    # --- retention (see queuectl.core.janitor) ---
+
+    def completed_cutoff_for_keep(self, keep: int) -> Optional[str]:
+        """updated_at of the keep-th newest completed job: anything older is over the cap."""
+        with self._read() as conn:
+            row = conn.execute("""
+                SELECT updated_at FROM jobs WHERE state = 'completed'
+                ORDER BY updated_at DESC LIMIT 1 OFFSET ?
+            """, (keep - 1,)).fetchone()
+            return row[0] if row else None
+
+    def completed_updated_desc(self, limit: int) -> List[str]:
+        """updated_at of the newest `limit` completed jobs, newest first."""
+        with self._read() as conn:
+            return [r[0] for r in conn.execute("""
+                SELECT updated_at FROM jobs WHERE state = 'completed'
+                ORDER BY updated_at DESC LIMIT ?
+            """, (limit,))]
+
+    def _with_history(self, jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Attach each job's decoded logs and its runtimes, for the archive.
+
+        Output spilled to gzip files under log_dir is read back, since purging unlinks them.
+        """
+        for job in jobs:
+            job["logs"] = [
+                {"timestamp": log["timestamp"],
+                 "stdout": read_output(log["stdout"], log["encoding"]),
+                 "stderr": read_output(log["stderr"], log["encoding"])}
+                for log in self.iter_job_logs(job["id"])
+            ]
+            job["runtime_seconds"] = [m["runtime_seconds"] for m in self.get_job_metrics(job["id"])]
+        return jobs
+
+    def completed_before(self, cutoff: str, limit: int) -> List[Dict[str, Any]]:
+        """Oldest completed jobs last updated before cutoff, with their logs and runtimes."""
+        with self._read() as conn:
+            jobs = [_job_from_row(r) for r in conn.execute(f"""
+                SELECT {JOB_SELECT} FROM jobs
+                WHERE state = 'completed' AND updated_at < ?
+                ORDER BY updated_at LIMIT ?
+            """, (cutoff, limit))]
+        return self._with_history(jobs)
+
+    @staticmethod
+    def _purge_history(conn: sqlite3.Connection) -> Tuple[Dict[str, int], List[str]]:
+        """Delete the logs, metrics and per-job runtime rollups of the ids in temp.purge_ids.
+
+        Returns the row counts and the spilled log files to unlink once this commits. The
+        global rollup row (job_id '') stays: lifetime stats are not reduced by gc.
+        """
+        files = [path for row in conn.execute("""
+            SELECT stdout, stderr FROM job_logs WHERE job_id IN (SELECT id FROM purge_ids) AND encoding = ?
+        """, (ENCODING_GZIP_FILE,)) for path in row if path]
+        logs = conn.execute("DELETE FROM job_logs WHERE job_id IN (SELECT id FROM purge_ids)").rowcount
+        metrics = conn.execute("DELETE FROM job_metrics WHERE job_id IN (SELECT id FROM purge_ids)").rowcount
+        for table in ("runtime_stats", "runtime_histogram"):
+            conn.execute(f"DELETE FROM {table} WHERE job_id IN (SELECT id FROM purge_ids) AND job_id != ''")
+        return {"job_logs": logs, "job_metrics": metrics}, files
+
+    @staticmethod
+    def _unlink(files: List[str]) -> int:
+        removed = 0
+        for path in files:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def purge_completed(self, job_ids: List[str]) -> Dict[str, int]:
+        """Delete completed jobs and their logs/metrics/rollups in one short transaction."""
+        params = [(job_id,) for job_id in job_ids]
+        with self._write() as conn:
+            # Skip any id that was re-enqueued since it was selected.
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS purge_ids (id TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM purge_ids")
+            conn.executemany("""
+                INSERT OR IGNORE INTO purge_ids (id)
+                SELECT id FROM jobs WHERE id = ? AND state = 'completed'
+            """, params)
+            counts, files = self._purge_history(conn)
+            counts["jobs"] = conn.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM purge_ids)").rowcount
+            # Edges from their dependents stay, so `dag` can show a purged (completed) parent.
+            conn.execute("DELETE FROM job_deps WHERE job_id IN (SELECT id FROM purge_ids)")
+            conn.execute("DELETE FROM purge_ids")
+        counts["log_files"] = self._unlink(files)
+        return counts
+
+    def dlq_before(self, cutoff: str, limit: int) -> List[Dict[str, Any]]:
+        """DLQ entries buried before cutoff, oldest first, with their logs and runtimes."""
+        with self._read() as conn:
+            rows = conn.execute(f"""
+                SELECT {DLQ_SELECT} FROM dlq
+                WHERE dead_at < ? ORDER BY dead_at LIMIT ?
+            """, (cutoff, limit)).fetchall()
+        return self._with_history([dict(zip(DLQ_COLUMNS, r)) for r in rows])
+
+    def purge_dlq(self, job_ids: List[str]) -> Dict[str, int]:
+        """Delete DLQ entries with the logs, metrics and rollups of their runs."""
+        with self._write() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS purge_ids (id TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM purge_ids")
+            conn.executemany("INSERT OR IGNORE INTO purge_ids (id) SELECT id FROM dlq WHERE id = ?",
+                             [(i,) for i in job_ids])
+            counts, files = self._purge_dlq_ids(conn)
+        counts["log_files"] = self._unlink(files)
+        return counts
+
+    def _purge_dlq_ids(self, conn: sqlite3.Connection) -> Tuple[Dict[str, int], List[str]]:
+        # The job left jobs when it was buried; its history only goes with the DLQ row.
+        # An id that belongs to a live job again keeps it, as that job's history now.
+        dlq = conn.execute("DELETE FROM dlq WHERE id IN (SELECT id FROM purge_ids)").rowcount
+        conn.execute("DELETE FROM purge_ids WHERE id IN (SELECT id FROM jobs)")
+        counts, files = self._purge_history(conn)
+        counts["dlq"] = dlq
+        conn.execute("DELETE FROM purge_ids")
+        return counts, files
+
+    def purge_throughput(self, before: str) -> int:
+        """Delete per-minute throughput rows older than before (an ISO timestamp)."""
+        with self._write() as conn:
+            return conn.execute("DELETE FROM throughput WHERE minute < ?", (before[:16],)).rowcount
+
+    def compact(self, checkpoint: str = "PASSIVE", vacuum_pages: int = 1000) -> Dict[str, int]:
+        """Checkpoint the WAL and hand up to vacuum_pages free pages back to the filesystem."""
+        conn = self._conn()
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if vacuum_pages:
+            conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})").fetchall()
+        free_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        busy, wal_pages, checkpointed = conn.execute(f"PRAGMA wal_checkpoint({checkpoint})").fetchone()
+        return {"pages_freed": free_before - free_after, "free_pages": free_after,
+                "wal_pages": wal_pages, "wal_checkpointed": checkpointed}
+
+    def vacuum(self) -> None:
+        """Full rebuild; also switches an older database to incremental auto_vacuum."""
+        conn = self._conn()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
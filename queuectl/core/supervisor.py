@@ -0,0 +1,403 @@
+import json
+import math
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from queuectl.core.notify import notify_workers
+from queuectl.core import telemetry
+
+# Crashed workers are restarted after min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2**n)
+# seconds, n counting crashes since the worker last stayed up for RESTART_RESET seconds.
+RESTART_BACKOFF_BASE = 0.5
+RESTART_BACKOFF_MAX = 30.0
+RESTART_RESET = 60.0
+
+
+class SupervisorError(Exception):
+    pass
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_pidfile(path: str) -> Optional[int]:
+    """The pid in path if that process is still running, else None."""
+    try:
+        with open(path) as f:
+            pid = int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return None
+    return pid if pid and pid_alive(pid) else None
+
+
+def control_request(path: str, request: Dict[str, Any], timeout: float = 5.0) -> Dict[str, Any]:
+    """Send one JSON request to a supervisor's control socket and return its reply.
+
+    Raises SupervisorError when no supervisor is listening.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    except (FileNotFoundError, ConnectionRefusedError) as e:
+        raise SupervisorError("no supervisor is running") from e
+    except OSError as e:
+        raise SupervisorError(f"control socket {path}: {e}") from e
+    finally:
+        sock.close()
+    if not data:
+        raise SupervisorError("supervisor closed the connection without replying")
+    return json.loads(data)
+
+
+def desired_workers(current: int, pending: int, p95_wait: Optional[float], min_workers: int,
+                    max_workers: int, target_pending: int, max_wait: float) -> int:
+    """Worker count the autoscaler aims for.
+
+    Enough workers for each to have at most target_pending ready jobs. One more than
+    now while the p95 wait from enqueue to start is over max_wait. Scaling down is
+    one worker at a time, and never while jobs wait max_wait or longer, so a short lull
+    doesn't drain the fleet.
+    """
+    want = math.ceil(pending / target_pending) if target_pending > 0 else current
+    slow = p95_wait is not None and p95_wait >= max_wait
+    if slow and pending:
+        want = max(want, current + 1)
+    if want < current:
+        want = current if slow else current - 1
+    return max(min_workers, min(max_workers, want))
+
+
+class _Slot:
+    def __init__(self, number: int):
+        self.number = number
+        self.process = None
+        self.stop_event = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.crashes = 0  # since the last RESTART_RESET seconds of uptime
+        self.restart_at: Optional[float] = None
+        self.draining = False
+
+
+class Supervisor:
+    """Runs worker processes, restarts crashed ones and serves a control socket.
+
+    Each worker runs `target(stop_event, slot, *extra_args(slot))` in a spawned process,
+    where slot is its 1-based number. Stopping a worker sets its stop_event, so it
+    finishes its in-flight jobs and releases its prefetched batch before exiting
+    (drain). With min_workers < max_workers, the count follows pending depth and the
+    p95 enqueue-to-start wait (from worker telemetry in metrics_dir).
+
+    Control requests, one JSON object per connection: {"cmd": "status"}, {"cmd": "stop"},
+    {"cmd": "scale", "count": N} (fixes the count) or {"cmd": "scale", "min": A, "max": B},
+    plus any in `commands`.
+    """
+
+    def __init__(self, target: Callable, extra_args: Callable[[int], Tuple], count: int,
+                 pidfile: str, control_socket: str, wakeup_dir: Optional[str] = None,
+                 min_workers: Optional[int] = None, max_workers: Optional[int] = None,
+                 storage=None, metrics_dir: Optional[str] = None, target_pending: int = 100,
+                 max_wait: float = 5.0, autoscale_interval: float = 10.0,
+                 drain_timeout: float = 60.0, tick: Optional[Callable[[], None]] = None,
+                 on_crash: Optional[Callable[[int, int], None]] = None,
+                 commands: Optional[Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]] = None,
+                 log: Callable[[str], None] = print):
+        self.target = target
+        self.extra_args = extra_args
+        self.pidfile = pidfile
+        self.control_socket = control_socket
+        self.wakeup_dir = wakeup_dir
+        self.min_workers = count if min_workers is None else min_workers
+        self.max_workers = count if max_workers is None else max(max_workers, self.min_workers)
+        self.count = max(self.min_workers, min(self.max_workers, count))
+        self.storage = storage
+        self.metrics_dir = metrics_dir
+        self.target_pending = target_pending
+        self.max_wait = max_wait
+        self.autoscale_interval = autoscale_interval
+        self.drain_timeout = drain_timeout
+        self.tick = tick
+        self.on_crash = on_crash  # (slot, pid), e.g. to hand the dead worker's jobs back at once
+        self.commands = dict(commands or {})  # extra control commands: cmd -> handler(request) -> reply
+        self.log = log
+        self.slots: Dict[int, _Slot] = {}
+        self.started_at = time.time()
+        self.last_scale: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        import multiprocessing  # not at module level: CLI clients only need control_request
+        self._ctx = multiprocessing.get_context("spawn")
+        self._server = None
+        self._wait_counts: Optional[List[int]] = None
+
+    @property
+    def autoscaling(self) -> bool:
+        return self.min_workers < self.max_workers
+
+    # --- lifecycle ---
+
+    def _claim_pidfile(self) -> None:
+        running = read_pidfile(self.pidfile)
+        if running and running != os.getpid():
+            raise SupervisorError(f"a supervisor is already running (PID {running})")
+        os.makedirs(os.path.dirname(os.path.abspath(self.pidfile)), exist_ok=True)
+        with open(self.pidfile, "w") as f:
+            f.write(f"{os.getpid()}\n")
+
+    def _open_control_socket(self) -> None:
+        if os.path.exists(self.control_socket):
+            os.unlink(self.control_socket)  # stale: the pidfile check passed
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.control_socket)
+        os.chmod(self.control_socket, 0o600)
+        server.listen(8)
+        self._server = server
+        threading.Thread(target=self._serve, name="supervisor-control", daemon=True).start()
+
+    def run(self) -> None:
+        """Start the workers and supervise them until stop() or SIGTERM/SIGINT."""
+        self._claim_pidfile()
+        try:
+            self._open_control_socket()
+            if threading.current_thread() is threading.main_thread():
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, lambda *_: self._stop.set())
+            with self._lock:
+                self._reconcile()
+            next_scale = time.monotonic() + self.autoscale_interval
+            while not self._stop.wait(0.5):
+                with self._lock:
+                    self._reap()
+                    if self.autoscaling and time.monotonic() >= next_scale:
+                        next_scale = time.monotonic() + self.autoscale_interval
+                        self._autoscale()
+                    self._reconcile()
+                if self.tick:
+                    self.tick()
+            self.log("Shutdown requested. Draining workers...")
+            self._shutdown()
+        finally:
+            if self._server:
+                self._server.close()
+                try:
+                    os.unlink(self.control_socket)
+                except OSError:
+                    pass
+            if read_pidfile(self.pidfile) == os.getpid():
+                os.unlink(self.pidfile)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _start(self, slot: _Slot) -> None:
+        slot.stop_event = self._ctx.Event()
+        slot.process = self._ctx.Process(target=self.target,
+                                         args=(slot.stop_event, slot.number) + tuple(self.extra_args(slot.number)))
+        slot.process.start()
+        slot.started_at = time.monotonic()
+        slot.restart_at = None
+        slot.draining = False
+        self.log(f"Worker {slot.number} started (PID {slot.process.pid})")
+
+    def _drain(self, slot: _Slot) -> None:
+        if slot.process is None or slot.draining:
+            return
+        slot.draining = True
+        slot.stop_event.set()
+        notify_workers(self.wakeup_dir)  # an idle worker is blocked on its wakeup socket
+        self.log(f"Worker {slot.number} draining (PID {slot.process.pid})")
+
+    def _reap(self) -> None:
+        now = time.monotonic()
+        for number, slot in list(self.slots.items()):
+            proc = slot.process
+            if proc is None or proc.is_alive():
+                continue
+            proc.join()
+            code = proc.exitcode
+            slot.process = None
+            if slot.draining and code == 0:
+                self.log(f"Worker {number} stopped")
+                del self.slots[number]
+                continue
+            if self.on_crash:
+                try:
+                    self.on_crash(number, proc.pid)
+                except Exception as e:
+                    self.log(f"Worker {number}: recovering its jobs failed: {e}")
+            if slot.draining:
+                self.log(f"Worker {number} exited with code {code} while draining")
+                del self.slots[number]
+                continue
+            if now - slot.started_at >= RESTART_RESET:
+                slot.crashes = 0
+            delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF_BASE * 2 ** slot.crashes)
+            slot.crashes += 1
+            slot.restart_at = now + delay
+            self.log(f"Worker {number} exited with code {code}; restarting in {delay:.1f}s")
+
+    def _reconcile(self) -> None:
+        """Start, restart or drain workers until `count` are running."""
+        active = sorted(n for n, s in self.slots.items() if not s.draining)
+        for number in active[self.count:]:
+            if self.slots[number].process is None:
+                del self.slots[number]  # was waiting to be restarted
+            else:
+                self._drain(self.slots[number])
+        number = 1
+        while len([s for s in self.slots.values() if not s.draining]) < self.count:
+            if number not in self.slots:
+                self.slots[number] = _Slot(number)
+                self._start(self.slots[number])
+            number += 1
+        now = time.monotonic()
+        for slot in self.slots.values():
+            if slot.process is None and not slot.draining and slot.restart_at is not None and now >= slot.restart_at:
+                slot.restarts += 1
+                self._start(slot)
+
+    def _shutdown(self) -> None:
+        with self._lock:
+            for slot in self.slots.values():
+                self._drain(slot)
+        deadline = time.monotonic() + self.drain_timeout
+        for slot in list(self.slots.values()):
+            if slot.process is None:
+                continue
+            slot.process.join(max(0.0, deadline - time.monotonic()))
+            if slot.process.is_alive():
+                self.log(f"Worker {slot.number} still busy after {self.drain_timeout:.0f}s; terminating")
+                slot.process.terminate()
+                slot.process.join(5)
+                if self.on_crash:
+                    try:
+                        self.on_crash(slot.number, slot.process.pid)
+                    except Exception as e:
+                        self.log(f"Worker {slot.number}: recovering its jobs failed: {e}")
+        self.slots.clear()
+        self.log("All workers stopped.")
+
+    # --- autoscaling ---
+
+    def _p95_wait(self) -> Optional[float]:
+        """p95 enqueue-to-start wait over the claims since the previous call."""
+        if not self.metrics_dir:
+            return None
+        snapshot = telemetry.merge_snapshots(telemetry.read_snapshots(self.metrics_dir))
+        counts = None
+        for name, _, hist_counts, _ in snapshot["histograms"]:
+            if name == "queuectl_wait_seconds":
+                counts = hist_counts if counts is None else [a + b for a, b in zip(counts, hist_counts)]
+        if counts is None:
+            return None
+        previous = self._wait_counts or [0] * len(counts)
+        self._wait_counts = counts
+        # A restarted worker starts from zero again; never count negative claims.
+        return telemetry.histogram_quantile([max(0, a - b) for a, b in zip(counts, previous)], 0.95)
+
+    def _autoscale(self) -> None:
+        pending = self.storage.count_ready() if self.storage is not None else 0
+        p95 = self._p95_wait()
+        want = desired_workers(self.count, pending, p95, self.min_workers, self.max_workers,
+                               self.target_pending, self.max_wait)
+        self.last_scale = {"pending": pending, "p95_wait": p95, "desired": want}
+        if want != self.count:
+            self.log(f"Autoscale: {self.count} -> {want} workers "
+                     f"(pending {pending}, p95 wait {'n/a' if p95 is None else f'{p95:.2f}s'})")
+            self.count = want
+
+    # --- control socket ---
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            # A thread per request: a slow one (or one that queries us back) mustn't block others.
+            threading.Thread(target=self._reply, args=(conn,), name="supervisor-request", daemon=True).start()
+
+    def _reply(self, conn: socket.socket) -> None:
+        with conn:
+            try:
+                conn.settimeout(5)
+                data = b""
+                while not data.endswith(b"\n"):
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+                reply = self.handle(json.loads(data or b"{}"))
+            except Exception as e:
+                reply = {"ok": False, "error": str(e)}
+            try:
+                conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+            except OSError:
+                pass
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        cmd = request.get("cmd")
+        if cmd == "status":
+            return dict(self.status(), ok=True)
+        if cmd == "stop":
+            self.stop()
+            return {"ok": True, "pid": os.getpid()}
+        if cmd == "scale":
+            with self._lock:
+                if request.get("count") is not None:
+                    count = int(request["count"])
+                    if count < 0:
+                        raise ValueError("count must be >= 0")
+                    self.min_workers = self.max_workers = self.count = count
+                else:
+                    low = int(request.get("min", self.min_workers))
+                    high = int(request.get("max", self.max_workers))
+                    if low < 0 or high < low:
+                        raise ValueError("need 0 <= min <= max")
+                    self.min_workers, self.max_workers = low, high
+                    self.count = max(low, min(high, self.count))
+                self._reconcile()
+            return dict(self.status(), ok=True)
+        if cmd in self.commands:
+            return self.commands[cmd](request)
+        raise ValueError(f"unknown command {cmd!r}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            workers = [{
+                "slot": slot.number,
+                "pid": slot.process.pid if slot.process else None,
+                "state": ("draining" if slot.draining else "running" if slot.process else "restarting"),
+                "uptime": round(now - slot.started_at, 1) if slot.process else 0.0,
+                "restarts": slot.restarts,
+            } for slot in sorted(self.slots.values(), key=lambda s: s.number)]
+            return {
+                "pid": os.getpid(),
+                "uptime": round(time.time() - self.started_at, 1),
+                "target": self.count,
+                "live": sum(1 for s in self.slots.values() if s.process is not None and not s.draining),
+                "min": self.min_workers,
+                "max": self.max_workers,
+                "autoscaling": self.autoscaling,
+                "last_scale": self.last_scale,
+                "workers": workers,
+            }
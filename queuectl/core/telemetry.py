@@ -0,0 +1,301 @@
+import bisect
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) shared by every histogram, so snapshots from different
+# processes merge by adding bucket counts.
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+HELP = {
+    "queuectl_claim_seconds": "Time to claim a batch of jobs, including the write lock wait.",
+    "queuectl_execute_seconds": "Time running a job's command or callable.",
+    "queuectl_spawn_seconds": "Time to start a job's subprocess.",
+    "queuectl_persist_seconds": "Time to commit a job's outcome, including any group-commit wait.",
+    "queuectl_idle_seconds": "Time idle workers spent waiting for work.",
+    "queuectl_wait_seconds": "Time from a job becoming due (enqueue or run_at) to its claim.",
+    "queuectl_storage_lock_wait_seconds": "Time waiting for SQLite's write lock (BEGIN IMMEDIATE).",
+    "queuectl_storage_commit_seconds": "Time to COMMIT a write transaction.",
+    "queuectl_claims_total": "Jobs claimed by workers.",
+    "queuectl_jobs_total": "Jobs finished by workers, by outcome.",
+    "queuectl_leases_reclaimed_total": "Expired leases reclaimed, by result.",
+    "queuectl_jobs": "Jobs currently in each state.",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+
+class Telemetry:
+    """In-process counters and fixed-bucket histograms.
+
+    Recording is a dict lookup, a bisect and two additions under a lock, cheap enough
+    for every claim and commit. snapshot() gives a JSON-able copy; see write_snapshot
+    and merge_snapshots for how worker processes are combined.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._histograms: Dict[Tuple[str, LabelKey], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.counts[i] += 1
+            hist.sum += seconds
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": [[name, dict(labels), value]
+                             for (name, labels), value in self._counters.items()],
+                "histograms": [[name, dict(labels), list(h.counts), h.sum]
+                               for (name, labels), h in self._histograms.items()],
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+# One registry per process; Storage and Worker record into it.
+TELEMETRY = Telemetry()
+
+
+def write_snapshot(directory: str, name: str, telemetry: Telemetry = TELEMETRY) -> str:
+    """Atomically replace <directory>/<name>.json with the current snapshot."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.json")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(telemetry.snapshot(), f)
+    os.replace(tmp, path)
+    return path
+
+
+def read_snapshots(directory: str) -> List[Dict[str, Any]]:
+    snapshots = []
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # being replaced, or left half-written by a crash
+    return snapshots
+
+
+def clear_snapshots(directory: str) -> None:
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if name.endswith(".json"):
+            os.unlink(os.path.join(directory, name))
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    counters: Dict[Tuple[str, LabelKey], float] = {}
+    histograms: Dict[Tuple[str, LabelKey], List[Any]] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(sorted(labels.items())))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total in snap.get("histograms", []):
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+    return {
+        "counters": [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, dict(labels), counts, total] for (name, labels), (counts, total) in histograms.items()],
+    }
+
+
+def histogram_quantile(counts: List[int], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding quantile q, or None with no observations.
+
+    The +Inf bucket reports the largest finite bound.
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = max(1, math.ceil(q * total))
+    seen = 0
+    for upper, n in zip(BUCKETS + (BUCKETS[-1],), counts):
+        seen += n
+        if seen >= rank:
+            return upper
+    return BUCKETS[-1]
+
+
+def _labels(labels: Dict[str, Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = sorted(labels.items()) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(snapshot: Dict[str, Any], gauges: Optional[Dict[str, List[Tuple[Dict[str, Any], float]]]] = None) -> str:
+    """Render a (merged) snapshot plus gauges in the Prometheus text format."""
+    lines: List[str] = []
+
+    def header(name: str, kind: str) -> None:
+        if name in HELP:
+            lines.append(f"# HELP {name} {HELP[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    by_name: Dict[str, List[Any]] = {}
+    for name, labels, value in snapshot["counters"]:
+        by_name.setdefault(name, []).append((labels, value))
+    for name in sorted(by_name):
+        header(name, "counter")
+        for labels, value in sorted(by_name[name], key=lambda item: sorted(item[0].items())):
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+    hists: Dict[str, List[Any]] = {}
+    for name, labels, counts, total in snapshot["histograms"]:
+        hists.setdefault(name, []).append((labels, counts, total))
+    for name in sorted(hists):
+        header(name, "histogram")
+        for labels, counts, total in sorted(hists[name], key=lambda item: sorted(item[0].items())):
+            cumulative = 0
+            for upper, n in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if upper == float("inf") else repr(upper)
+                lines.append(f"{name}_bucket{_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    for name in sorted(gauges or {}):
+        header(name, "gauge")
+        for labels, value in gauges[name]:
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def queue_depth_gauges(storage) -> Dict[str, List[Tuple[Dict[str, Any], float]]]:
+    counts = {"pending": 0, "blocked": 0, "processing": 0, "completed": 0, "failed": 0, "dead": 0}
+    counts.update(storage.count_by_state())
+    return {"queuectl_jobs": [({"state": state}, n) for state, n in sorted(counts.items())]}
+
+
+def render(directory: str, storage) -> str:
+    """Exposition of every worker snapshot in directory plus current queue depth."""
+    return exposition(merge_snapshots(read_snapshots(directory)), queue_depth_gauges(storage))
+
+
+def write_textfile(path: str, text: str) -> None:
+    """Write for node_exporter's textfile collector: atomically, so it never reads a partial file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def serve(host: str, port: int, directory: str, storage_factory) -> "object":
+    """Serve GET /metrics on a daemon thread; returns the server (call shutdown() to stop)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    local = threading.local()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            if getattr(local, "storage", None) is None:
+                local.storage = storage_factory()
+            body = render(directory, local.storage).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class StackSampler:
+    """Samples every thread's Python stack at `interval` and counts them.
+
+    Unlike cProfile, which only sees the thread it was enabled in, this covers all of a
+    worker's slot threads, and costs one sys._current_frames() call per sample.
+    write() saves collapsed stacks ("frame;frame;frame count"), the input format of
+    flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                key = ";".join(reversed(parts))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(f"{stack} {n}\n")
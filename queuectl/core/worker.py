@@ -1,78 +1,370 @@
-import subprocess
+import os
 import shlex
+import sys
+import threading
 import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Event
-from typing import Dict, Any
-from queuectl.core.storage import Storage
+from typing import Dict, Any, List, Optional, Tuple
+from queuectl.core.storage import Storage, DEFAULT_LEASE_SECONDS
 from queuectl.core.queue import Queue
 from queuectl.core.backoff import exponential_backoff
-from datetime import datetime
+from queuectl.core.notify import WakeupListener
+from queuectl.core.logcapture import (
+    CappedBuffer, GzipFileBuffer, ENCODING_GZIP_FILE, pack_output, run_process,
+)
+from queuectl.core.pyexec import CallablePool, parse_callable
+from queuectl.core.completion import CompletionWriter
+from queuectl.core.telemetry import TELEMETRY, write_snapshot
+from datetime import datetime, timedelta, timezone
+
+
+def _seconds_until(run_at: Optional[str]) -> Optional[float]:
+    if not run_at:
+        return None
+    try:
+        due = datetime.fromisoformat(run_at)
+    except ValueError:
+        return None
+    if due.tzinfo is not None:
+        due = due.astimezone(timezone.utc).replace(tzinfo=None)
+    return (due - datetime.utcnow()).total_seconds()
+
+
+def _wait_seconds(job: Dict[str, Any]) -> float:
+    """How long a just-claimed job had been due: since enqueue, or since run_at if later."""
+    waits = [-s for s in (_seconds_until(job.get("created_at")), _seconds_until(job.get("run_at")))
+             if s is not None]
+    return max(0.0, min(waits)) if waits else 0.0
+
 
 class Worker:
     def __init__(self, storage: Storage, worker_id: int, stop_event: Event,
-                 base_backoff: int, max_backoff: int, max_retries: int):
+                 base_backoff: int, max_backoff: int, max_retries: int, batch_size: int = 1,
+                 wakeup_dir: Optional[str] = None, idle_poll_min: float = 0.05,
+                 idle_poll_max: float = 2.0, concurrency: int = 1,
+                 log_max_bytes: int = 1048576, log_compress: bool = True,
+                 log_dir: Optional[str] = None, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                 reap_interval: float = 30.0, python_max_tasks: int = 1000,
+                 python_max_memory_mb: int = 512, python_preload: Optional[List[str]] = None,
+                 queues: Optional[List[str]] = None, result_cache_max_bytes: int = 64 * 1024 * 1024,
+                 completion_window: float = 0.005, completion_batch: int = 100,
+                 metrics_dir: Optional[str] = None, metrics_interval: float = 5.0):
         self.storage = storage
         self.queue = Queue(storage)
         self.worker_id = worker_id
+        # Recorded on claimed rows; unique across every process sharing the database.
+        self.claim_token = f"worker-{worker_id}@{os.getpid()}"
         self.stop_event = stop_event
         self.base_backoff = base_backoff
         self.max_backoff = max_backoff
         self.max_retries = max_retries
+        self.batch_size = max(1, batch_size)
+        self.queues = queues or None  # named queues to serve; None = all
+        self._batch = deque()
+        self.wakeup_dir = wakeup_dir
+        self.idle_poll_min = idle_poll_min
+        self.idle_poll_max = max(idle_poll_min, idle_poll_max)
+        self._idle_poll = idle_poll_min
+        self._listener = None
+        # Execution slots: jobs run on a thread pool so one process can drive many
+        # I/O-bound subprocesses; the semaphore counts free slots, _running the jobs
+        # submitted and not yet finished.
+        self.concurrency = max(1, concurrency)
+        self._slots = threading.Semaphore(self.concurrency)
+        self._running = 0
+        self._running_lock = threading.Lock()
+        # Output capture: head+tail capped per stream, zlib-compressed in job_logs, or
+        # streamed whole to gzip files under log_dir when that is set.
+        self.log_max_bytes = log_max_bytes
+        self.log_compress = log_compress
+        self.log_dir = log_dir
+        # Claims carry a lease that a heartbeat thread renews while this process holds
+        # them; the same thread periodically re-queues jobs whose owner stopped renewing.
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = max(lease_seconds / 3.0, 0.01)
+        self.reap_interval = reap_interval
+        self._heartbeat_stop = threading.Event()
+        # Callable jobs run in warm Python processes, one per slot, started on first use.
+        self.python_max_tasks = python_max_tasks
+        self.python_max_memory_mb = python_max_memory_mb
+        self.python_preload = python_preload or []
+        self._python_pool = None
+        self._python_pool_lock = threading.Lock()
+        self.result_cache_max_bytes = result_cache_max_bytes
+        # A job's log, metric and new state are committed in one transaction. With several
+        # slots, a background writer also group-commits outcomes from different slots
+        # (see CompletionWriter); completion_window=0 commits whatever is already queued.
+        self.completion_window = completion_window
+        self.completion_batch = completion_batch
+        self._completion_writer = None
+        # Phase timers and counters go to the process-wide TELEMETRY registry; with
+        # metrics_dir set, the heartbeat thread saves a snapshot there for the exporter.
+        self.metrics_dir = metrics_dir
+        self.metrics_interval = metrics_interval
+
+    def _output_buffers(self, job_id: Optional[str]):
+        if self.log_dir and job_id:
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+            base = os.path.join(self.log_dir, job_id.replace(os.sep, "_"), stamp)
+            return GzipFileBuffer(f"{base}.stdout.gz"), GzipFileBuffer(f"{base}.stderr.gz")
+        return CappedBuffer(self.log_max_bytes), CappedBuffer(self.log_max_bytes)
+
+    def _python(self) -> CallablePool:
+        with self._python_pool_lock:
+            if self._python_pool is None:
+                self._python_pool = CallablePool(self.concurrency, self.python_max_tasks,
+                                                 self.python_max_memory_mb, self.python_preload)
+            return self._python_pool
 
-    def run_command(self, command: str, timeout: int) -> (int, str, str):
+    def run_command(self, command: str, timeout: int,
+                    job_id: Optional[str] = None) -> Tuple[int, Any, Any, Optional[str]]:
+        """Run command, streaming its output; returns (code, stdout, stderr, log encoding).
+
+        A command holding a callable spec (see queuectl.core.pyexec) runs in the warm
+        Python pool instead of a fresh subprocess.
+        """
+        stdout_buf, stderr_buf = self._output_buffers(job_id)
         try:
-            args = command if isinstance(command, list) else shlex.split(command)
-            proc = subprocess.run(
-                args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                timeout=timeout
-            )
-            return proc.returncode, proc.stdout, proc.stderr
-        except subprocess.TimeoutExpired:
-            return -2, "", "Process timed out"
+            spec = parse_callable(command)
+            if spec is not None:
+                code, timed_out = self._python().run(spec, timeout, stdout_buf, stderr_buf)
+            else:
+                args = command if isinstance(command, list) else shlex.split(command)
+                code, timed_out = run_process(args, timeout, stdout_buf, stderr_buf)
+            if timed_out:
+                code = -2
+                stderr_buf.write(b"Process timed out")
         except FileNotFoundError:
-            return 127, "", "Command not found"
+            code = 127
+            stderr_buf.write(b"Command not found")
         except Exception as e:
-            return 1, "", str(e)
+            code = 1
+            stderr_buf.write(str(e).encode())
+        finally:
+            stdout_buf.close()
+            stderr_buf.close()
+        if isinstance(stdout_buf, GzipFileBuffer):
+            return code, stdout_buf.path, stderr_buf.path, ENCODING_GZIP_FILE
+        return (code,) + pack_output(stdout_buf.getvalue(), stderr_buf.getvalue(), self.log_compress)
+
+    def _record(self, job: Dict[str, Any], log=None, runtime: Optional[float] = None,
+                dead_error: Optional[str] = None) -> bool:
+        """Commit a job's outcome; returns once it is durable.
+
+        Returns False, without writing anything, if this worker no longer holds the
+        job's claim (its lease lapsed and was reclaimed, maybe by another worker).
+        """
+        # job["worker_id"] is the claim token the job was fetched under (our claim_token).
+        outcome = {"job": job, "log": log, "runtime_seconds": runtime, "dead_error": dead_error,
+                   "owner": job.get("worker_id")}
+        with TELEMETRY.timer("queuectl_persist_seconds"):
+            if self._completion_writer is not None:
+                recorded = self._completion_writer.submit(outcome)
+            else:
+                recorded = not self.storage.record_outcomes([outcome])
+        if not recorded:
+            TELEMETRY.inc("queuectl_jobs_total", outcome="dropped")
+            print(f"Worker {self.worker_id}: dropped outcome of job {job['id']}: "
+                  "its lease was reclaimed", file=sys.stderr)
+        return recorded
+
+    def _complete_from_cache(self, job: Dict[str, Any]) -> bool:
+        """Finish job with its cached result, if there is one; no metric is recorded."""
+        hit = self.storage.cache_get(job["cache_key"])
+        if hit is None:
+            return False
+        job["state"] = "completed"
+        job["updated_at"] = datetime.utcnow().isoformat()
+        job["last_error"] = None
+        if self._record(job, (hit["stdout"], hit["stderr"], hit["encoding"])):
+            TELEMETRY.inc("queuectl_jobs_total", outcome="cached")
+        return True
 
     def _execute_and_handle(self, job: Dict[str, Any]) -> None:
+        if job.get("cache_key") and self._complete_from_cache(job):
+            return
         timeout = job.get("timeout_seconds") or 30  # default 30 sec
         start_time = time.time()
-        code, stdout, stderr = self.run_command(job["command"], timeout)
+        code, stdout, stderr, encoding = self.run_command(job["command"], timeout, job["id"])
         runtime = time.time() - start_time
-
-        # Save logs
-        self.storage.insert_job_log(job["id"], stdout, stderr)
-        # Save runtime metric
-        self.storage.insert_job_metric(job["id"], runtime)
+        TELEMETRY.observe("queuectl_execute_seconds", runtime,
+                          kind="callable" if parse_callable(job["command"]) else "shell")
 
         now = datetime.utcnow().isoformat()
+        log = (stdout, stderr, encoding)
         if code == 0:
             job["state"] = "completed"
             job["updated_at"] = now
             job["last_error"] = None
-            self.storage.update_job(job)
+            if self._record(job, log, runtime):
+                TELEMETRY.inc("queuectl_jobs_total", outcome="completed")
+                # Only successes are cached: a failure may be transient, and retries must
+                # rerun it. Output kept in gzip files under log_dir can be deleted, so it
+                # isn't cached either; nor is a run whose claim lapsed before it finished.
+                if job.get("cache_key") and encoding != ENCODING_GZIP_FILE:
+                    self.storage.cache_put(job["cache_key"], code, stdout, stderr, encoding, runtime,
+                                           job.get("cache_ttl") or 3600, self.result_cache_max_bytes)
         else:
             attempts = int(job.get("attempts", 0)) + 1
             job["attempts"] = attempts
-            error_msg = f"Exit code {code}" if code >=0 else stderr or "Timeout"
+            if code == -2:
+                error_msg = "Process timed out"
+            elif code >= 0:
+                error_msg = f"Exit code {code}"
+            else:
+                error_msg = f"Terminated by signal {-code}"
             if attempts >= int(job.get("max_retries", self.max_retries)):
-                self.storage.move_to_dlq(job, last_error=error_msg)
+                if self._record(job, log, runtime, dead_error=error_msg):
+                    TELEMETRY.inc("queuectl_jobs_total", outcome="dead")
             else:
+                # Reschedule instead of sleeping: the worker moves on, and the run_at
+                # filter in fetch_next_pending holds the job back until the delay expires.
                 delay = exponential_backoff(attempts, self.base_backoff, self.max_backoff)
-                if delay > 0:
-                    time.sleep(min(delay, self.max_backoff))
                 job["state"] = "pending"
                 job["updated_at"] = now
                 job["last_error"] = error_msg
-                self.storage.upsert_job(job)
+                job["run_at"] = (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+                if self._record(job, log, runtime):
+                    TELEMETRY.inc("queuectl_jobs_total", outcome="retried")
 
-    def run(self):
-        while not self.stop_event.is_set():
-            job = self.queue.fetch_next()
-            if not job:
-                time.sleep(0.2)
-                continue
+    def _release_batch(self) -> None:
+        # Jobs claimed but not started go back to pending so other workers can take them.
+        if self._batch:
+            self.queue.release([job["id"] for job in self._batch], self.claim_token)
+            self._batch.clear()
+
+    def _wait_for_work(self) -> None:
+        # Block until an enqueue notification, the next scheduled run_at, or the adaptive
+        # poll interval (which backs off while the queue stays empty) - whichever is first.
+        timeout = self._idle_poll
+        due_in = _seconds_until(self.storage.next_run_at())
+        if due_in is not None:
+            timeout = min(timeout, max(due_in, 0.0))
+        with TELEMETRY.timer("queuectl_idle_seconds"):
+            if self._listener:
+                woken = self._listener.wait(timeout)
+            else:
+                woken = self.stop_event.wait(timeout)
+        if woken:
+            self._idle_poll = self.idle_poll_min
+        else:
+            self._idle_poll = min(self._idle_poll * 2, self.idle_poll_max)
+
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        if not self._batch:
+            limit = self.batch_size
+            if self.concurrency > 1:
+                # Never claim more than the free slots (the one just acquired included),
+                # so a claimed job doesn't sit leased behind busy slots.
+                with self._running_lock:
+                    limit = max(1, min(limit, self.concurrency - self._running))
+            with TELEMETRY.timer("queuectl_claim_seconds"):
+                jobs = self.queue.fetch_batch(limit, self.claim_token,
+                                              self.lease_seconds, self.queues)
+            if jobs:
+                TELEMETRY.inc("queuectl_claims_total", len(jobs))
+                for job in jobs:
+                    TELEMETRY.observe("queuectl_wait_seconds", _wait_seconds(job))
+                self._batch.extend(jobs)
+        return self._batch.popleft() if self._batch else None
+
+    def reap_expired(self) -> Dict[str, int]:
+        reclaimed = self.storage.reclaim_expired(self.max_retries)
+        for result, n in reclaimed.items():
+            if n:
+                TELEMETRY.inc("queuectl_leases_reclaimed_total", n, result=result)
+        if reclaimed["requeued"] or reclaimed["dead"]:
+            print(f"Worker {self.worker_id}: reclaimed expired leases: "
+                  f"{reclaimed['requeued']} re-queued, {reclaimed['dead']} moved to DLQ")
+        return reclaimed
+
+    def _heartbeat(self) -> None:
+        # Runs until run() has finished every in-flight job, not just until stop_event.
+        next_reap = next_renew = next_flush = time.monotonic()
+        while True:
+            now = time.monotonic()
+            try:
+                if now >= next_renew:
+                    next_renew = now + self.heartbeat_interval
+                    self.storage.renew_leases(self.claim_token, self.lease_seconds)
+                if self.reap_interval and now >= next_reap:
+                    next_reap = now + self.reap_interval
+                    self.reap_expired()
+                if self.metrics_dir and now >= next_flush:
+                    next_flush = now + self.metrics_interval
+                    self.flush_metrics()
+            except Exception:
+                print(f"Worker {self.worker_id}: heartbeat failed:", file=sys.stderr)
+                traceback.print_exc()
+            wake_at = next_renew
+            if self.metrics_dir:
+                wake_at = min(wake_at, next_flush)
+            if self._heartbeat_stop.wait(max(wake_at - time.monotonic(), 0.0)):
+                return
+
+    def flush_metrics(self) -> None:
+        write_snapshot(self.metrics_dir, f"worker-{self.worker_id}")
+
+    def _run_in_slot(self, job: Dict[str, Any]) -> None:
+        try:
             self._execute_and_handle(job)
+        except Exception:
+            print(f"Worker {self.worker_id}: job {job['id']} failed to complete:", file=sys.stderr)
+            traceback.print_exc()
+        finally:
+            with self._running_lock:
+                self._running -= 1
+            self._slots.release()
+
+    def run(self):
+        # Bound before the first poll, so a notification sent in between is not lost.
+        self._listener = WakeupListener.open(self.wakeup_dir, self.claim_token)
+        self._heartbeat_stop.clear()
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True,
+                                     name=f"worker-{self.worker_id}-heartbeat")
+        heartbeat.start()
+        pool = None
+        if self.concurrency > 1:
+            pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                      thread_name_prefix=f"worker-{self.worker_id}-slot")
+            # No more than one outcome per slot can be waiting, so a full batch never
+            # needs to wait out the window.
+            self._completion_writer = CompletionWriter(self.storage, self.completion_window,
+                                                       min(self.completion_batch, self.concurrency))
+        try:
+            while not self.stop_event.is_set():
+                # Only claim when a slot is free; _next_job also caps each claim at the
+                # free slots, so claimed jobs never queue behind busy ones. Without a
+                # pool, a batch runs one job after another by design.
+                if pool and not self._slots.acquire(timeout=0.5):
+                    continue
+                job = self._next_job()
+                if not job:
+                    if pool:
+                        self._slots.release()
+                    self._wait_for_work()
+                    continue
+                self._idle_poll = self.idle_poll_min
+                if pool:
+                    with self._running_lock:
+                        self._running += 1
+                    pool.submit(self._run_in_slot, job)
+                else:
+                    self._execute_and_handle(job)
+        finally:
+            self._release_batch()
+            if pool:
+                pool.shutdown(wait=True)  # let in-flight jobs finish and record their outcome
+                self._completion_writer.close()
+                self._completion_writer = None
+            self._heartbeat_stop.set()
+            heartbeat.join()
+            if self.metrics_dir:
+                self.flush_metrics()
+            if self._python_pool:
+                self._python_pool.close()
+            if self._listener:
+                self._listener.close()
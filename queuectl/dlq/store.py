@@ -1,4 +1,4 @@
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Any, Iterator
 from queuectl.core.storage import Storage
 
 class DLQStore:
@@ -8,5 +8,20 @@ class DLQStore:
     def list_dlq(self) -> List[Dict[str, Any]]:
         return self.storage.load_dlq()
 
-    def retry(self, dlq_job_id: str) -> Optional[Dict[str, Any]]:
-        return self.storage.retry_dlq_item(dlq_job_id)
+    def iter_dlq(self, **filters) -> Iterator[Dict[str, Any]]:
+        return self.storage.iter_dlq(**filters)
+
+    def retry(self, dlq_job_id: str, default_max_retries: int = 3) -> Dict[str, int]:
+        return self.storage.retry_dlq_item(dlq_job_id, default_max_retries)
+
+    def retry_matching(self, default_max_retries: int = 3, **filters) -> Dict[str, int]:
+        return self.storage.retry_dlq(default_max_retries, **filters)
+
+    def purge_matching(self, **filters) -> int:
+        return self.storage.purge_dlq_matching(**filters)
+
+    def count(self, **filters) -> int:
+        return self.storage.count_dlq(**filters)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return self.storage.dlq_stats()
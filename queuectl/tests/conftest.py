@@ -0,0 +1,17 @@
+import threading
+import pytest
+from queuectl.core.worker import Worker
+
+
+@pytest.fixture
+def make_worker():
+    """Worker factory for tests that call _execute_and_handle directly.
+
+    Backoff is long, so a failed job waits for its run_at instead of being picked up
+    again by the next fetch_next_pending in the test.
+    """
+    def make(store, **kwargs):
+        options = {"base_backoff": 60, "max_backoff": 600, "max_retries": 1}
+        options.update(kwargs)
+        return Worker(store, 1, threading.Event(), **options)
+    return make
@@ -9,3 +9,85 @@ def test_storage_basic(tmp_path):
     assert job["id"] == "t1"
     items = q.list()
     assert any(j["id"] == "t1" for j in items)
+
+def test_storage_reuses_wal_connection(tmp_path):
+    store = Storage(str(tmp_path / "wal.db"), synchronous="NORMAL", busy_timeout=1000)
+    conn = store._conn()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 1000
+    Queue(store).enqueue({"id": "w1", "command": "true"})
+    assert store._conn() is conn
+    store.close()
+    assert store.list_jobs()[0]["id"] == "w1"
+
+def test_batch_claim_and_release(tmp_path):
+    store = Storage(str(tmp_path / "batch.db"))
+    q = Queue(store)
+    for i, prio in enumerate([5, 1, 3, 2]):
+        q.enqueue({"id": f"b{i}", "command": "true", "priority": prio})
+    batch = q.fetch_batch(3, "w1")
+    assert [j["id"] for j in batch] == ["b1", "b3", "b2"]
+    assert q.release([j["id"] for j in batch[1:]], "w2") == 0
+    assert q.release([j["id"] for j in batch[1:]], "w1") == 2
+    states = {j["id"]: j["state"] for j in q.list()}
+    assert states == {"b0": "pending", "b1": "processing", "b2": "pending", "b3": "pending"}
+
+def test_migrations_upgrade_legacy_database(tmp_path):
+    import sqlite3
+    from queuectl.core.storage import DB_SCHEMA, SCHEMA_VERSION
+    db = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(db)
+    legacy.executescript(DB_SCHEMA)
+    legacy.close()
+    store = Storage(db)
+    conn = store._conn()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_jobs_queue_ready", "idx_job_logs_job", "idx_job_metrics_job"} <= indexes
+    Queue(store).enqueue({"id": "m1", "command": "true"})
+    assert store.fetch_next_pending("w1")["worker_id"] == "w1"
+
+def test_open_current_database_skips_ddl_and_read_only_mode(tmp_path):
+    import sqlite3
+    import pytest
+    db = str(tmp_path / "ro.db")
+    Queue(Storage(db)).enqueue({"id": "r1", "command": "true"})
+    writer = sqlite3.connect(db, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")  # a worker mid-transaction
+    # Neither open waits for the write lock: the schema is already current.
+    assert Storage(db, busy_timeout=100).get_job("r1")["state"] == "pending"
+    reader = Storage(db, busy_timeout=100, readonly=True)
+    assert reader.count_by_state() == {"pending": 1}
+    writer.rollback()
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        Queue(reader).enqueue({"id": "r2", "command": "true"})
+    # A missing file is created (with its schema) even when opened read-only.
+    assert Storage(str(tmp_path / "new.db"), readonly=True).count_by_state() == {}
+
+def test_enqueue_many_chunks_and_generates_unique_ids(tmp_path):
+    import pytest
+    store = Storage(str(tmp_path / "bulk.db"))
+    q = Queue(store)
+    result = q.enqueue_many(({"command": f"echo {i}"} for i in range(250)), chunk_size=100)
+    assert result == {"created": 250, "deduplicated": 0, "errors": []}
+    ids = [j["id"] for j in q.list()]
+    assert len(set(ids)) == 250
+    # ULID-based ids sort in creation order.
+    assert [j["command"] for j in q.list()] == [f"echo {i}" for i in range(250)]
+    with pytest.raises(ValueError):
+        Queue.validate_payload({"command": "true", "priority": "high"})
+    with pytest.raises(ValueError):
+        Queue.validate_payload(["not", "an", "object"])
+
+def test_iter_jobs_keyset_pagination_and_filters(tmp_path):
+    store = Storage(str(tmp_path / "page.db"))
+    q = Queue(store)
+    for i in range(25):
+        q.enqueue({"id": f"p{i:02d}", "command": "true", "priority": i % 2})
+    q.enqueue({"id": "other", "command": "true"})
+    ids = [j["id"] for j in store.iter_jobs(id_prefix="p", page_size=4)]
+    assert ids == [f"p{i:02d}" for i in range(25)]
+    assert [j["id"] for j in store.iter_jobs(limit=3, after="p10", page_size=2)] == ["p11", "p12", "p13"]
+    assert len(list(store.iter_jobs(priority=1, state="pending", page_size=5))) == 12
+    store.move_to_dlq(store.get_job("p03"), "boom")
+    assert [d["id"] for d in store.iter_dlq(id_prefix="p0")] == ["p03"]
@@ -0,0 +1,44 @@
+import json
+from queuectl import bench
+
+
+def test_compare_flags_regressions_in_either_direction():
+    baseline = {
+        "enqueue.single": {"value": 1000.0, "unit": "jobs/s", "higher_is_better": True},
+        "latency.p99": {"value": 10.0, "unit": "ms", "higher_is_better": False},
+    }
+    current = {
+        "enqueue.single": {"value": 1100.0, "unit": "jobs/s", "higher_is_better": True},
+        "latency.p99": {"value": 12.0, "unit": "ms", "higher_is_better": False},
+        "new.metric": {"value": 1.0, "unit": "ms", "higher_is_better": False},
+    }
+    rows = {r["name"]: r for r in bench.compare(current, baseline, max_regression=10)}
+    assert set(rows) == {"enqueue.single", "latency.p99"}
+    assert round(rows["enqueue.single"]["change"]) == 10 and not rows["enqueue.single"]["regressed"]
+    assert round(rows["latency.p99"]["change"]) == -20 and rows["latency.p99"]["regressed"]
+    assert bench.percentile([5, 1, 4, 2, 3], 50) == 3
+
+
+def test_enqueue_scenario_saves_json_and_compares(tmp_path):
+    out = tmp_path / "run.json"
+    assert bench.main(["--scenarios", "enqueue", "--jobs", "50", "--json", str(out)]) == 0
+    saved = json.loads(out.read_text())
+    assert set(saved["metrics"]) == {"enqueue.single", "enqueue.bulk"}
+    assert saved["meta"]["args"]["jobs"] == 50
+    assert bench.main(["--scenarios", "enqueue", "--jobs", "50", "--baseline", str(out)]) == 0
+
+
+def test_startup_scenario_times_local_and_client_commands(tmp_path):
+    out = tmp_path / "startup.json"
+    assert bench.main(["--scenarios", "startup", "--startup-runs", "2", "--json", str(out)]) == 0
+    metrics = json.loads(out.read_text())["metrics"]
+    assert {"startup.local.status.p50", "startup.client.enqueue.p50", "startup.client.list.p50"} <= set(metrics)
+    assert not metrics["startup.local.status.p50"]["higher_is_better"]
+
+
+def test_scenario_that_times_out_fails_the_run(tmp_path, capsys):
+    out = tmp_path / "run.json"
+    assert bench.main(["--scenarios", "latency", "enqueue", "--samples", "1", "--timeout", "0",
+                       "--jobs", "10", "--json", str(out)]) == 1
+    assert "latency: FAILED" in capsys.readouterr().err
+    assert set(json.loads(out.read_text())["metrics"]) == {"enqueue.single", "enqueue.bulk"}
@@ -0,0 +1,53 @@
+import time
+
+from queuectl.core.queue import Queue
+from queuectl.core.storage import Storage
+
+
+def test_cache_hit_completes_without_running(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "c.db"))
+    q = Queue(store)
+    w = make_worker(store)
+    marker = tmp_path / "runs"
+    command = f"sh -c 'echo run >> {marker}; echo result'"
+    for job_id in ("c1", "c2"):
+        q.enqueue({"id": job_id, "command": command, "cache": {"ttl": 60}})
+        w._execute_and_handle(store.fetch_next_pending("w1"))
+        assert store.get_job(job_id)["state"] == "completed"
+        log = store.get_job_logs(job_id)[0]
+        assert log["stdout"].strip() == "result"
+    assert marker.read_text().count("run") == 1
+    stats = store.cache_stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+    # Failures are not cached.
+    q.enqueue({"id": "f1", "command": "false", "cache": {"key": "f"}})
+    w._execute_and_handle(store.fetch_next_pending("w1"))
+    assert store.cache_stats()["entries"] == 1
+
+
+def test_run_that_lost_its_claim_is_not_cached(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "c.db"))
+    Queue(store).enqueue({"id": "c1", "command": "echo result", "cache": {"key": "k"}})
+    w = make_worker(store)
+    stale = store.fetch_pending_batch(1, "w1", lease_seconds=0.05)[0]
+    time.sleep(0.1)
+    store.reclaim_expired()
+    store.fetch_pending_batch(1, "w2")
+    w._execute_and_handle(stale)
+    assert store.get_job("c1")["worker_id"] == "w2"
+    assert store.cache_stats()["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used_over_size(tmp_path):
+    store = Storage(str(tmp_path / "c.db"))
+    for key in ("a", "b", "c"):
+        store.cache_put(key, 0, b"x" * 100, b"", None, 0.1, ttl=60, max_bytes=250)
+        if key == "b":
+            assert store.cache_get("a") is not None  # a is now more recent than b
+    assert store.cache_get("b") is None
+    assert store.cache_get("a") and store.cache_get("c")
+    stats = store.cache_stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 200, 1)
+    # Expired entries are dropped on the next put.
+    store.cache_put("d", 0, b"", b"", None, 0.1, ttl=-1, max_bytes=250)
+    assert store.cache_get("d") is None
@@ -0,0 +1,68 @@
+import os
+import sys
+import pytest
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+
+def report_pid(tag):
+    print(f"{tag} {os.getpid()}")
+    print("to stderr", file=sys.stderr)
+
+
+def explode():
+    raise RuntimeError("kaboom")
+
+
+def _run_next(w, store):
+    w._execute_and_handle(store.fetch_next_pending())
+
+
+def _stdout(store, job_id):
+    return store.get_job_logs(job_id)[0]["stdout"]
+
+
+def test_callable_payload_validation():
+    Queue.validate_payload({"callable": "os:getcwd"})
+    for bad in ({"callable": "os.getcwd"}, {"callable": "os:getcwd", "args": "x"},
+                {"callable": "os:getcwd", "kwargs": []}):
+        with pytest.raises(ValueError):
+            Queue.validate_payload(bad)
+
+
+def test_callable_jobs_reuse_warm_process_and_recycle(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "py.db"))
+    q = Queue(store)
+    for i in range(3):
+        q.enqueue({"id": f"py{i}", "callable": "test_callables:report_pid", "args": [f"run{i}"]})
+    w = make_worker(store, python_max_tasks=2)
+    try:
+        for _ in range(3):
+            _run_next(w, store)
+    finally:
+        w._python_pool.close()
+    pids = [_stdout(store, f"py{i}").split()[1] for i in range(3)]
+    assert _stdout(store, "py0").startswith("run0 ")
+    assert store.get_job_logs("py0")[0]["stderr"] == "to stderr\n"
+    assert pids[0] == pids[1] != pids[2]  # recycled after two tasks
+    assert all(store.get_job(f"py{i}")["state"] == "completed" for i in range(3))
+
+
+def test_callable_failures_follow_retry_semantics(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "pyfail.db"))
+    q = Queue(store)
+    q.enqueue({"id": "boom", "callable": "test_callables:explode"}, max_retries=1)
+    q.enqueue({"id": "slow", "callable": "time:sleep", "args": [10], "timeout_seconds": 1},
+              max_retries=1)
+    q.enqueue({"id": "after", "callable": "test_callables:report_pid", "args": ["ok"]})
+    w = make_worker(store)
+    try:
+        for _ in range(3):
+            _run_next(w, store)
+    finally:
+        w._python_pool.close()
+    dead = {d["id"]: d["last_error"] for d in store.load_dlq()}
+    assert dead == {"boom": "Exit code 1", "slow": "Process timed out"}
+    assert "RuntimeError: kaboom" in store.get_job_logs("boom")[0]["stderr"]
+    # The timed-out process was killed and replaced.
+    assert store.get_job("after")["state"] == "completed"
@@ -1,2 +1,45 @@
-def test_dummy_concurrency():
-    assert True
+import multiprocessing
+from collections import Counter
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+JOBS = 300
+WORKERS = 12
+
+
+def _claim_all(db_path, worker_id, start_event, results):
+    store = Storage(db_path)
+    start_event.wait()
+    claimed = []
+    while True:
+        job = store.fetch_next_pending(worker_id)
+        if not job:
+            break
+        claimed.append(job["id"])
+        job["state"] = "completed"
+        store.update_job(job)
+    results.put(claimed)
+
+
+def test_no_duplicate_claims_across_processes(tmp_path):
+    db = str(tmp_path / "stress.db")
+    q = Queue(Storage(db))
+    for i in range(JOBS):
+        q.enqueue({"id": f"s{i}", "command": "true"})
+
+    ctx = multiprocessing.get_context("spawn")
+    start_event = ctx.Event()
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_claim_all, args=(db, f"w{i}", start_event, results))
+             for i in range(WORKERS)]
+    for p in procs:
+        p.start()
+    start_event.set()
+    claimed = [job_id for _ in procs for job_id in results.get(timeout=120)]
+    for p in procs:
+        p.join(timeout=30)
+
+    counts = Counter(claimed)
+    assert [job_id for job_id, n in counts.items() if n > 1] == []
+    assert len(counts) == JOBS
+    assert all(j["state"] == "completed" and j["worker_id"] for j in q.list())
@@ -0,0 +1,91 @@
+import pytest
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+
+def _diamond(tmp_path):
+    store = Storage(str(tmp_path / "dag.db"))
+    q = Queue(store)
+    q.enqueue_many([
+        {"id": "a", "command": "true"},
+        {"id": "b", "command": "true", "depends_on": ["a"]},
+        {"id": "c", "command": "true", "depends_on": ["a"]},
+        {"id": "d", "command": "true", "depends_on": ["b", "c"]},
+    ], max_retries=1)
+    return store, q
+
+
+def _complete(store, job_id):
+    job = store.fetch_next_pending("w")
+    assert job["id"] == job_id
+    job["state"] = "completed"
+    store.update_job(job)
+
+
+def test_dependents_are_released_as_dependencies_complete(tmp_path):
+    store, q = _diamond(tmp_path)
+    assert store.count_by_state() == {"pending": 1, "blocked": 3}
+    _complete(store, "a")
+    _complete(store, "b")
+    assert store.get_job("d")["state"] == "blocked" and store.get_job("d")["unmet_deps"] == 1
+    _complete(store, "c")
+    _complete(store, "d")
+    assert store.fetch_next_pending("w") is None
+    nodes = store.dag("c")
+    assert [n["id"] for n in nodes] == ["a", "b", "c", "d"]
+    assert nodes[3]["depends_on"] == ["b", "c"]
+    assert {n["state"] for n in nodes} == {"completed"}
+
+
+def test_rerun_dependency_is_counted_once(tmp_path):
+    store, q = _diamond(tmp_path)
+    _complete(store, "a")
+    _complete(store, "b")
+    q.enqueue({"id": "b", "command": "true"})  # re-run a completed dependency
+    c, b = store.fetch_pending_batch(2, "w")
+    b["state"] = "completed"
+    store.update_job(b)
+    assert store.get_job("d")["state"] == "blocked" and store.get_job("d")["unmet_deps"] == 1
+    c["state"] = "completed"
+    store.update_job(c)
+    assert store.get_job("d")["state"] == "pending"
+
+
+def test_dlq_failure_propagates_to_dependents(tmp_path):
+    store, q = _diamond(tmp_path)
+    store.move_to_dlq(store.fetch_next_pending("w"), "Exit code 1")
+    assert store.count_by_state() == {"dead": 4}
+    errors = {d["id"]: d["last_error"] for d in store.load_dlq()}
+    assert errors["a"] == "Exit code 1" and errors["d"].startswith("Dependency ")
+    # A dependent retried before its failed dependency waits for it again.
+    store.retry_dlq_item("b")
+    assert store.get_job("b")["state"] == "blocked"
+    store.retry_dlq_item("a")
+    _complete(store, "a")
+    assert store.get_job("b")["state"] == "pending"
+    assert [n["state"] for n in store.dag("a")] == ["completed", "pending", "dead", "dead"]
+
+
+def test_dependency_validation(tmp_path):
+    store = Storage(str(tmp_path / "dagv.db"))
+    q = Queue(store)
+    with pytest.raises(ValueError):
+        q.enqueue({"id": "x", "command": "true", "depends_on": ["missing"]})
+    with pytest.raises(ValueError):
+        q.enqueue({"id": "x", "command": "true", "depends_on": "a"})
+    with pytest.raises(ValueError):
+        q.enqueue({"id": "x", "command": "true", "depends_on": ["x"]})
+    assert store.get_job("x") is None
+
+
+def test_bulk_enqueue_rejects_only_jobs_with_bad_dependencies(tmp_path):
+    store = Storage(str(tmp_path / "dagb.db"))
+    result = Queue(store).enqueue_many([
+        {"id": "a", "command": "true"},
+        {"id": "b", "command": "true", "depends_on": ["nope"]},
+        {"id": "c", "command": "true", "depends_on": ["a"]},
+    ])
+    assert result["created"] == 2 and result["deduplicated"] == 0
+    assert [job_id for job_id, _ in result["errors"]] == ["b"]
+    assert store.get_job("b") is None
+    assert store.get_job("c")["state"] == "blocked"
@@ -0,0 +1,59 @@
+import pytest
+
+from queuectl.core.ids import ulid
+from queuectl.core.queue import Queue
+from queuectl.core.sharding import ShardedStorage
+from queuectl.core.storage import Storage
+
+
+def test_ulids_are_unique_and_monotonic():
+    ids = [ulid() for _ in range(5000)]
+    assert len(set(ids)) == len(ids)
+    assert ids == sorted(ids)
+    assert all(len(i) == 26 for i in ids)
+
+
+def test_enqueue_does_not_reset_an_active_job(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    assert q.enqueue({"id": "a", "command": "true"})["status"] == "created"
+    claimed = store.fetch_next_pending("w1")
+    assert claimed["id"] == "a"
+    again = q.enqueue({"id": "a", "command": "echo overwritten"})
+    assert again["status"] == "deduplicated"
+    stored = store.get_job("a")
+    assert (stored["state"], stored["command"], stored["worker_id"]) == ("processing", "true", "w1")
+    # Once it has finished, the id can be enqueued again.
+    store.update_job(dict(stored, state="completed"))
+    assert q.enqueue({"id": "a", "command": "echo rerun"})["status"] == "created"
+    assert store.get_job("a")["state"] == "pending"
+
+
+def test_dedupe_key_drops_repeats_within_window(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    first = q.enqueue({"command": "true", "dedupe_key": "report:42"})
+    second = q.enqueue({"command": "true", "dedupe_key": "report:42"})
+    assert (first["status"], second["status"]) == ("created", "deduplicated")
+    assert second["existing_id"] == first["id"]
+    assert len(q.list()) == 1
+    result = q.enqueue_many([{"command": "true", "dedupe_key": k} for k in ("x", "y", "x", "report:42")])
+    assert result == {"created": 2, "deduplicated": 2, "errors": []}
+
+    # An expired key is taken over by the next job that uses it.
+    with store._write() as conn:
+        conn.execute("UPDATE dedupe_keys SET expires_at = '2000-01-01'")
+    assert store.purge_dedupe_keys() == 3
+    assert q.enqueue({"command": "true", "dedupe_key": "report:42", "dedupe_window": 60})["status"] == "created"
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_duplicate_id_does_not_claim_dedupe_key(tmp_path, shards):
+    store = Storage(str(tmp_path / "q.db")) if shards == 1 else ShardedStorage(str(tmp_path / "q.db"), shards)
+    q = Queue(store)
+    assert q.enqueue({"id": "x", "command": "echo one"})["status"] == "created"
+    assert q.enqueue({"id": "x", "command": "echo two", "dedupe_key": "K"})["status"] == "deduplicated"
+    assert store.get_job("x")["command"] == "echo one"
+    # K went unclaimed, so the next job using it is created.
+    assert q.enqueue({"id": "y", "command": "true", "dedupe_key": "K"})["status"] == "created"
+    assert q.enqueue({"id": "z", "command": "true", "dedupe_key": "K"})["existing_id"] == "y"
@@ -0,0 +1,82 @@
+import sqlite3
+from queuectl.core.sharding import ShardedStorage
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+
+def _bury(store, errors):
+    q = Queue(store)
+    for i, error in enumerate(errors):
+        q.enqueue({"id": f"d{i}", "command": f"./task.sh {i}", "priority": 3, "timeout_seconds": 7}, max_retries=5)
+        store.move_to_dlq(store.get_job(f"d{i}"), error)
+
+
+def test_dlq_keeps_job_settings_and_classifies_errors(tmp_path):
+    store = Storage(str(tmp_path / "dlq.db"))
+    _bury(store, ["Exit code 1", "Exit code 1", "Process timed out", "Lease expired (held by worker-1@9)"])
+    entry = store.load_dlq()[0]
+    assert (entry["max_retries"], entry["priority"], entry["timeout_seconds"]) == (5, 3, 7)
+    assert [(r["error_class"], r["count"]) for r in store.dlq_stats()] == [
+        ("exit_1", 2), ("lease_expired", 1), ("timeout", 1)]
+    assert [d["id"] for d in store.iter_dlq(error_class="exit_1")] == ["d0", "d1"]
+    buried = [d["dead_at"] for d in store.load_dlq()]
+    assert store.dlq_stats()[0]["oldest"] == min(buried[:2]) and store.count_dlq(before=max(buried)) == 3
+
+    store.retry_dlq_item("d2")
+    job = store.get_job("d2")
+    assert (job["max_retries"], job["priority"], job["timeout_seconds"]) == (5, 3, 7)
+
+
+def test_bulk_retry_and_purge_by_filter(tmp_path):
+    store = Storage(str(tmp_path / "dlq.db"))
+    _bury(store, ["Exit code 1", "Exit code 2: connection refused", "Exit code 1", "Process timed out"])
+    Queue(store).enqueue({"id": "d2", "command": "true"})  # id reused while d2 is dead
+    assert store.count_dlq(error="*refused*") == 1
+    assert store.count_dlq(error_class="exit_2") == 1
+
+    assert store.retry_dlq_item("d2") == {"retried": 0, "skipped": 1}
+    assert store.retry_dlq(error_class="exit_1") == {"retried": 1, "skipped": 1}
+    assert store.get_job("d0")["state"] == "pending"
+    assert [d["id"] for d in store.load_dlq()] == ["d1", "d2", "d3"]
+    assert store.purge_dlq_matching(command_prefix="./task.sh 3") == 1
+    assert store.purge_dlq_matching(before="2000-01-01") == 0
+    assert store.count_by_state() == {"pending": 2, "dead": 2}
+
+
+def test_bulk_retry_reblocks_dependents_until_parents_finish(tmp_path):
+    store = Storage(str(tmp_path / "dlq.db"))
+    Queue(store).enqueue_many([
+        {"id": "a", "command": "true"},
+        {"id": "b", "command": "true", "depends_on": ["a"]},
+    ], max_retries=1)
+    store.move_to_dlq(store.fetch_next_pending("w"), "Exit code 1")
+    assert [r["error_class"] for r in store.dlq_stats()] == ["dependency_failed", "exit_1"]
+
+    assert store.retry_dlq() == {"retried": 2, "skipped": 0}
+    assert store.get_job("b")["state"] == "blocked" and store.get_job("b")["unmet_deps"] == 1
+    job = store.fetch_next_pending("w")
+    job["state"] = "completed"
+    store.update_job(job)
+    assert store.get_job("b")["state"] == "pending"
+
+
+def test_rows_buried_before_settings_were_kept(tmp_path):
+    db = str(tmp_path / "old.db")
+    Storage(db).close()
+    conn = sqlite3.connect(db)
+    conn.execute("INSERT INTO dlq (id, command, attempts, created_at, last_error) "
+                 "VALUES ('old', 'true', 3, '2024-01-01', 'Terminated by signal 9')")
+    conn.commit()
+    conn.close()
+    store = Storage(db)
+    assert store.load_dlq()[0]["error_class"] == "signal_9"
+    assert store.retry_dlq(default_max_retries=4)["retried"] == 1
+    assert (store.get_job("old")["max_retries"], store.get_job("old")["priority"]) == (4, 10)
+
+
+def test_sharded_bulk_operations_fan_out(tmp_path):
+    store = ShardedStorage(str(tmp_path / "q.db"), 3)
+    _bury(store, ["Exit code 1"] * 6)
+    assert store.dlq_stats()[0]["count"] == 6
+    assert store.retry_dlq(error_class="exit_1")["retried"] == 6
+    assert store.count_dlq() == 0
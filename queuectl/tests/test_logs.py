@@ -0,0 +1,52 @@
+from queuectl.core.logcapture import CappedBuffer, iter_output
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+
+def test_capped_buffer_keeps_head_and_tail():
+    buf = CappedBuffer(10)
+    for i in range(100):
+        buf.write(str(i % 10).encode())
+    value = buf.getvalue()
+    assert value.startswith(b"01234") and value.endswith(b"56789")
+    assert b"[90 bytes truncated]" in value
+
+
+def test_large_output_is_capped_and_compressed(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "logs.db"))
+    Queue(store).enqueue({"id": "big", "command": "seq 1 200000"})
+    make_worker(store, log_max_bytes=4096)._execute_and_handle(store.fetch_next_pending())
+    (row,) = list(store.iter_job_logs("big"))
+    assert row["encoding"] == "zlib" and len(row["stdout"]) < 4096
+    text = "".join(iter_output(row["stdout"], row["encoding"], chunk_size=64))
+    assert text.startswith("1\n2\n") and text.endswith("199999\n200000\n")
+    assert "bytes truncated" in text
+    assert store.get_job_logs("big")[0]["stdout"] == text
+
+
+def test_output_spills_to_gzip_files(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "spill.db"))
+    Queue(store).enqueue({"id": "spill", "command": "echo hello"})
+    make_worker(store, log_dir=str(tmp_path / "joblogs"))._execute_and_handle(store.fetch_next_pending())
+    (row,) = list(store.iter_job_logs("spill"))
+    assert row["encoding"] == "gzip-file" and row["stdout"].endswith(".stdout.gz")
+    assert store.get_job_logs("spill")[0]["stdout"] == "hello\n"
+
+
+def test_timeout_keeps_partial_output(tmp_path, make_worker):
+    store = Storage(str(tmp_path / "timeout.db"))
+    Queue(store).enqueue({"id": "slow", "command": "sh -c 'echo started; sleep 5'",
+                          "timeout_seconds": 1}, max_retries=1)
+    make_worker(store)._execute_and_handle(store.fetch_next_pending())
+    log = store.get_job_logs("slow")[0]
+    assert log["stdout"] == "started\n" and log["stderr"] == "Process timed out"
+    assert store.load_dlq()[0]["last_error"] == "Process timed out"
+
+
+def test_empty_stderr_prints_no_header(capsys):
+    from queuectl.cli import write_output
+    write_output("", None, header="stderr:")
+    write_output(b"", "zlib", header="stderr:")
+    assert capsys.readouterr().out == ""
+    write_output("boom", None, header="stderr:")
+    assert capsys.readouterr().out == "stderr:\nboom\n"
@@ -0,0 +1,64 @@
+import time
+from collections import Counter
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+
+
+def _fill(q, queue, n, priority=10):
+    q.enqueue_many({"id": f"{queue}-{i:03d}", "command": "true", "queue": queue, "priority": priority}
+                   for i in range(n))
+
+
+def _claim(store, n, **kwargs):
+    return [store.fetch_next_pending("w", **kwargs) for _ in range(n)]
+
+
+def test_weighted_fair_share_beats_priority_flood(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    _fill(q, "flood", 100, priority=1)
+    _fill(q, "other", 100)
+    store.configure_queue("other", weight=3)
+    served = Counter(job["queue"] for job in _claim(store, 40))
+    assert served == {"other": 30, "flood": 10}
+
+
+def test_idle_queue_does_not_bank_credit(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    _fill(q, "a", 100)
+    _claim(store, 50)
+    _fill(q, "b", 100)
+    served = Counter(job["queue"] for job in _claim(store, 20))
+    assert served == {"a": 10, "b": 10}
+
+
+def test_max_in_flight_and_batch_claims(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    _fill(q, "heavy", 5)
+    store.configure_queue("heavy", max_in_flight=2)
+    batch = store.fetch_pending_batch(10, "w")
+    assert [j["id"] for j in batch] == ["heavy-000", "heavy-001"]
+    assert store.fetch_next_pending("w") is None
+    batch[0]["state"] = "completed"
+    store.update_job(batch[0])
+    assert store.fetch_next_pending("w")["id"] == "heavy-002"
+    store.configure_queue("heavy", max_in_flight=None)
+    assert len(store.fetch_pending_batch(10, "w")) == 2
+
+
+def test_rate_limit_and_queue_filter(tmp_path):
+    store = Storage(str(tmp_path / "q.db"))
+    q = Queue(store)
+    _fill(q, "slow", 10)
+    _fill(q, "fast", 3)
+    store.configure_queue("slow", rate=10, burst=2)
+    claimed = _claim(store, 3, queues=["slow"])
+    assert [j and j["queue"] for j in claimed] == ["slow", "slow", None]  # burst of 2
+    assert store.fetch_next_pending("w", queues=["fast"])["queue"] == "fast"
+    time.sleep(0.25)  # ~2.5 tokens refilled, capped at the burst of 2
+    assert len(store.fetch_pending_batch(10, "w", queues=["slow"])) == 2
+    rows = {r["name"]: r for r in store.list_queues()}
+    assert rows["slow"]["rate"] == 10 and rows["slow"]["processing"] == 4
+    assert rows["fast"]["pending"] == 2
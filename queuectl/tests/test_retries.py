@@ -13,3 +13,27 @@ def test_retry_logic_basic(tmp_path):
         next_job = store.fetch_next_pending()
         if next_job:
             store.update_job(next_job)
+
+def test_failed_job_is_rescheduled_without_blocking(tmp_path):
+    import threading
+    import time
+    from datetime import datetime
+    from queuectl.core.worker import Worker
+    store = Storage(str(tmp_path / "test3.db"))
+    q = Queue(store)
+    q.enqueue({"id": "flaky", "command": "false"}, max_retries=2)
+    w = Worker(store, 1, threading.Event(), base_backoff=60, max_backoff=600, max_retries=2)
+
+    started = time.time()
+    w._execute_and_handle(store.fetch_next_pending())
+    assert time.time() - started < 5
+    job = q.get("flaky")
+    assert job["state"] == "pending" and job["attempts"] == 1
+    assert job["run_at"] > datetime.utcnow().isoformat()
+    assert store.fetch_next_pending() is None  # not eligible until run_at
+
+    job["run_at"] = None
+    store.update_job(job)
+    w._execute_and_handle(store.fetch_next_pending())
+    assert q.get("flaky") is None
+    assert [d["id"] for d in store.load_dlq()] == ["flaky"]
@@ -0,0 +1,62 @@
+from queuectl.core.janitor import Janitor
+from queuectl.core.queue import Queue
+from queuectl.core.sharding import ShardedStorage, shard_index
+
+
+def test_jobs_are_routed_by_id_and_reads_fan_out(tmp_path):
+    store = ShardedStorage(str(tmp_path / "q.db"), 3)
+    q = Queue(store)
+    q.enqueue_many({"id": f"s{i:02d}", "command": "true"} for i in range(30))
+    for shard in store.shards:
+        assert 0 < len(shard.list_jobs()) < 30
+    assert store.get_job("s07")["id"] == "s07"
+    assert store.shard_for("s07").get_job("s07") is not None
+    assert [j["id"] for j in store.iter_jobs(limit=5, after="s10")] == [f"s{i}" for i in range(11, 16)]
+
+    job = store.fetch_next_pending("w")
+    store.move_to_dlq(job, "boom")
+    store.insert_job_log(job["id"], "out", "", None)
+    assert store.count_by_state() == {"pending": 29, "dead": 1}
+    assert [d["id"] for d in store.load_dlq()] == [job["id"]]
+    assert store.get_job_logs(job["id"])[0]["stdout"] == "out"
+
+
+def test_claims_prefer_home_shard_then_steal(tmp_path):
+    path = str(tmp_path / "q.db")
+    ids = [f"j{i}" for i in range(20)]
+    home_ids = [i for i in ids if shard_index(i, 2) == 1]
+    Queue(ShardedStorage(path, 2)).enqueue_many({"id": i, "command": "true"} for i in ids)
+
+    worker_store = ShardedStorage(path, 2, home=1)
+    claimed = [worker_store.fetch_next_pending("w")["id"] for _ in ids]
+    assert set(claimed[:len(home_ids)]) == set(home_ids)
+    assert sorted(claimed) == sorted(ids)  # the rest were stolen from shard 0
+    assert worker_store.fetch_next_pending("w") is None
+
+
+def test_claims_follow_priority_across_shards(tmp_path):
+    path = str(tmp_path / "q.db")
+    ids = [f"p{i}" for i in range(20)]
+    away = [i for i in ids if shard_index(i, 2) == 0][:2]
+    Queue(ShardedStorage(path, 2)).enqueue_many(
+        {"id": i, "command": "true", "priority": 1 if i in away else 10} for i in ids)
+
+    worker_store = ShardedStorage(path, 2, home=1)
+    # Urgent jobs on the other shard go first; equal priorities then stay home.
+    assert sorted(worker_store.fetch_next_pending("w")["id"] for _ in away) == sorted(away)
+    assert shard_index(worker_store.fetch_next_pending("w")["id"], 2) == 1
+
+
+def test_janitor_drains_every_shard(tmp_path):
+    store = ShardedStorage(str(tmp_path / "q.db"), 2)
+    Queue(store).enqueue_many({"id": f"c{i}", "command": "true"} for i in range(10))
+    while True:
+        job = store.fetch_next_pending("w")
+        if not job:
+            break
+        job["state"] = "completed"
+        job["updated_at"] = f"2020-01-01T00:00:{job['id'][1:].zfill(2)}"
+        store.update_job(job)
+    stats = Janitor(store, keep_completed=4).run_once()
+    assert stats["jobs"] == 6
+    assert sorted(j["id"] for j in store.list_jobs()) == ["c6", "c7", "c8", "c9"]
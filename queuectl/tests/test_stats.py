@@ -0,0 +1,36 @@
+import threading
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+from queuectl.core.worker import Worker
+
+
+def test_state_counts_follow_every_transition(tmp_path):
+    store = Storage(str(tmp_path / "counts.db"))
+    q = Queue(store)
+    for i in range(5):
+        q.enqueue({"id": f"j{i}", "command": "true"})
+    q.enqueue({"id": "j0", "command": "true"})  # upsert of an existing row
+    job = store.fetch_next_pending("w")
+    job["state"] = "completed"
+    store.update_job(job)
+    store.move_to_dlq(store.fetch_next_pending("w"), "boom")
+    store.fetch_next_pending("w")
+    assert store.count_by_state() == {"pending": 2, "processing": 1, "completed": 1, "dead": 1}
+    store.retry_dlq_item(store.load_dlq()[0]["id"])
+    assert store.count_by_state() == {"pending": 3, "processing": 1, "completed": 1}
+
+
+def test_runtime_summary_and_throughput(tmp_path):
+    store = Storage(str(tmp_path / "rt.db"))
+    for i in range(100):
+        store.insert_job_metric("a" if i < 90 else "b", 0.002 if i < 90 else 3.0)
+    summary = store.runtime_summary()
+    assert summary["count"] == 100 and summary["max"] == 3.0
+    assert summary["p50"] == 0.0025 and summary["p95"] == 3.0
+    assert abs(summary["avg"] - (90 * 0.002 + 10 * 3.0) / 100) < 1e-9
+    assert store.runtime_summary("b")["p50"] == 3.0
+    assert sum(w["runs"] for w in store.throughput(5)) == 100
+
+    Queue(store).enqueue({"id": "t", "command": "true"})
+    Worker(store, 1, threading.Event(), 2, 10, 1)._execute_and_handle(store.fetch_next_pending())
+    assert sum(w["completed"] for w in store.throughput(5)) == 1
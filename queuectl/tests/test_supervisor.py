@@ -0,0 +1,70 @@
+import io
+import os
+import threading
+import time
+from queuectl.core.supervisor import Supervisor, control_request, desired_workers, read_pidfile
+
+
+def idle_worker(stop_event, slot):
+    stop_event.wait(30)
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_desired_workers():
+    # 450 ready jobs at 100 per worker -> 5, capped by max
+    assert desired_workers(2, 450, None, 1, 4, 100, 5.0) == 4
+    # slow starts add a worker even below the depth target
+    assert desired_workers(2, 50, 8.0, 1, 8, 100, 5.0) == 3
+    # scale down one at a time, but not while jobs still wait max_wait
+    assert desired_workers(4, 0, 0.1, 1, 8, 100, 5.0) == 3
+    assert desired_workers(4, 0, 5.0, 1, 8, 100, 5.0) == 4
+    assert desired_workers(1, 0, None, 1, 8, 100, 5.0) == 1
+
+
+def test_supervisor_scales_restarts_and_stops(tmp_path):
+    crashed = []
+    sup = Supervisor(idle_worker, lambda slot: (), 2, str(tmp_path / "s.pid"), str(tmp_path / "s.sock"),
+                     drain_timeout=5, on_crash=lambda slot, pid: crashed.append(slot),
+                     commands={"echo": lambda request: {"ok": True, "text": request["text"]}},
+                     log=lambda msg: None)
+    t = threading.Thread(target=sup.run)
+    t.start()
+    sock = str(tmp_path / "s.sock")
+    wait_for(lambda: os.path.exists(sock) and control_request(sock, {"cmd": "status"})["live"] == 2)
+    assert read_pidfile(str(tmp_path / "s.pid")) == os.getpid()
+    assert control_request(sock, {"cmd": "echo", "text": "hi"}) == {"ok": True, "text": "hi"}
+
+    reply = control_request(sock, {"cmd": "scale", "count": 3})
+    assert reply["ok"] and reply["target"] == 3
+    wait_for(lambda: control_request(sock, {"cmd": "status"})["live"] == 3)
+
+    victim = control_request(sock, {"cmd": "status"})["workers"][0]
+    os.kill(victim["pid"], 9)
+    wait_for(lambda: control_request(sock, {"cmd": "status"})["workers"][0]["restarts"] == 1)
+    assert crashed == [victim["slot"]]
+
+    assert control_request(sock, {"cmd": "scale", "min": 3, "max": 1})["ok"] is False
+    assert control_request(sock, {"cmd": "stop"})["ok"]
+    t.join(timeout=15)
+    assert not t.is_alive()
+    assert not os.path.exists(sock) and not os.path.exists(tmp_path / "s.pid")
+
+
+def test_client_output_capture_is_per_thread():
+    from queuectl.cli import ThreadCapture
+    stream = io.StringIO()
+    capture = ThreadCapture(stream)
+    with capture.capture() as out:
+        print("reply", file=capture)
+        t = threading.Thread(target=print, args=("janitor",), kwargs={"file": capture})
+        t.start()
+        t.join()
+    print("after", file=capture)
+    assert out.getvalue() == "reply\n"
+    assert stream.getvalue() == "janitor\nafter\n"
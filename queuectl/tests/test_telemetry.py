@@ -0,0 +1,45 @@
+import threading
+from queuectl.core import telemetry
+from queuectl.core.queue import Queue
+from queuectl.core.storage import Storage
+from queuectl.core.worker import Worker
+
+
+def test_snapshots_merge_into_prometheus_text(tmp_path):
+    a, b = telemetry.Telemetry(), telemetry.Telemetry()
+    a.observe("queuectl_claim_seconds", 0.0003)
+    b.observe("queuectl_claim_seconds", 2.0)
+    a.inc("queuectl_jobs_total", outcome="completed")
+    b.inc("queuectl_jobs_total", 2, outcome="completed")
+    telemetry.write_snapshot(str(tmp_path), "worker-1", a)
+    telemetry.write_snapshot(str(tmp_path), "worker-2", b)
+    merged = telemetry.merge_snapshots(telemetry.read_snapshots(str(tmp_path)))
+    text = telemetry.exposition(merged, {"queuectl_jobs": [({"state": "pending"}, 4)]})
+    assert 'queuectl_jobs_total{outcome="completed"} 3' in text
+    assert 'queuectl_claim_seconds_bucket{le="0.0005"} 1' in text
+    assert 'queuectl_claim_seconds_bucket{le="+Inf"} 2' in text
+    assert "queuectl_claim_seconds_count 2" in text
+    assert 'queuectl_jobs{state="pending"} 4' in text
+    assert "# TYPE queuectl_claim_seconds histogram" in text
+
+
+def test_worker_records_phases_and_flushes_snapshot(tmp_path):
+    telemetry.TELEMETRY.reset()
+    store = Storage(str(tmp_path / "t.db"))
+    Queue(store).enqueue({"id": "t1", "command": "true"})
+    stop = threading.Event()
+    metrics = str(tmp_path / "metrics")
+    w = Worker(store, 1, stop, base_backoff=1, max_backoff=1, max_retries=1,
+               idle_poll_min=0.01, idle_poll_max=0.01, metrics_dir=metrics, metrics_interval=60)
+    t = threading.Thread(target=w.run)
+    t.start()
+    while store.get_job("t1")["state"] != "completed":
+        stop.wait(0.01)
+    stop.set()
+    t.join(timeout=5)
+    text = telemetry.render(metrics, store)
+    for name in ("queuectl_claim_seconds", "queuectl_execute_seconds", "queuectl_persist_seconds",
+                 "queuectl_spawn_seconds", "queuectl_storage_commit_seconds"):
+        assert f"{name}_count" in text
+    assert 'queuectl_jobs_total{outcome="completed"} 1' in text
+    assert 'queuectl_jobs{state="completed"} 1' in text
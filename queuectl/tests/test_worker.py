@@ -0,0 +1,163 @@
+import threading
+import time
+from queuectl.core.notify import WakeupListener, notify_workers
+from queuectl.core.storage import Storage
+from queuectl.core.queue import Queue
+from queuectl.core.worker import Worker
+
+
+def test_enqueue_wakes_listener(tmp_path):
+    wake_dir = str(tmp_path / "wake")
+    listener = WakeupListener.open(wake_dir, "w1")
+    assert listener is not None
+    assert listener.wait(0.01) is False
+    Queue(Storage(str(tmp_path / "n.db")), wake_dir).enqueue({"id": "n1", "command": "true"})
+    assert listener.wait(1.0) is True
+    assert listener.wait(0.01) is False  # notifications were coalesced
+    listener.close()
+    assert notify_workers(wake_dir) == 0
+
+
+def test_idle_worker_starts_new_job_promptly(tmp_path):
+    wake_dir = str(tmp_path / "wake")
+    store = Storage(str(tmp_path / "w.db"))
+    stop = threading.Event()
+    # A long poll interval: only the wakeup can explain a fast start.
+    w = Worker(store, 1, stop, base_backoff=2, max_backoff=10, max_retries=1,
+               wakeup_dir=wake_dir, idle_poll_min=30, idle_poll_max=30)
+    t = threading.Thread(target=w.run)
+    t.start()
+    time.sleep(0.2)
+    Queue(store, wake_dir).enqueue({"id": "fast", "command": "true"})
+    deadline = time.time() + 5
+    while time.time() < deadline and store.get_job("fast")["state"] != "completed":
+        time.sleep(0.02)
+    stop.set()
+    notify_workers(wake_dir)
+    t.join(timeout=5)
+    assert store.get_job("fast")["state"] == "completed"
+    assert not t.is_alive()
+
+
+def test_worker_runs_jobs_concurrently_in_slots(tmp_path):
+    store = Storage(str(tmp_path / "slots.db"))
+    q = Queue(store)
+    for i in range(8):
+        q.enqueue({"id": f"c{i}", "command": "sleep 0.5"})
+    stop = threading.Event()
+    w = Worker(store, 1, stop, base_backoff=2, max_backoff=10, max_retries=1,
+               batch_size=4, concurrency=8)
+    t = threading.Thread(target=w.run)
+    started = time.time()
+    t.start()
+    deadline = started + 10
+    while time.time() < deadline and any(j["state"] != "completed" for j in q.list()):
+        time.sleep(0.05)
+    elapsed = time.time() - started
+    stop.set()
+    t.join(timeout=5)
+    assert all(j["state"] == "completed" for j in q.list())
+    assert len(store.get_job_logs("c0")) == 1
+    assert elapsed < 2.5  # eight 0.5 s jobs, not run back to back
+
+
+def test_claims_are_capped_at_free_slots(tmp_path):
+    store = Storage(str(tmp_path / "cap.db"))
+    q = Queue(store)
+    for i in range(6):
+        q.enqueue({"id": f"s{i}", "command": "sleep 0.3"})
+    stop = threading.Event()
+    w = Worker(store, 1, stop, base_backoff=2, max_backoff=10, max_retries=1,
+               batch_size=10, concurrency=2)
+    t = threading.Thread(target=w.run)
+    t.start()
+    most_leased = 0
+    deadline = time.time() + 10
+    while time.time() < deadline and store.count_by_state().get("completed", 0) < 6:
+        most_leased = max(most_leased, store.count_by_state().get("processing", 0))
+        time.sleep(0.01)
+    stop.set()
+    t.join(timeout=5)
+    assert store.count_by_state().get("completed") == 6
+    assert most_leased <= 2  # a batch of 10 would have leased all six at once
+
+
+def test_expired_lease_is_reclaimed_with_an_attempt(tmp_path):
+    store = Storage(str(tmp_path / "lease.db"))
+    q = Queue(store)
+    q.enqueue({"id": "orphan", "command": "true"}, max_retries=3)
+    q.enqueue({"id": "doomed", "command": "true"}, max_retries=1)
+    # A worker that claimed both and died: nothing renews these leases.
+    assert len(store.fetch_pending_batch(2, "dead-worker", lease_seconds=0.05)) == 2
+    assert store.reclaim_expired() == {"requeued": 0, "dead": 0}
+    time.sleep(0.1)
+    assert store.reclaim_expired() == {"requeued": 1, "dead": 1}
+    job = store.get_job("orphan")
+    assert job["state"] == "pending" and job["attempts"] == 1
+    assert job["worker_id"] is None and job["lease_expires_at"] is None
+    assert store.load_dlq()[0]["id"] == "doomed"
+
+
+def test_outcome_after_lost_lease_is_dropped(tmp_path):
+    store = Storage(str(tmp_path / "owner.db"))
+    q = Queue(store)
+    q.enqueue({"id": "j", "command": "true"}, max_retries=3)
+    q.enqueue({"id": "k", "command": "true"}, max_retries=3)
+    stale = store.fetch_pending_batch(2, "w1", lease_seconds=0.05)
+    time.sleep(0.1)
+    assert store.reclaim_expired()["requeued"] == 2
+    assert len(store.fetch_pending_batch(2, "w2")) == 2
+    # w1 wakes up late: neither its failure nor its completion may touch w2's jobs.
+    assert store.move_to_dlq(stale[0], "Exit code 1", owner="w1") is False
+    stale[1]["state"] = "completed"
+    assert store.record_outcomes([{"job": stale[1], "log": ("out", "", None), "owner": "w1"}]) == ["k"]
+    assert store.count_dlq() == 0 and store.get_job_logs("k") == []
+    assert {store.get_job(i)["worker_id"] for i in ("j", "k")} == {"w2"}
+
+    done = dict(store.get_job("j"), state="completed")
+    assert store.record_outcome(done, owner="w2") is True
+    assert store.get_job("j")["state"] == "completed"
+
+
+def test_heartbeat_keeps_running_job_leased(tmp_path):
+    store = Storage(str(tmp_path / "hb.db"))
+    Queue(store).enqueue({"id": "slow", "command": "sleep 1"})
+    stop = threading.Event()
+    w = Worker(store, 1, stop, base_backoff=2, max_backoff=10, max_retries=1,
+               lease_seconds=0.3, reap_interval=0.1)
+    t = threading.Thread(target=w.run)
+    t.start()
+    deadline = time.time() + 5
+    while time.time() < deadline and store.get_job("slow")["state"] != "completed":
+        # Another worker reaping meanwhile must not steal a job whose owner is alive.
+        store.reclaim_expired()
+        time.sleep(0.05)
+    stop.set()
+    t.join(timeout=5)
+    job = store.get_job("slow")
+    assert job["state"] == "completed" and job["attempts"] == 0
+    assert job["lease_expires_at"] is None
+
+
+def test_completion_writer_group_commits_outcomes(tmp_path):
+    from queuectl.core.completion import CompletionWriter
+    store = Storage(str(tmp_path / "g.db"))
+    q = Queue(store)
+    q.enqueue_many({"id": f"g{i:02d}", "command": "true"} for i in range(20))
+    jobs = store.fetch_pending_batch(20, "w1")
+    writer = CompletionWriter(store, window=0.2, max_batch=100)
+
+    def finish(job):
+        job["state"] = "completed"
+        writer.submit({"job": job, "log": ("out", "", None), "runtime_seconds": 0.01})
+
+    threads = [threading.Thread(target=finish, args=(job,)) for job in jobs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.close()
+    assert writer.outcomes == 20 and writer.commits < 20
+    assert store.count_by_state().get("completed") == 20
+    assert store.get_job_logs("g07")[0]["stdout"] == "out"
+    assert store.runtime_summary()["count"] == 20